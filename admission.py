@@ -0,0 +1,187 @@
+import asyncio
+import os
+import re
+import time
+from collections import deque
+from database import POOL_SETTINGS
+import metrics
+
+# Admission control in front of the database pool.
+#
+# Every DB-bound request belongs to a route class: cheap reads, writes, or heavy
+# aggregates and scans. A request runs only while both its class and the worker
+# as a whole are under their concurrency limits; the worker-wide limit defaults
+# to what the pool can hand out (pool_size + max_overflow), so requests wait here,
+# in order and with a deadline, instead of piling up on pool checkouts. Each class
+# has a bounded wait queue: a request that finds it full, or whose deadline
+# passes, gets an immediate 503 with Retry-After. Freed slots go to waiting reads
+# first, then writes, then heavy requests.
+#
+# Limits are per worker process. ADMISSION_CLASSES overrides them per class as
+# class=concurrency:queue:timeout_seconds, e.g. "read=12:48:0.5,heavy=1:4:5".
+
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "1") == "1"
+ADMISSION_MAX_CONCURRENCY = int(os.getenv("ADMISSION_MAX_CONCURRENCY", str(POOL_SETTINGS["pool_size"] + POOL_SETTINGS["max_overflow"])))
+ADMISSION_RETRY_AFTER_SECONDS = int(os.getenv("ADMISSION_RETRY_AFTER_SECONDS", "1"))
+
+# Route classes in priority order
+PRIORITY = ("read", "write", "heavy")
+
+# Requests that do not take a connection, or must never be shed
+EXEMPT = re.compile(r"^/(metrics|debug/|docs|redoc|openapi\.json|jobs)|^/$")
+
+# Aggregates, scans and bulk loads
+HEAVY = re.compile(r"^/(sports|athletes)/detailed$|/grouped_by_\w+$|^/results/(export|bulk)$|^/search$|^/analytics/")
+
+ADMISSION_QUEUE_DEPTH = metrics.Gauge("admission_queue_depth", "Requests waiting for admission")
+ADMISSION_IN_FLIGHT = metrics.Gauge("admission_in_flight", "Admitted requests currently running")
+ADMISSION_SHED = metrics.Counter("admission_shed_total", "Requests answered 503 by admission control, by reason")
+ADMISSION_WAIT = metrics.Histogram("admission_wait_seconds", "Time admitted requests waited in the queue")
+
+
+class ClassLimit:
+    """Concurrency limit, wait queue bound and queue deadline of one route class."""
+
+    def __init__(self, concurrency: int, queue: int, timeout: float):
+        self.concurrency = concurrency
+        self.queue = queue
+        self.timeout = timeout
+
+
+def default_limits(capacity: int = ADMISSION_MAX_CONCURRENCY):
+    return {
+        "read": ClassLimit(capacity, 4 * capacity, 1.0),
+        "write": ClassLimit(max(1, capacity // 2), 2 * capacity, 2.0),
+        "heavy": ClassLimit(max(1, capacity // 4), capacity, 5.0),
+    }
+
+# Apply an ADMISSION_CLASSES override string to the default limits
+def parse_limits(value: str, capacity: int = ADMISSION_MAX_CONCURRENCY):
+    limits = default_limits(capacity)
+    for part in filter(None, (part.strip() for part in value.split(","))):
+        name, _, spec = part.partition("=")
+        if name not in limits:
+            raise ValueError(f"Unknown route class: {name}")
+        concurrency, queue, timeout = spec.split(":")
+        limits[name] = ClassLimit(int(concurrency), int(queue), float(timeout))
+    return limits
+
+# Route class of a request, or None when it is not admission controlled
+def route_class(method: str, path: str):
+    if EXEMPT.match(path):
+        return None
+    if HEAVY.search(path):
+        return "heavy"
+    if method in ("GET", "HEAD"):
+        return "read"
+    return "write"
+
+
+class Rejected(Exception):
+    def __init__(self, reason: str):
+        self.reason = reason
+
+
+class AdmissionController:
+    """Per-class and worker-wide concurrency limits with priority wait queues.
+
+    Runs on the event loop and is only touched from it, so it needs no locks.
+    """
+
+    def __init__(self, capacity: int, limits: dict):
+        self.capacity = capacity
+        self.limits = limits
+        self.running = 0
+        self.active = {name: 0 for name in limits}
+        self.waiters = {name: deque() for name in limits}
+
+    def _can_run(self, name: str):
+        return self.running < self.capacity and self.active[name] < self.limits[name].concurrency
+
+    def _grant(self, name: str):
+        self.running += 1
+        self.active[name] += 1
+        ADMISSION_IN_FLIGHT.set(self.active[name], route_class=name)
+
+    def _dispatch(self):
+        for name in PRIORITY:
+            waiters = self.waiters[name]
+            while waiters and self._can_run(name):
+                future = waiters.popleft()
+                if not future.done():
+                    self._grant(name)
+                    future.set_result(None)
+            ADMISSION_QUEUE_DEPTH.set(len(waiters), route_class=name)
+
+    # Wait for a slot; returns the time spent waiting or raises Rejected
+    async def acquire(self, name: str):
+        if not self.waiters[name] and self._can_run(name):
+            self._grant(name)
+            return 0.0
+        limit = self.limits[name]
+        if len(self.waiters[name]) >= limit.queue:
+            raise Rejected("queue_full")
+        future = asyncio.get_running_loop().create_future()
+        self.waiters[name].append(future)
+        ADMISSION_QUEUE_DEPTH.set(len(self.waiters[name]), route_class=name)
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(future, limit.timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if future.done() and not future.cancelled():
+                # Granted just as the deadline passed or the client went away
+                self.release(name)
+            else:
+                try:
+                    self.waiters[name].remove(future)
+                except ValueError:
+                    pass
+                ADMISSION_QUEUE_DEPTH.set(len(self.waiters[name]), route_class=name)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            raise Rejected("deadline")
+        return time.perf_counter() - started
+
+    def release(self, name: str):
+        self.running -= 1
+        self.active[name] -= 1
+        ADMISSION_IN_FLIGHT.set(self.active[name], route_class=name)
+        self._dispatch()
+
+
+class AdmissionMiddleware:
+    """ASGI middleware that admits DB-bound HTTP requests through an AdmissionController."""
+
+    def __init__(self, app, capacity: int = ADMISSION_MAX_CONCURRENCY, limits: dict = None):
+        self.app = app
+        self.controller = AdmissionController(capacity, limits or parse_limits(os.getenv("ADMISSION_CLASSES", ""), capacity))
+
+    async def _reject(self, send, name: str, reason: str):
+        ADMISSION_SHED.inc(route_class=name, reason=reason)
+        body = b'{"detail":"Server is busy, retry later"}'
+        await send({
+            "type": "http.response.start",
+            "status": 503,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(ADMISSION_RETRY_AFTER_SECONDS).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    async def __call__(self, scope, receive, send):
+        name = route_class(scope["method"], scope["path"]) if scope["type"] == "http" and ADMISSION_ENABLED else None
+        if name is None:
+            await self.app(scope, receive, send)
+            return
+        try:
+            waited = await self.controller.acquire(name)
+        except Rejected as e:
+            await self._reject(send, name, e.reason)
+            return
+        ADMISSION_WAIT.observe(waited, route_class=name)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(name)
@@ -0,0 +1,105 @@
+"""Partition results by event_date year
+
+Revision ID: 0c5d1e7f3a92
+Revises: 366959619f4e
+Create Date: 2026-10-18 22:14:36.905127
+
+"""
+from datetime import date
+from typing import Sequence, Union
+
+from alembic import context, op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0c5d1e7f3a92'
+down_revision: Union[str, None] = '366959619f4e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+COLUMNS = 'id, competition_name, performance, event_date, location, sport_id, athlete_id, additional_info'
+
+# Yearly partitions are created up to this many years past the current one
+YEARS_AHEAD = 2
+
+
+def _results_table(name, **kw):
+    return op.create_table(name,
+    sa.Column('id', sa.Integer(), server_default=sa.text("nextval('results_id_seq')"), nullable=False),
+    sa.Column('competition_name', sa.String(), nullable=False),
+    sa.Column('performance', sa.Float(), nullable=False),
+    sa.Column('event_date', sa.Date(), nullable=False),
+    sa.Column('location', sa.String(), nullable=False),
+    sa.Column('sport_id', sa.Integer(), nullable=True),
+    sa.Column('athlete_id', sa.Integer(), nullable=True),
+    sa.Column('additional_info', postgresql.JSONB(), nullable=True),
+    sa.ForeignKeyConstraint(['athlete_id'], ['athletes.id'], ),
+    sa.ForeignKeyConstraint(['sport_id'], ['sports.id'], ),
+    **kw
+    )
+
+def _create_indexes():
+    op.create_index('ix_results_id', 'results', ['id'], unique=False)
+    op.create_index('ix_results_additional_info', 'results', ['additional_info'], unique=False,
+                    postgresql_using='gin', postgresql_ops={'additional_info': 'jsonb_path_ops'})
+    op.execute(
+        "CREATE INDEX ix_results_info_audience_size ON results "
+        "((CASE WHEN jsonb_typeof(additional_info -> 'audience_size') = 'number' "
+        "THEN (additional_info ->> 'audience_size')::numeric END))"
+    )
+    op.create_index('ix_results_competition_name_trgm', 'results', ['competition_name'], unique=False,
+                    postgresql_using='gin', postgresql_ops={'competition_name': 'gin_trgm_ops'})
+    op.create_index('ix_results_sport_performance', 'results', ['sport_id', 'performance'], unique=False)
+    op.create_index('ix_results_athlete_event_date', 'results', ['athlete_id', 'event_date'], unique=False)
+    op.create_index('ix_results_sport_event_date', 'results', ['sport_id', 'event_date'], unique=False)
+
+# Years to partition: every year with data through YEARS_AHEAD past the current one
+def _years():
+    this_year = date.today().year
+    first, last = this_year, this_year
+    if not context.is_offline_mode():
+        row = op.get_bind().execute(sa.text(
+            "SELECT min(extract(year FROM event_date))::int, max(extract(year FROM event_date))::int "
+            "FROM results_unpartitioned"
+        )).first()
+        if row[0] is not None:
+            first, last = min(first, row[0]), max(last, row[1])
+    return range(first, last + YEARS_AHEAD + 1)
+
+
+def upgrade() -> None:
+    # Declarative partitioning is PostgreSQL only; SQLite keeps the plain table
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.rename_table('results', 'results_unpartitioned')
+    op.execute('ALTER SEQUENCE results_id_seq OWNED BY NONE')
+    _results_table('results', postgresql_partition_by='RANGE (event_date)')
+    for year in _years():
+        op.execute(
+            f"CREATE TABLE results_y{year} PARTITION OF results "
+            f"FOR VALUES FROM ('{year}-01-01') TO ('{year + 1}-01-01')"
+        )
+    # Catches dates outside every yearly partition until partitions.py creates theirs
+    op.execute('CREATE TABLE results_default PARTITION OF results DEFAULT')
+    op.execute(f'INSERT INTO results ({COLUMNS}) SELECT {COLUMNS} FROM results_unpartitioned')
+    op.drop_table('results_unpartitioned')
+    op.execute('ALTER SEQUENCE results_id_seq OWNED BY results.id')
+    # The partition key must be part of the primary key; ids stay unique through the sequence
+    op.create_primary_key('results_pkey', 'results', ['id', 'event_date'])
+    _create_indexes()
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.rename_table('results', 'results_partitioned')
+    op.execute('ALTER SEQUENCE results_id_seq OWNED BY NONE')
+    _results_table('results')
+    op.execute(f'INSERT INTO results ({COLUMNS}) SELECT {COLUMNS} FROM results_partitioned')
+    # Dropping the parent drops every attached partition with it
+    op.drop_table('results_partitioned')
+    op.execute('ALTER SEQUENCE results_id_seq OWNED BY results.id')
+    op.create_primary_key('results_pkey', 'results', ['id'])
+    _create_indexes()
@@ -0,0 +1,49 @@
+"""Store event_date as DATE and add composite result indexes
+
+Revision ID: 145a4e166eef
+Revises: 736a6aa734b7
+Create Date: 2026-10-18 21:05:23.640871
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '145a4e166eef'
+down_revision: Union[str, None] = '736a6aa734b7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+COMPOSITE_INDEXES = [
+    ('ix_results_sport_performance', ['sport_id', 'performance']),
+    ('ix_results_athlete_event_date', ['athlete_id', 'event_date']),
+    ('ix_results_sport_event_date', ['sport_id', 'event_date']),
+]
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name == 'postgresql':
+        # The USING cast backfills every row while the table is rewritten
+        op.alter_column('results', 'event_date', type_=sa.Date(), existing_nullable=False,
+                        postgresql_using='event_date::date')
+    else:
+        # SQLite keeps dates as ISO text; normalise the stored strings, then retype the column
+        op.execute("UPDATE results SET event_date = date(event_date) WHERE date(event_date) IS NOT NULL")
+        with op.batch_alter_table('results') as batch_op:
+            batch_op.alter_column('event_date', type_=sa.Date(), existing_nullable=False)
+    for name, columns in COMPOSITE_INDEXES:
+        op.create_index(name, 'results', columns, unique=False)
+
+
+def downgrade() -> None:
+    for name, _ in reversed(COMPOSITE_INDEXES):
+        op.drop_index(name, table_name='results')
+    if op.get_bind().dialect.name == 'postgresql':
+        op.alter_column('results', 'event_date', type_=sa.String(), existing_nullable=False,
+                        postgresql_using='event_date::text')
+    else:
+        with op.batch_alter_table('results') as batch_op:
+            batch_op.alter_column('event_date', type_=sa.String(), existing_nullable=False)
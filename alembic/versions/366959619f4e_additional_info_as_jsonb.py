@@ -0,0 +1,48 @@
+"""Store additional_info as JSONB with a jsonb_path_ops GIN index
+
+Revision ID: 366959619f4e
+Revises: 145a4e166eef
+Create Date: 2026-10-18 21:42:09.318554
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '366959619f4e'
+down_revision: Union[str, None] = '145a4e166eef'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name == 'postgresql':
+        # json has no default GIN operator class, so the old index may never have been built
+        op.execute('DROP INDEX IF EXISTS ix_results_additional_info')
+        op.alter_column('results', 'additional_info', type_=postgresql.JSONB(), existing_nullable=True,
+                        postgresql_using='additional_info::jsonb')
+        op.create_index('ix_results_additional_info', 'results', ['additional_info'], unique=False,
+                        postgresql_using='gin', postgresql_ops={'additional_info': 'jsonb_path_ops'})
+        op.execute(
+            "CREATE INDEX ix_results_info_audience_size ON results "
+            "((CASE WHEN jsonb_typeof(additional_info -> 'audience_size') = 'number' "
+            "THEN (additional_info ->> 'audience_size')::numeric END))"
+        )
+    else:
+        op.execute(
+            "CREATE INDEX ix_results_info_audience_size ON results "
+            "(CASE WHEN json_type(additional_info, '$.audience_size') IN ('integer', 'real') "
+            "THEN json_extract(additional_info, '$.audience_size') END)"
+        )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_results_info_audience_size', table_name='results')
+    if op.get_bind().dialect.name == 'postgresql':
+        op.drop_index('ix_results_additional_info', table_name='results')
+        op.alter_column('results', 'additional_info', type_=sa.JSON(), existing_nullable=True,
+                        postgresql_using='additional_info::json')
@@ -0,0 +1,51 @@
+"""Add record history
+
+Revision ID: 5b81d3e0c4a7
+Revises: 0c5d1e7f3a92
+Create Date: 2026-10-19 09:12:47.530218
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b81d3e0c4a7'
+down_revision: Union[str, None] = '0c5d1e7f3a92'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+OLYMPIC_COMPETITION = sa.text("lower(competition_name) LIKE '%olympic%'")
+
+
+def upgrade() -> None:
+    op.create_table('record_history',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('sport_id', sa.Integer(), nullable=False),
+    sa.Column('record', sa.String(), nullable=False),
+    sa.Column('value', sa.Float(), nullable=True),
+    sa.Column('result_id', sa.Integer(), nullable=True),
+    sa.Column('source', sa.String(), nullable=False),
+    sa.Column('changed_at', sa.DateTime(), server_default=sa.func.now(), nullable=False),
+    sa.ForeignKeyConstraint(['sport_id'], ['sports.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_record_history_sport_record', 'record_history', ['sport_id', 'record', 'id'], unique=False)
+    op.create_index('ix_results_olympic_sport_performance', 'results', ['sport_id', 'performance'], unique=False,
+                    postgresql_where=OLYMPIC_COMPETITION, sqlite_where=OLYMPIC_COMPETITION)
+    # Start the history from the records already stored
+    for record in ('world_record', 'olympic_record'):
+        op.execute(f"""
+            INSERT INTO record_history (sport_id, record, value, source)
+            SELECT id, '{record}', {record}, 'baseline'
+            FROM sports
+            WHERE {record} IS NOT NULL
+        """)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_results_olympic_sport_performance', table_name='results')
+    op.drop_index('ix_record_history_sport_record', table_name='record_history')
+    op.drop_table('record_history')
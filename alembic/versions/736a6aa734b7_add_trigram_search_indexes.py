@@ -0,0 +1,44 @@
+"""Add trigram search indexes
+
+Revision ID: 736a6aa734b7
+Revises: fb972eb13fd9
+Create Date: 2026-10-18 20:31:47.502116
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '736a6aa734b7'
+down_revision: Union[str, None] = 'fb972eb13fd9'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TRGM_INDEXES = [
+    ('ix_sports_name_trgm', 'sports', 'name'),
+    ('ix_athletes_full_name_trgm', 'athletes', 'full_name'),
+    ('ix_results_competition_name_trgm', 'results', 'competition_name'),
+]
+
+
+def upgrade() -> None:
+    # SQLite has no pg_trgm; search.py creates its FTS5 tables there on first use
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    # Build concurrently so large tables stay writable while the indexes are created
+    with op.get_context().autocommit_block():
+        for name, table, column in TRGM_INDEXES:
+            op.create_index(name, table, [column], unique=False, postgresql_using='gin',
+                            postgresql_ops={column: 'gin_trgm_ops'}, postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    with op.get_context().autocommit_block():
+        for name, table, _ in reversed(TRGM_INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
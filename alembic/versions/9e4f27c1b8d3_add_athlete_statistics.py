@@ -0,0 +1,73 @@
+"""Add athlete statistics
+
+Revision ID: 9e4f27c1b8d3
+Revises: 5b81d3e0c4a7
+Create Date: 2026-10-19 11:03:18.244961
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9e4f27c1b8d3'
+down_revision: Union[str, None] = '5b81d3e0c4a7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('athlete_stats',
+    sa.Column('athlete_id', sa.Integer(), nullable=False),
+    sa.Column('result_count', sa.Integer(), nullable=False),
+    sa.Column('first_event_date', sa.Date(), nullable=False),
+    sa.Column('last_event_date', sa.Date(), nullable=False),
+    sa.ForeignKeyConstraint(['athlete_id'], ['athletes.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('athlete_id')
+    )
+    op.create_table('athlete_sport_stats',
+    sa.Column('athlete_id', sa.Integer(), nullable=False),
+    sa.Column('sport_id', sa.Integer(), nullable=False),
+    sa.Column('result_count', sa.Integer(), nullable=False),
+    sa.Column('performance_sum', sa.Float(), nullable=False),
+    sa.Column('best_performance', sa.Float(), nullable=False),
+    sa.Column('last_performance', sa.Float(), nullable=False),
+    sa.Column('first_event_date', sa.Date(), nullable=False),
+    sa.Column('last_event_date', sa.Date(), nullable=False),
+    sa.ForeignKeyConstraint(['athlete_id'], ['athletes.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['sport_id'], ['sports.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('athlete_id', 'sport_id')
+    )
+    # Backfill from existing results
+    op.execute("""
+        INSERT INTO athlete_sport_stats (athlete_id, sport_id, result_count, performance_sum, best_performance,
+                                         last_performance, first_event_date, last_event_date)
+        SELECT athlete_id, sport_id, result_count, performance_sum, best_performance,
+               performance, first_event_date, event_date
+        FROM (
+            SELECT r.athlete_id, r.sport_id, r.performance, r.event_date,
+                   COUNT(*) OVER w AS result_count,
+                   SUM(r.performance) OVER w AS performance_sum,
+                   CASE WHEN s.unit IN ('seconds', 'minutes', 'hours', 'milliseconds')
+                        THEN MIN(r.performance) OVER w ELSE MAX(r.performance) OVER w END AS best_performance,
+                   MIN(r.event_date) OVER w AS first_event_date,
+                   ROW_NUMBER() OVER (PARTITION BY r.athlete_id, r.sport_id ORDER BY r.event_date DESC, r.id DESC) AS position
+            FROM results r JOIN sports s ON s.id = r.sport_id
+            WHERE r.athlete_id IS NOT NULL
+            WINDOW w AS (PARTITION BY r.athlete_id, r.sport_id)
+        ) ranked
+        WHERE position = 1
+    """)
+    op.execute("""
+        INSERT INTO athlete_stats (athlete_id, result_count, first_event_date, last_event_date)
+        SELECT athlete_id, SUM(result_count), MIN(first_event_date), MAX(last_event_date)
+        FROM athlete_sport_stats
+        GROUP BY athlete_id
+    """)
+
+
+def downgrade() -> None:
+    op.drop_table('athlete_sport_stats')
+    op.drop_table('athlete_stats')
@@ -19,12 +19,10 @@ depends_on: Union[str, Sequence[str], None] = None
 
 
 def upgrade() -> None:
-    # ### commands auto generated by Alembic - please adjust! ###
-    op.create_index('ix_results_additional_info', 'results', ['additional_info'], unique=False, postgresql_using='gin')
-    # ### end Alembic commands ###
+    # A GIN index cannot be built on plain json (no default operator class), so this
+    # would abort a fresh upgrade; 366959619f4e builds it after converting to jsonb.
+    pass
 
 
 def downgrade() -> None:
-    # ### commands auto generated by Alembic - please adjust! ###
-    op.drop_index('ix_results_additional_info', table_name='results', postgresql_using='gin')
-    # ### end Alembic commands ###
+    pass
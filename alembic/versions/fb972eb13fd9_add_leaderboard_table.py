@@ -0,0 +1,47 @@
+"""Add leaderboard table
+
+Revision ID: fb972eb13fd9
+Revises: aede1295f0b4
+Create Date: 2026-10-18 19:40:12.118412
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'fb972eb13fd9'
+down_revision: Union[str, None] = 'aede1295f0b4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('leaderboard',
+    sa.Column('sport_id', sa.Integer(), nullable=False),
+    sa.Column('athlete_id', sa.Integer(), nullable=False),
+    sa.Column('best_performance', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['athlete_id'], ['athletes.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['sport_id'], ['sports.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('sport_id', 'athlete_id')
+    )
+    op.create_index('ix_leaderboard_sport_best', 'leaderboard', ['sport_id', 'best_performance'], unique=False)
+    op.create_index('ix_leaderboard_athlete_id', 'leaderboard', ['athlete_id'], unique=False)
+    # Backfill from existing results
+    op.execute("""
+        INSERT INTO leaderboard (sport_id, athlete_id, best_performance)
+        SELECT r.sport_id, r.athlete_id,
+               CASE WHEN s.unit IN ('seconds', 'minutes', 'hours', 'milliseconds')
+                    THEN MIN(r.performance) ELSE MAX(r.performance) END
+        FROM results r JOIN sports s ON s.id = r.sport_id
+        WHERE r.athlete_id IS NOT NULL
+        GROUP BY r.sport_id, r.athlete_id, s.unit
+    """)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_leaderboard_athlete_id', table_name='leaderboard')
+    op.drop_index('ix_leaderboard_sport_best', table_name='leaderboard')
+    op.drop_table('leaderboard')
@@ -0,0 +1,452 @@
+import fcntl
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Literal
+import numpy as np
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from models import Sport, Athlete, Result
+from starlette.concurrency import run_in_threadpool
+from database import read_db, run_in_session, BackgroundSession
+from leaderboard import LOWER_IS_BETTER_UNITS
+import argparse
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Percentiles, rolling averages, year-over-year progression and z-scores over a
+# columnar snapshot of results.
+#
+# The snapshot is one flat binary file per column under ANALYTICS_SNAPSHOT_DIR,
+# memory-mapped read-only by every worker so they share the OS page cache.
+# meta.json records how many rows are valid and the highest results.id loaded.
+# A refresh appends the rows past that high-water mark in batches and swaps in a
+# new meta.json after each one; readers only map the rows it counts, so they
+# never see a partial append, and a refresh that fails partway resumes from the
+# last batch it recorded. Refreshes run out of band, on a background thread with
+# a session from the background pool: each worker starts one at startup (serve.py)
+# and whenever a request finds the snapshot older than ANALYTICS_REFRESH_SECONDS,
+# and only one process at a time builds, under a file lock. Requests are served
+# from the snapshot as it is meanwhile; before the first build completes they get
+# 503 with Retry-After.
+#
+# Only new ids are picked up: edited or deleted results, and ids committed
+# behind the high-water mark, stay as loaded until a rebuild, which writes a
+# fresh generation directory and switches meta.json to it:
+#
+#     python analytics.py refresh|rebuild
+#
+# Every response carries the snapshot's staleness. A request works on one
+# SnapshotView throughout, so a concurrent reload cannot swap its columns midway.
+
+SNAPSHOT_DIR = os.getenv("ANALYTICS_SNAPSHOT_DIR", os.path.join(tempfile.gettempdir(), "sports_analytics"))
+REFRESH_SECONDS = float(os.getenv("ANALYTICS_REFRESH_SECONDS", "30"))
+# Rows fetched per query while refreshing
+FETCH_SIZE = 100_000
+# Retry-After for requests that arrive before the first snapshot is built
+BUILDING_RETRY_AFTER_SECONDS = 5
+
+# Stored columns and their dtypes; event_date is days since 1970-01-01, missing ids are -1
+COLUMNS = {
+    "id": np.int64,
+    "sport_id": np.int32,
+    "athlete_id": np.int32,
+    "performance": np.float64,
+    "event_date": np.int32,
+}
+
+SCOPES = {"sports": "sport_id", "athletes": "athlete_id"}
+
+
+def _column_arrays(rows):
+    arrays = {
+        "id": np.fromiter((row.id for row in rows), np.int64, len(rows)),
+        "sport_id": np.fromiter((-1 if row.sport_id is None else row.sport_id for row in rows), np.int32, len(rows)),
+        "athlete_id": np.fromiter((-1 if row.athlete_id is None else row.athlete_id for row in rows), np.int32, len(rows)),
+        "performance": np.fromiter((row.performance for row in rows), np.float64, len(rows)),
+    }
+    arrays["event_date"] = np.array([row.event_date for row in rows], dtype="datetime64[D]").astype(np.int32)
+    return arrays
+
+
+class SnapshotView:
+    """One mapping of the snapshot: its meta.json and the column rows it counts."""
+
+    def __init__(self, meta, columns):
+        self.meta = meta
+        self.columns = columns
+        self._moments = None
+
+    def staleness(self):
+        meta = self.meta or {"rows": 0, "high_water_id": 0, "refreshed_at": None}
+        refreshed_at = meta["refreshed_at"]
+        return {
+            "rows": meta["rows"],
+            "high_water_id": meta["high_water_id"],
+            "refreshed_at": None if refreshed_at is None else datetime.fromtimestamp(refreshed_at, timezone.utc).isoformat(),
+            "age_seconds": None if refreshed_at is None else round(time.time() - refreshed_at, 3),
+        }
+
+    # Count, mean and standard deviation of performance per sport, indexed by sport_id
+    def sport_moments(self):
+        if self._moments is None:
+            sport_ids, performance = self.columns["sport_id"], self.columns["performance"]
+            known = sport_ids >= 0
+            sport_ids, performance = sport_ids[known], performance[known]
+            count = np.bincount(sport_ids)
+            total = np.bincount(sport_ids, weights=performance)
+            squares = np.bincount(sport_ids, weights=performance * performance)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                mean = total / count
+                std = np.sqrt(np.maximum(squares / count - mean * mean, 0.0))
+            self._moments = (count, mean, std)
+        return self._moments
+
+
+class Snapshot:
+    """The snapshot directory, and the view of it this process last mapped."""
+
+    def __init__(self, directory: str = SNAPSHOT_DIR):
+        self.directory = directory
+        self.view = SnapshotView(None, {name: np.empty(0, dtype) for name, dtype in COLUMNS.items()})
+
+    def _meta_path(self):
+        return os.path.join(self.directory, "meta.json")
+
+    def _read_meta(self):
+        try:
+            with open(self._meta_path()) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _write_meta(self, meta):
+        path = self._meta_path()
+        with open(path + ".tmp", "w") as f:
+            json.dump(meta, f)
+        os.replace(path + ".tmp", path)
+
+    # Map the rows counted by meta.json, remapping only when it changed; returns the current view
+    def load(self):
+        view = self.view
+        meta = self._read_meta()
+        if meta == view.meta:
+            return view
+        columns = {}
+        for name, dtype in COLUMNS.items():
+            if meta is None or meta["rows"] == 0:
+                columns[name] = np.empty(0, dtype)
+            else:
+                path = os.path.join(self.directory, meta["generation"], name)
+                columns[name] = np.memmap(path, dtype=dtype, mode="r", shape=(meta["rows"],))
+        self.view = SnapshotView(meta, columns)
+        return self.view
+
+    def _lock(self):
+        os.makedirs(self.directory, exist_ok=True)
+        return open(os.path.join(self.directory, "lock"), "w")
+
+    # Append rows past the high-water mark to the column files. Bytes past meta["rows"],
+    # left by an append that failed partway, are cut off first. With publish, meta.json
+    # is rewritten after every batch, so the files never run ahead of it for long.
+    def _append(self, conn, meta, publish: bool = True):
+        generation = os.path.join(self.directory, meta["generation"])
+        for name, dtype in COLUMNS.items():
+            os.truncate(os.path.join(generation, name), meta["rows"] * np.dtype(dtype).itemsize)
+        while True:
+            query = (
+                select(Result.id, Result.sport_id, Result.athlete_id, Result.performance, Result.event_date)
+                .where(Result.id > meta["high_water_id"])
+                .order_by(Result.id)
+                .limit(FETCH_SIZE)
+            )
+            rows = conn.execute(query).all()
+            if not rows:
+                break
+            for name, values in _column_arrays(rows).items():
+                with open(os.path.join(generation, name), "ab") as f:
+                    f.write(values.tobytes())
+            meta["rows"] += len(rows)
+            meta["high_water_id"] = rows[-1].id
+            if publish:
+                self._write_meta(meta)
+            if len(rows) < FETCH_SIZE:
+                break
+        meta["refreshed_at"] = time.time()
+        self._write_meta(meta)
+
+    # Append results past the high-water mark; returns False if another worker holds the lock
+    def refresh(self, conn, wait: bool = False):
+        with self._lock() as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | (0 if wait else fcntl.LOCK_NB))
+            except BlockingIOError:
+                return False
+            meta = self._read_meta()
+            if meta is None:
+                self._rebuild(conn)
+            else:
+                self._append(conn, meta)
+        self.load()
+        return True
+
+    # Reload every result into a new generation directory and switch to it
+    def rebuild(self, conn):
+        with self._lock() as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            self._rebuild(conn)
+        self.load()
+
+    def _rebuild(self, conn):
+        old = self._read_meta()
+        generation = f"g{time.time_ns()}"
+        os.makedirs(os.path.join(self.directory, generation))
+        for name in COLUMNS:
+            open(os.path.join(self.directory, generation, name), "wb").close()
+        # Published once complete, so readers stay on the old generation meanwhile
+        self._append(conn, {"generation": generation, "rows": 0, "high_water_id": 0, "refreshed_at": None}, publish=False)
+        # The previous generation stays until the next rebuild, for workers that read the
+        # old meta.json but have not mapped its columns yet; older ones go now. Workers
+        # still mapping removed files keep them alive until they remap.
+        keep = {generation} | ({old["generation"]} if old is not None else set())
+        for name in os.listdir(self.directory):
+            if name[:1] == "g" and name[1:].isdigit() and name not in keep:
+                shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+
+
+snapshot = Snapshot()
+_refresher = None
+_refresher_lock = threading.Lock()
+
+def _refresh():
+    session = BackgroundSession()
+    try:
+        snapshot.refresh(session.connection())
+    except Exception:
+        logger.exception("Analytics snapshot refresh failed")
+    finally:
+        session.close()
+
+# Start a refresh on a background thread unless this process already has one running
+def refresh_in_background():
+    global _refresher
+    with _refresher_lock:
+        if _refresher is not None and _refresher.is_alive():
+            return
+        _refresher = threading.Thread(target=_refresh, name="analytics-refresh", daemon=True)
+        _refresher.start()
+
+# The current snapshot view, starting a background refresh when it is older than
+# REFRESH_SECONDS; 503 until the first snapshot has been built
+def current():
+    view = snapshot.load()
+    age = view.staleness()["age_seconds"]
+    if age is None or age > REFRESH_SECONDS:
+        refresh_in_background()
+    if view.meta is None:
+        raise HTTPException(
+            status_code=503,
+            detail="Analytics snapshot is being built",
+            headers={"Retry-After": str(BUILDING_RETRY_AFTER_SECONDS)},
+        )
+    return view
+
+
+# Indices of the snapshot rows in one sport or of one athlete
+def _rows(columns, scope: str, key: int):
+    return np.flatnonzero(columns[SCOPES[scope]] == key)
+
+# Sort rows by group key (then by the extra keys) and return the order and group start offsets
+def _grouped(keys, *then):
+    order = np.lexsort(tuple(reversed(then)) + (keys,)) if then else np.argsort(keys, kind="stable")
+    sorted_keys = keys[order]
+    starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+    return order, starts
+
+# Results of one scope as per-sport groups: sport ids, and the rows of each group
+def _by_sport(columns, rows):
+    sport_ids = columns["sport_id"][rows]
+    order, starts = _grouped(sport_ids, columns["event_date"][rows], columns["id"][rows])
+    ordered = rows[order]
+    bounds = np.r_[starts, len(ordered)]
+    return [(int(sport_ids[order[start]]), ordered[start:end]) for start, end in zip(bounds[:-1], bounds[1:])]
+
+def _units(db: Session):
+    return dict(db.execute(select(Sport.id, Sport.unit)).all())
+
+def _year(days):
+    return days.astype("datetime64[D]").astype("datetime64[Y]").astype(np.int64) + 1970
+
+def _dates(days):
+    return np.datetime_as_string(days.astype("datetime64[D]")).tolist()
+
+
+# Percentiles of performance per sport
+def percentiles(columns, rows, q):
+    return [
+        {"sport_id": sport_id, "count": len(group), "percentiles": dict(zip((f"{value:g}" for value in q), np.percentile(columns["performance"][group], q).tolist()))}
+        for sport_id, group in _by_sport(columns, rows)
+    ]
+
+# Trailing mean of the last `window` results per sport, by event date; the first
+# results of a sport average over what is available
+def rolling(columns, rows, window: int, limit: int):
+    groups = []
+    for sport_id, group in _by_sport(columns, rows):
+        values = columns["performance"][group]
+        sums = np.r_[0.0, np.cumsum(values)]
+        end = np.arange(1, len(values) + 1)
+        start = np.maximum(end - window, 0)
+        means = (sums[end] - sums[start]) / (end - start)
+        tail = slice(max(len(values) - limit, 0), None)
+        groups.append({
+            "sport_id": sport_id,
+            "count": len(group),
+            "points": [
+                {"event_date": d, "performance": p, "rolling_mean": m}
+                for d, p, m in zip(_dates(columns["event_date"][group][tail]), values[tail].tolist(), means[tail].tolist())
+            ],
+        })
+    return groups
+
+# Count, mean and best per sport and year, with the change of each from the previous year
+def progression(columns, rows, units):
+    groups = []
+    for sport_id, group in _by_sport(columns, rows):
+        years = _year(columns["event_date"][group])
+        values = columns["performance"][group]
+        # Rows are date ordered within the sport, so each year is a contiguous run
+        starts = np.flatnonzero(np.r_[True, years[1:] != years[:-1]])
+        counts = np.diff(np.r_[starts, len(values)])
+        means = np.add.reduceat(values, starts) / counts
+        best = (np.minimum if units.get(sport_id) in LOWER_IS_BETTER_UNITS else np.maximum).reduceat(values, starts)
+        mean_change = np.r_[np.nan, np.diff(means)]
+        best_change = np.r_[np.nan, np.diff(best)]
+        groups.append({
+            "sport_id": sport_id,
+            "years": [
+                {"year": y, "count": c, "mean": m, "best": b, "mean_change": None if np.isnan(mc) else mc, "best_change": None if np.isnan(bc) else bc}
+                for y, c, m, b, mc, bc in zip(years[starts].tolist(), counts.tolist(), means.tolist(), best.tolist(), mean_change.tolist(), best_change.tolist())
+            ],
+        })
+    return groups
+
+# Standard scores of results against their sport, signed so that positive is better
+def _zscores(snap, rows, units):
+    count, mean, std = snap.sport_moments()
+    sport_ids = snap.columns["sport_id"][rows]
+    sign = np.array([-1.0 if units.get(sport_id) in LOWER_IS_BETTER_UNITS else 1.0 for sport_id in range(len(count))])
+    spread = std[sport_ids]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        z = np.where(spread > 0, (snap.columns["performance"][rows] - mean[sport_ids]) / spread, 0.0)
+    return z * sign[sport_ids]
+
+# Athletes of a sport ranked by their mean z-score
+def sport_zscores(snap, rows, units, limit: int):
+    rows = rows[snap.columns["athlete_id"][rows] >= 0]
+    z = _zscores(snap, rows, units)
+    athletes, inverse, counts = np.unique(snap.columns["athlete_id"][rows], return_inverse=True, return_counts=True)
+    means = np.bincount(inverse, weights=z) / counts
+    best = np.full(len(athletes), -np.inf)
+    np.maximum.at(best, inverse, z)
+    top = np.argsort(-means, kind="stable")[:limit]
+    return [
+        {"athlete_id": a, "count": c, "mean_z": m, "best_z": b}
+        for a, c, m, b in zip(athletes[top].tolist(), counts[top].tolist(), means[top].tolist(), best[top].tolist())
+    ]
+
+# An athlete's z-scores per sport: mean, best and latest
+def athlete_zscores(snap, rows, units):
+    groups = []
+    for sport_id, group in _by_sport(snap.columns, rows):
+        z = _zscores(snap, group, units)
+        groups.append({"sport_id": sport_id, "count": len(group), "mean_z": float(z.mean()), "best_z": float(z.max()), "latest_z": float(z[-1])})
+    return groups
+
+
+# The routes run on either request stack (database.read_db); the numpy work runs on
+# the threadpool, off the event loop
+router = APIRouter(prefix="/analytics", tags=["Analytics"])
+
+def _check_scope(db: Session, scope: str, key: int):
+    model = Sport if scope == "sports" else Athlete
+    if db.get(model, key) is None:
+        raise HTTPException(status_code=404, detail=f"{model.__name__} not found")
+
+# The snapshot view for a request on an existing sport or athlete
+async def _scope_snapshot(db: Session, scope: str, key: int):
+    await run_in_session(db, _check_scope, scope, key)
+    return current()
+
+# Rows of the sport or athlete with a known sport
+def _scope_rows(snap, scope: str, key: int):
+    rows = _rows(snap.columns, scope, key)
+    return rows[snap.columns["sport_id"][rows] >= 0]
+
+def _parse_percentiles(q: str):
+    try:
+        values = [float(part) for part in q.split(",") if part.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid percentiles: {q}")
+    if not values or any(value < 0 or value > 100 for value in values):
+        raise HTTPException(status_code=400, detail="Percentiles must be between 0 and 100")
+    return values
+
+# Performance percentiles of a sport, or of an athlete per sport
+@router.get("/{scope}/{key}/percentiles", response_model=dict)
+async def read_percentiles(scope: Literal["sports", "athletes"], key: int, q: str = "10,25,50,75,90", db: Session = Depends(read_db)):
+    values = _parse_percentiles(q)
+    snap = await _scope_snapshot(db, scope, key)
+    groups = await run_in_threadpool(lambda: percentiles(snap.columns, _scope_rows(snap, scope, key), values))
+    return {"snapshot": snap.staleness(), "groups": groups}
+
+# Rolling mean of performance over the last `window` results, per sport
+@router.get("/{scope}/{key}/rolling", response_model=dict)
+async def read_rolling(scope: Literal["sports", "athletes"], key: int, window: int = Query(10, ge=1, le=10_000), limit: int = Query(100, ge=1, le=10_000), db: Session = Depends(read_db)):
+    snap = await _scope_snapshot(db, scope, key)
+    groups = await run_in_threadpool(lambda: rolling(snap.columns, _scope_rows(snap, scope, key), window, limit))
+    return {"snapshot": snap.staleness(), "groups": groups}
+
+# Year-over-year progression of mean and best performance, per sport
+@router.get("/{scope}/{key}/progression", response_model=dict)
+async def read_progression(scope: Literal["sports", "athletes"], key: int, db: Session = Depends(read_db)):
+    snap = await _scope_snapshot(db, scope, key)
+    units = await run_in_session(db, _units)
+    groups = await run_in_threadpool(lambda: progression(snap.columns, _scope_rows(snap, scope, key), units))
+    return {"snapshot": snap.staleness(), "groups": groups}
+
+# Z-scores against each sport: the top athletes of a sport, or an athlete per sport
+@router.get("/{scope}/{key}/zscores", response_model=dict)
+async def read_zscores(scope: Literal["sports", "athletes"], key: int, limit: int = Query(20, ge=1, le=1000), db: Session = Depends(read_db)):
+    snap = await _scope_snapshot(db, scope, key)
+    units = await run_in_session(db, _units)
+    if scope == "sports":
+        athletes = await run_in_threadpool(lambda: sport_zscores(snap, _scope_rows(snap, scope, key), units, limit))
+        return {"snapshot": snap.staleness(), "athletes": athletes}
+    groups = await run_in_threadpool(lambda: athlete_zscores(snap, _scope_rows(snap, scope, key), units))
+    return {"snapshot": snap.staleness(), "groups": groups}
+
+
+if __name__ == "__main__":
+    from database import SessionLocal
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Analytics snapshot maintenance.")
+    parser.add_argument("command", choices=["refresh", "rebuild"])
+    args = parser.parse_args()
+
+    session = SessionLocal()
+    try:
+        if args.command == "rebuild":
+            snapshot.rebuild(session.connection())
+        else:
+            snapshot.refresh(session.connection(), wait=True)
+        logger.info("Analytics snapshot %s: %s", args.command, snapshot.load().staleness())
+    finally:
+        session.close()
@@ -0,0 +1,274 @@
+from sqlalchemy import event, inspect, select, delete, func, case, true
+from sqlalchemy.orm import Session
+from models import Sport, Athlete, Result, AthleteStats, AthleteSportStats
+from leaderboard import LOWER_IS_BETTER_UNITS, lower_is_better, dialect_insert, best_of
+import argparse
+import cache
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Result statistics per athlete (athlete_stats) and per athlete and sport
+# (athlete_sport_stats), read as stored rows instead of aggregating results.
+#
+# New results are folded in as deltas: one upsert per table that adds the counts
+# and sums and keeps the better best, earlier first and later last values. Minima,
+# maxima and the latest result cannot be taken back by a delta, so an updated or
+# deleted result recomputes its athlete from their results (an index range). A
+# full rebuild repairs any drift:
+#
+#     python athlete_stats.py rebuild [--athlete-id N]
+
+athlete_stats = AthleteStats.__table__
+sport_stats = AthleteSportStats.__table__
+
+
+def _units(conn, sport_ids):
+    return dict(conn.execute(select(Sport.id, Sport.unit).where(Sport.id.in_(sport_ids))).all())
+
+# Fold new results, as (athlete_id, sport_id, performance, event_date), into the statistics
+def apply_results(conn, rows):
+    rows = [row for row in rows if row[0] is not None and row[1] is not None]
+    if not rows:
+        return
+    units = _units(conn, {sport_id for _, sport_id, _, _ in rows})
+    pairs = {True: {}, False: {}}
+    athletes = {}
+    for athlete_id, sport_id, performance, event_date in rows:
+        if sport_id not in units:
+            continue
+        lower = lower_is_better(units[sport_id])
+        current = pairs[lower].get((athlete_id, sport_id))
+        if current is None:
+            pairs[lower][(athlete_id, sport_id)] = {
+                "athlete_id": athlete_id,
+                "sport_id": sport_id,
+                "result_count": 1,
+                "performance_sum": performance,
+                "best_performance": performance,
+                "last_performance": performance,
+                "first_event_date": event_date,
+                "last_event_date": event_date,
+            }
+        else:
+            current["result_count"] += 1
+            current["performance_sum"] += performance
+            current["best_performance"] = (min if lower else max)(current["best_performance"], performance)
+            current["first_event_date"] = min(current["first_event_date"], event_date)
+            # Rows arrive in insert order, so a later row wins a tie on the date
+            if event_date >= current["last_event_date"]:
+                current["last_performance"] = performance
+                current["last_event_date"] = event_date
+        totals = athletes.setdefault(athlete_id, {"athlete_id": athlete_id, "result_count": 0, "first_event_date": event_date, "last_event_date": event_date})
+        totals["result_count"] += 1
+        totals["first_event_date"] = min(totals["first_event_date"], event_date)
+        totals["last_event_date"] = max(totals["last_event_date"], event_date)
+    if not athletes:
+        return
+
+    insert = dialect_insert(conn)
+    earliest, latest = best_of(conn, True), best_of(conn, False)
+    for lower, values in pairs.items():
+        if not values:
+            continue
+        stmt = insert(sport_stats)
+        new = stmt.excluded
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[sport_stats.c.athlete_id, sport_stats.c.sport_id],
+            set_={
+                "result_count": sport_stats.c.result_count + new.result_count,
+                "performance_sum": sport_stats.c.performance_sum + new.performance_sum,
+                "best_performance": best_of(conn, lower)(sport_stats.c.best_performance, new.best_performance),
+                "last_performance": case((new.last_event_date >= sport_stats.c.last_event_date, new.last_performance), else_=sport_stats.c.last_performance),
+                "first_event_date": earliest(sport_stats.c.first_event_date, new.first_event_date),
+                "last_event_date": latest(sport_stats.c.last_event_date, new.last_event_date),
+            },
+        )
+        conn.execute(stmt, list(values.values()))
+
+    stmt = insert(athlete_stats)
+    new = stmt.excluded
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[athlete_stats.c.athlete_id],
+        set_={
+            "result_count": athlete_stats.c.result_count + new.result_count,
+            "first_event_date": earliest(athlete_stats.c.first_event_date, new.first_event_date),
+            "last_event_date": latest(athlete_stats.c.last_event_date, new.last_event_date),
+        },
+    )
+    conn.execute(stmt, list(athletes.values()))
+
+def _upsert_from(conn, table, keys, columns, query):
+    stmt = dialect_insert(conn)(table).from_select(columns, query)
+    conn.execute(stmt.on_conflict_do_update(
+        index_elements=[table.c[key] for key in keys],
+        set_={name: stmt.excluded[name] for name in columns if name not in keys},
+    ))
+
+# Rebuild the statistics of every athlete, or of some, from results in set-based statements.
+# Rows are upserted with the recomputed values and rows left without results deleted
+# afterwards, so a concurrent apply_results for the same athletes never hits a duplicate
+# key; their existing rows are locked first, so such an upsert has committed before the
+# results are read.
+def rebuild(conn, athlete_ids=None):
+    scope = None if athlete_ids is None else list(athlete_ids)
+    if scope is not None:
+        conn.execute(select(athlete_stats.c.athlete_id).where(athlete_stats.c.athlete_id.in_(scope)).with_for_update())
+
+    # One pass over the results: window aggregates per (athlete, sport), keeping the latest row
+    pair = (Result.athlete_id, Result.sport_id)
+    best = case(
+        (Sport.unit.in_(LOWER_IS_BETTER_UNITS), func.min(Result.performance).over(partition_by=pair)),
+        else_=func.max(Result.performance).over(partition_by=pair),
+    )
+    ranked = (
+        select(
+            Result.athlete_id,
+            Result.sport_id,
+            func.count().over(partition_by=pair).label("result_count"),
+            func.sum(Result.performance).over(partition_by=pair).label("performance_sum"),
+            best.label("best_performance"),
+            Result.performance.label("last_performance"),
+            func.min(Result.event_date).over(partition_by=pair).label("first_event_date"),
+            Result.event_date.label("last_event_date"),
+            func.row_number().over(partition_by=pair, order_by=(Result.event_date.desc(), Result.id.desc())).label("position"),
+        )
+        .join(Sport, Sport.id == Result.sport_id)
+        .where(Result.athlete_id.isnot(None))
+    )
+    if scope is not None:
+        ranked = ranked.where(Result.athlete_id.in_(scope))
+    ranked = ranked.subquery()
+    columns = [column.name for column in sport_stats.columns]
+    latest = select(*[ranked.c[name] for name in columns]).where(ranked.c.position == 1)
+    _upsert_from(conn, sport_stats, ["athlete_id", "sport_id"], columns, latest)
+
+    has_results = (
+        select(Result.id)
+        .join(Sport, Sport.id == Result.sport_id)
+        .where(Result.athlete_id == sport_stats.c.athlete_id, Result.sport_id == sport_stats.c.sport_id)
+        .exists()
+    )
+    clear_sports = delete(sport_stats).where(~has_results)
+    if scope is not None:
+        clear_sports = clear_sports.where(sport_stats.c.athlete_id.in_(scope))
+    conn.execute(clear_sports)
+
+    totals = select(
+        sport_stats.c.athlete_id,
+        func.sum(sport_stats.c.result_count),
+        func.min(sport_stats.c.first_event_date),
+        func.max(sport_stats.c.last_event_date),
+    ).group_by(sport_stats.c.athlete_id)
+    # A WHERE also keeps SQLite from reading ON CONFLICT as a join constraint
+    totals = totals.where(sport_stats.c.athlete_id.in_(scope) if scope is not None else true())
+    _upsert_from(conn, athlete_stats, ["athlete_id"], ["athlete_id", "result_count", "first_event_date", "last_event_date"], totals)
+
+    has_sports = select(sport_stats.c.athlete_id).where(sport_stats.c.athlete_id == athlete_stats.c.athlete_id).exists()
+    clear_athletes = delete(athlete_stats).where(~has_sports)
+    if scope is not None:
+        clear_athletes = clear_athletes.where(athlete_stats.c.athlete_id.in_(scope))
+    conn.execute(clear_athletes)
+
+
+def _changed_athletes(obj):
+    state = inspect(obj)
+    if not any(state.attrs[name].history.has_changes() for name in ("athlete_id", "sport_id", "performance", "event_date")):
+        return set()
+    return set(state.attrs.athlete_id.history.deleted or ()) | {obj.athlete_id}
+
+# Keep the statistics in step with ORM writes to results and sports, in the same transaction
+@event.listens_for(Session, "after_flush")
+def _after_flush(session, flush_context):
+    created = []
+    stale_athletes = set()
+    stale_sports = set()
+    for obj in session.new:
+        if isinstance(obj, Result):
+            created.append((obj.athlete_id, obj.sport_id, obj.performance, obj.event_date))
+    for obj in session.dirty:
+        if isinstance(obj, Result) and session.is_modified(obj):
+            stale_athletes |= _changed_athletes(obj)
+        elif isinstance(obj, Sport) and inspect(obj).attrs.unit.history.has_changes():
+            stale_sports.add(obj.id)
+    for obj in session.deleted:
+        if isinstance(obj, Result):
+            stale_athletes.add(obj.athlete_id)
+    if not (created or stale_athletes or stale_sports):
+        return
+
+    conn = session.connection()
+    if stale_sports:
+        # The direction of "best" flipped for everyone with results in these sports
+        stale_athletes |= set(conn.execute(select(sport_stats.c.athlete_id).where(sport_stats.c.sport_id.in_(stale_sports))).scalars())
+    stale_athletes.discard(None)
+    apply_results(conn, [row for row in created if row[0] not in stale_athletes])
+    if stale_athletes:
+        rebuild(conn, stale_athletes)
+
+
+# Result count and first/last event dates per athlete, for athletes with results
+def athletes_with_results(skip: int = 0, limit: int = 100):
+    return (
+        select(
+            Athlete.id,
+            Athlete.full_name,
+            Athlete.country,
+            AthleteStats.result_count,
+            AthleteStats.first_event_date,
+            AthleteStats.last_event_date,
+        )
+        .join(AthleteStats, AthleteStats.athlete_id == Athlete.id)
+        .order_by(Athlete.id)
+        .offset(skip)
+        .limit(limit)
+    )
+
+# One athlete's statistics, overall and per sport
+def athlete_summary(db: Session, athlete_id: int):
+    if db.get(Athlete, athlete_id) is None:
+        return None
+    totals = db.get(AthleteStats, athlete_id)
+    query = (
+        select(
+            AthleteSportStats.sport_id,
+            Sport.name.label("sport_name"),
+            Sport.unit,
+            AthleteSportStats.result_count,
+            AthleteSportStats.best_performance,
+            (AthleteSportStats.performance_sum / AthleteSportStats.result_count).label("mean_performance"),
+            AthleteSportStats.last_performance,
+            AthleteSportStats.first_event_date,
+            AthleteSportStats.last_event_date,
+        )
+        .join(Sport, Sport.id == AthleteSportStats.sport_id)
+        .where(AthleteSportStats.athlete_id == athlete_id)
+        .order_by(AthleteSportStats.sport_id)
+    )
+    return {
+        "athlete_id": athlete_id,
+        "result_count": totals.result_count if totals else 0,
+        "first_event_date": totals.first_event_date if totals else None,
+        "last_event_date": totals.last_event_date if totals else None,
+        "sports": [dict(row._mapping) for row in db.execute(query)],
+    }
+
+
+if __name__ == "__main__":
+    from database import SessionLocal
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Athlete statistics maintenance.")
+    parser.add_argument("command", choices=["rebuild"])
+    parser.add_argument("--athlete-id", type=int, default=None, help="only rebuild this athlete")
+    args = parser.parse_args()
+
+    session = SessionLocal()
+    try:
+        rebuild(session.connection(), None if args.athlete_id is None else [args.athlete_id])
+        # Outside the ORM, so the cached statistics and ETags need telling
+        cache.mark_changed(session, athlete_stats.name)
+        session.commit()
+        logger.info("Athlete statistics rebuilt")
+    finally:
+        session.close()
@@ -1,81 +1,147 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from sqlalchemy.orm import Session
-import crud, schemas
-from database import get_db
+import crud, schemas, pagination, etag, leaderboard, athlete_stats, includes, fastjson, batch
+from database import read_db, write_db, run_in_session
+from loaders import Loaders, get_loaders
 
 router = APIRouter()
 
 # Create a new athlete
 @router.post("/athletes/", response_model=schemas.AthleteResponse)
-def create_athlete(athlete: schemas.AthleteCreate, db: Session = Depends(get_db)):
-    return crud.create_athlete(db=db, athlete=athlete)
+async def create_athlete(athlete: schemas.AthleteCreate, db: Session = Depends(write_db)):
+    return await run_in_session(db, crud.create_athlete, athlete=athlete)
 
-
-# Get a single athlete by ID
-@router.get("/{athlete_id}", response_model=schemas.Athlete)
-def read_athlete(athlete_id: int, db: Session = Depends(get_db)):
-    db_athlete = crud.get_athlete(db=db, athlete_id=athlete_id)
-    if not db_athlete:
-        raise HTTPException(status_code=404, detail="Athlete not found")
-    return db_athlete
-
-@router.get("/athletes/", response_model=list[schemas.AthleteResponse])
-def read_athletes(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    if skip < 0 or limit < 1:
-        raise HTTPException(status_code=400, detail="Invalid pagination parameters")
-    return crud.get_athletes(db=db, skip=skip, limit=limit)
-
-# Delete an athlete
-@router.delete("/{athlete_id}", status_code=204)
-def delete_athlete(athlete_id: int, db: Session = Depends(get_db)):
-    if not crud.delete_athlete(db=db, athlete_id=athlete_id):
-        raise HTTPException(status_code=404, detail="Athlete not found")
-    return {"detail": "Athlete deleted successfully"}
+@router.get("/athletes/", response_model=list[schemas.AthleteResponse], dependencies=[Depends(etag.conditional("athletes", includes=includes.TABLES))])
+async def read_athletes(response: Response, skip: int = Query(0, ge=0), limit: int = Query(100, ge=1, le=pagination.MAX_LIMIT), cursor: str = None, include: str = None, db: Session = Depends(read_db)):
+    try:
+        expand = includes.parse_include(include, "athletes")
+        page = await run_in_session(db, crud.get_athletes, skip=skip, limit=limit, cursor=cursor, options=includes.options("athletes", expand))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    pagination.set_next_cursor(response, page)
+    if expand:
+        return fastjson.json_response(response, includes.dump_all(page, "athletes", expand))
+    return page
 
 # Filter athletes with optional criteria
-@router.get("/filter", response_model=list[schemas.Athlete])
-def filter_athletes(
+@router.get("/filter", response_model=list[schemas.Athlete], dependencies=[Depends(etag.conditional("athletes", "sports", includes=includes.TABLES))])
+async def filter_athletes(
+    response: Response,
     name: str = None,
     country: str = None,
     age_gt: int = Query(None, alias="age[gt]"),
     age_lt: int = Query(None, alias="age[lt]"),
-    skip: int = 0,
-    limit: int = 100,
-    db: Session = Depends(get_db),
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=pagination.MAX_LIMIT),
+    cursor: str = None,
+    include: str = None,
+    db: Session = Depends(read_db),
 ):
-    return crud.filter_athletes(
-        db=db,
-        name=name,
-        country=country,
-        age_gt=age_gt,
-        age_lt=age_lt,
-        skip=skip,
-        limit=limit,
-    )
+    try:
+        expand = includes.parse_include(include, "athletes")
+        page = await run_in_session(
+            db,
+            crud.filter_athletes,
+            name=name,
+            country=country,
+            age_gt=age_gt,
+            age_lt=age_lt,
+            skip=skip,
+            limit=limit,
+            cursor=cursor,
+            options=includes.options("athletes", expand),
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    pagination.set_next_cursor(response, page)
+    if expand:
+        return fastjson.json_response(response, includes.dump_all(page, "athletes", expand))
+    return page
 
-# JOIN example: Get athletes with their results
-@router.get("/detailed", response_model=list[dict])
-def get_athletes_with_results(db: Session = Depends(get_db)):
-    return crud.get_athletes_with_results(db=db)
+# Get athletes with their result counts
+@router.get("/detailed", response_model=list[dict], dependencies=[Depends(etag.conditional("athletes", "results"))])
+async def get_athletes_with_results(skip: int = Query(0, ge=0), limit: int = Query(100, ge=1, le=pagination.MAX_LIMIT), db: Session = Depends(read_db)):
+    return await run_in_session(db, crud.get_athletes_with_results, skip=skip, limit=limit)
 
 # GROUP BY example: Count athletes by country
-@router.get("/grouped_by_country", response_model=list[dict])
-def group_athletes_by_country(db: Session = Depends(get_db)):
-    return crud.group_athletes_by_country(db=db)
+@router.get("/grouped_by_country", response_model=list[dict], dependencies=[Depends(etag.conditional("athletes"))])
+async def group_athletes_by_country(db: Session = Depends(read_db)):
+    return await run_in_session(db, crud.group_athletes_by_country)
 
 # Sorting athletes
-@router.get("/sorted", response_model=list[schemas.Athlete])
-def get_sorted_athletes(
+@router.get("/sorted", response_model=list[schemas.Athlete], dependencies=[Depends(etag.conditional("athletes", includes=includes.TABLES))])
+async def get_sorted_athletes(
+    response: Response,
     order_by: str = "name",
     descending: bool = False,
-    skip: int = 0,
-    limit: int = 100,
-    db: Session = Depends(get_db),
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=pagination.MAX_LIMIT),
+    cursor: str = None,
+    include: str = None,
+    db: Session = Depends(read_db),
 ):
-    return crud.get_sorted_athletes(
-        db=db,
-        order_by=order_by,
-        descending=descending,
-        skip=skip,
-        limit=limit,
-    )
+    try:
+        expand = includes.parse_include(include, "athletes")
+        page = await run_in_session(
+            db,
+            crud.get_sorted_athletes,
+            order_by=order_by,
+            descending=descending,
+            skip=skip,
+            limit=limit,
+            cursor=cursor,
+            options=includes.options("athletes", expand),
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    pagination.set_next_cursor(response, page)
+    if expand:
+        return fastjson.json_response(response, includes.dump_all(page, "athletes", expand))
+    return page
+
+# An athlete's rank in each of their sports
+@router.get("/{athlete_id}/ranks", response_model=list[dict], dependencies=[Depends(etag.conditional("sports", "results", "leaderboard"))])
+async def read_athlete_ranks(athlete_id: int, db: Session = Depends(read_db)):
+    ranks = await run_in_session(db, leaderboard.athlete_ranks, athlete_id=athlete_id)
+    if not ranks and not await run_in_session(db, crud.get_athlete, athlete_id=athlete_id):
+        raise HTTPException(status_code=404, detail="Athlete not found")
+    return ranks
+
+# An athlete's result statistics, overall and per sport
+@router.get("/{athlete_id}/stats", response_model=dict, dependencies=[Depends(etag.conditional("athletes", "sports", "results", "athlete_stats"))])
+async def read_athlete_stats(athlete_id: int, db: Session = Depends(read_db)):
+    stats = await run_in_session(db, athlete_stats.athlete_summary, athlete_id)
+    if stats is None:
+        raise HTTPException(status_code=404, detail="Athlete not found")
+    return stats
+
+# Get many athletes by ID in one query: found athletes in request order and the missing ids
+@router.get("", response_model=dict, dependencies=[Depends(etag.conditional("athletes"))])
+async def read_athletes_by_ids(response: Response, ids: list[str] = Query(..., description="Comma separated ids, up to batch.MAX_IDS"), loaders: Loaders = Depends(get_loaders)):
+    try:
+        ids = batch.parse_ids(ids)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    rows = await loaders.athletes.load_many(ids)
+    return fastjson.json_response(response, batch.multi_get_body(ids, rows))
+
+# Get a single athlete by ID
+@router.get("/{athlete_id}", response_model=schemas.Athlete, dependencies=[Depends(etag.conditional("athletes", includes=includes.TABLES))])
+async def read_athlete(response: Response, athlete_id: int, include: str = None, db: Session = Depends(read_db)):
+    try:
+        expand = includes.parse_include(include, "athletes")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    db_athlete = await run_in_session(db, crud.get_athlete, athlete_id=athlete_id, options=includes.options("athletes", expand))
+    if not db_athlete:
+        raise HTTPException(status_code=404, detail="Athlete not found")
+    if expand:
+        return fastjson.json_response(response, includes.dump(db_athlete, "athletes", expand))
+    return db_athlete
+
+# Delete an athlete
+@router.delete("/{athlete_id}", status_code=204)
+async def delete_athlete(athlete_id: int, db: Session = Depends(write_db)):
+    if not await run_in_session(db, crud.delete_athlete, athlete_id=athlete_id):
+        raise HTTPException(status_code=404, detail="Athlete not found")
+    return {"detail": "Athlete deleted successfully"}
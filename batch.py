@@ -0,0 +1,117 @@
+import asyncio
+from sqlalchemy import Integer, bindparam
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+from sqlalchemy.types import Boolean
+
+# Batched lookups by id.
+#
+# The multi-get routes (GET /sports?ids=..., /athletes?ids=..., /results?ids=...)
+# resolve every id in one `id = ANY(:ids)` query (IN on SQLite) and answer in
+# request order with the ids that were not found. AsyncLoader (see loaders.py)
+# gives route code the same coalescing for scattered per-id lookups within a
+# request, DataLoader-style: ids requested in the same event loop iteration are
+# fetched together, and each id is fetched at most once per loader.
+
+# Upper bound on ids per multi-get request
+MAX_IDS = 5000
+
+
+class ids_in(FunctionElement):
+    """True when the column equals one of a list of integer ids."""
+
+    type = Boolean()
+    # The id list is bound as a whole, which a cache key would not see
+    inherit_cache = False
+
+    def __init__(self, column, ids):
+        self.ids = list(ids)
+        super().__init__(column)
+
+
+@compiles(ids_in)
+def _ids_in_default(element, compiler, **kw):
+    column = element.clauses.clauses[0]
+    return compiler.process(column.in_(element.ids), **kw)
+
+@compiles(ids_in, "postgresql")
+def _ids_in_postgresql(element, compiler, **kw):
+    column = element.clauses.clauses[0]
+    # One array parameter, so the statement text is the same for any number of ids
+    ids = bindparam("ids", element.ids, type_=ARRAY(Integer))
+    return f"{compiler.process(column, **kw)} = ANY({compiler.process(ids, **kw)})"
+
+
+# Parse ?ids=1,2,3 (the parameter may also repeat) into unique ids in request order
+def parse_ids(values):
+    ids = []
+    for value in values:
+        for part in value.split(","):
+            part = part.strip()
+            if not part:
+                continue
+            try:
+                ids.append(int(part))
+            except ValueError:
+                raise ValueError(f"Invalid id: {part}")
+    ids = list(dict.fromkeys(ids))
+    if not ids:
+        raise ValueError("ids must list at least one id")
+    if len(ids) > MAX_IDS:
+        raise ValueError(f"At most {MAX_IDS} ids per request")
+    return ids
+
+# Body of a multi-get response from the rows loaded for ids (None where missing):
+# found items in request order and the missing ids
+def multi_get_body(ids, rows):
+    return {
+        "items": [row._asdict() for row in rows if row is not None],
+        "missing": [i for i, row in zip(ids, rows) if row is None],
+    }
+
+
+class AsyncLoader:
+    """Request-scoped batching and caching of id lookups for async code.
+
+    Every load() awaited in the same event loop iteration is fetched with one
+    call to the coroutine fetch(ids), which returns {id: item}. Batches are
+    fetched one at a time, since fetch usually shares one session, which does not
+    allow concurrent use.
+    """
+
+    def __init__(self, fetch):
+        self.fetch = fetch
+        self.cache = {}
+        self.pending = {}
+        self._dispatching = None
+        self._fetching = asyncio.Lock()
+
+    def load(self, key):
+        if key in self.cache:
+            return self.cache[key]
+        if key not in self.pending:
+            loop = asyncio.get_running_loop()
+            self.pending[key] = loop.create_future()
+            if self._dispatching is None:
+                # Runs once the caller yields, after every load() made until then
+                self._dispatching = loop.create_task(self._dispatch())
+        future = self.pending[key]
+        self.cache[key] = future
+        return future
+
+    async def load_many(self, keys):
+        return list(await asyncio.gather(*[self.load(key) for key in keys]))
+
+    async def _dispatch(self):
+        batch, self.pending, self._dispatching = self.pending, {}, None
+        try:
+            # A later batch waits here for the one in flight
+            async with self._fetching:
+                found = await self.fetch(list(batch))
+        except Exception as e:
+            for future in batch.values():
+                future.set_exception(e)
+            return
+        for key, future in batch.items():
+            future.set_result(found.get(key))
@@ -0,0 +1,323 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import subprocess
+import sys
+import time
+from datetime import date, datetime, timezone
+import httpx
+
+# End-to-end load test for the Sports API.
+#
+#   python benchmark.py --scale 10k --database-url sqlite:///bench.db --workers 2 \
+#       --concurrency 32 --duration 30 --output bench.json --baseline baseline.json
+#
+# Seeds a dataset with populate_db.py, starts main.app under uvicorn with N
+# workers, drives a weighted read/write mix from an asyncio client and reports
+# throughput and p50/p95/p99 latency per route. With --baseline, routes whose
+# p95 or throughput regressed past --max-regression fail the run (exit 1).
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# Dataset sizes passed to populate_db.py
+SCALES = {
+    "10k": {"sports": 50, "athletes": 1_000, "results": 10_000},
+    "1m": {"sports": 200, "athletes": 50_000, "results": 1_000_000},
+    "10m": {"sports": 500, "athletes": 500_000, "results": 10_000_000},
+}
+
+# Latency differences below this are noise, whatever the relative change
+NOISE_FLOOR_MS = 1.0
+
+
+class Dataset:
+    """Id ranges the request mix draws from; grows as the run creates results and jobs."""
+
+    def __init__(self, sports: int, athletes: int, results: int):
+        self.sports = sports
+        self.athletes = athletes
+        self.results = results
+        self.created = []
+        self.jobs = []
+
+    def sport(self, rng):
+        return rng.randint(1, self.sports)
+
+    def athlete(self, rng):
+        return rng.randint(1, self.athletes)
+
+    def result(self, rng):
+        return rng.randint(1, self.results)
+
+
+def _new_result(data: Dataset, rng):
+    return {
+        "competition_name": f"Benchmark Meet {rng.randint(1, 500)}",
+        "performance": round(rng.uniform(5, 100), 2),
+        "event_date": date(rng.randint(2000, 2024), rng.randint(1, 12), rng.randint(1, 28)).isoformat(),
+        "location": "Benchmark City",
+        "sport_id": data.sport(rng),
+        "athlete_id": data.athlete(rng),
+        "additional_info": {"weather": rng.choice(["Sunny", "Rainy", "Windy"]), "audience_size": rng.randint(1000, 50000)},
+    }
+
+def _update_result(data: Dataset, rng):
+    if not data.created:
+        return "POST", "/results/", _new_result(data, rng)
+    return "PUT", f"/results/{rng.choice(data.created)}", _new_result(data, rng)
+
+def _read_job(data: Dataset, rng):
+    if not data.jobs:
+        return "POST", "/jobs/sports_with_result_counts", None
+    return "GET", f"/jobs/{rng.choice(data.jobs)}", None
+
+# (route label, weight, request builder returning (method, path, json body))
+SCENARIOS = [
+    ("GET /sports/{sport_id}", 6, lambda d, r: ("GET", f"/sports/{d.sport(r)}", None)),
+    ("GET /sports/filter", 3, lambda d, r: ("GET", f"/sports/filter?name={r.choice(['Jump', 'Dash', 'Throw', 'Marathon'])}", None)),
+    ("GET /sports/sorted", 3, lambda d, r: ("GET", "/sports/sorted?limit=50", None)),
+    ("GET /sports/detailed", 2, lambda d, r: ("GET", "/sports/detailed", None)),
+    ("GET /sports/grouped_by_unit", 2, lambda d, r: ("GET", "/sports/grouped_by_unit", None)),
+    ("GET /sports/{sport_id}/leaderboard", 6, lambda d, r: ("GET", f"/sports/{d.sport(r)}/leaderboard?limit=10", None)),
+    ("GET /athletes/{athlete_id}", 8, lambda d, r: ("GET", f"/athletes/{d.athlete(r)}", None)),
+    ("GET /athletes/filter", 4, lambda d, r: ("GET", f"/athletes/filter?name={r.choice(['an', 'el', 'mar', 'son'])}&limit=50", None)),
+    ("GET /athletes/sorted", 3, lambda d, r: ("GET", "/athletes/sorted?order_by=birth_year&limit=50", None)),
+    ("GET /athletes/detailed", 2, lambda d, r: ("GET", "/athletes/detailed?limit=50", None)),
+    ("GET /athletes/grouped_by_country", 2, lambda d, r: ("GET", "/athletes/grouped_by_country", None)),
+    ("GET /athletes/filter (include=results)", 2, lambda d, r: ("GET", "/athletes/filter?limit=50&include=results", None)),
+    ("GET /athletes?ids", 3, lambda d, r: ("GET", "/athletes?ids=" + ",".join(str(d.athlete(r)) for _ in range(50)), None)),
+    ("GET /athletes/{athlete_id}/ranks", 4, lambda d, r: ("GET", f"/athletes/{d.athlete(r)}/ranks", None)),
+    ("GET /athletes/{athlete_id}/stats", 4, lambda d, r: ("GET", f"/athletes/{d.athlete(r)}/stats", None)),
+    ("GET /sports/{sport_id}/records", 2, lambda d, r: ("GET", f"/sports/{d.sport(r)}/records?limit=20", None)),
+    ("GET /results/{result_id}", 10, lambda d, r: ("GET", f"/results/{d.result(r)}", None)),
+    ("GET /results/filter", 10, lambda d, r: ("GET", f"/results/filter?sport_id={d.sport(r)}&limit=100", None)),
+    ("GET /results/filter (date range)", 4, lambda d, r: ("GET", f"/results/filter?athlete_id={d.athlete(r)}&date_from=2015-01-01&date_to=2020-12-31", None)),
+    ("GET /results/filter (info)", 3, lambda d, r: ("GET", "/results/filter?info[weather]=Rainy&info[audience_size][gt]=45000&limit=100", None)),
+    ("GET /results/filter (include=sport,athlete)", 2, lambda d, r: ("GET", f"/results/filter?sport_id={d.sport(r)}&limit=100&include=sport,athlete", None)),
+    ("GET /results/sorted", 4, lambda d, r: ("GET", "/results/sorted?order_by=performance&descending=true&limit=100", None)),
+    ("GET /results/grouped_by_sport", 2, lambda d, r: ("GET", "/results/grouped_by_sport", None)),
+    ("GET /results/export", 1, lambda d, r: ("GET", f"/results/export?format=ndjson&athlete_id={d.athlete(r)}", None)),
+    ("GET /analytics/sports/{sport_id}/percentiles", 2, lambda d, r: ("GET", f"/analytics/sports/{d.sport(r)}/percentiles", None)),
+    ("GET /analytics/sports/{sport_id}/zscores", 1, lambda d, r: ("GET", f"/analytics/sports/{d.sport(r)}/zscores?limit=20", None)),
+    ("GET /analytics/athletes/{athlete_id}/progression", 2, lambda d, r: ("GET", f"/analytics/athletes/{d.athlete(r)}/progression", None)),
+    ("GET /analytics/athletes/{athlete_id}/rolling", 1, lambda d, r: ("GET", f"/analytics/athletes/{d.athlete(r)}/rolling?window=5", None)),
+    ("POST /jobs/{name}", 1, lambda d, r: ("POST", f"/jobs/{r.choice(['athletes_by_country', 'sports_by_unit', 'results_by_sport'])}", None)),
+    ("GET /jobs/{job_id}", 2, _read_job),
+    ("GET /search", 4, lambda d, r: ("GET", f"/search?q={r.choice(['mar', 'jump', 'meet', 'son'])}", None)),
+    ("POST /results/", 4, lambda d, r: ("POST", "/results/", _new_result(d, r))),
+    ("PUT /results/{result_id}", 2, _update_result),
+]
+
+
+def percentile(sorted_values, fraction: float):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, round(fraction * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+def summarize(samples, elapsed: float):
+    """Per-route counts, error counts, throughput and latency percentiles in milliseconds."""
+    routes = {}
+    for route, latencies in sorted(samples.items()):
+        ok = sorted(ms for ms, status in latencies if status < 500)
+        routes[route] = {
+            "requests": len(latencies),
+            "errors": sum(1 for _, status in latencies if status >= 500),
+            "statuses": {str(s): sum(1 for _, status in latencies if status == s) for s in sorted({s for _, s in latencies})},
+            "throughput": round(len(latencies) / elapsed, 2) if elapsed else None,
+            "mean_ms": round(sum(ok) / len(ok), 3) if ok else None,
+            "p50_ms": percentile(ok, 0.50),
+            "p95_ms": percentile(ok, 0.95),
+            "p99_ms": percentile(ok, 0.99),
+        }
+    total = sum(route["requests"] for route in routes.values())
+    return {"requests": total, "throughput": round(total / elapsed, 2) if elapsed else None, "routes": routes}
+
+
+async def _worker(client, data: Dataset, rng, deadline: float, samples, record: bool):
+    labels = [label for label, _, _ in SCENARIOS]
+    weights = [weight for _, weight, _ in SCENARIOS]
+    builders = {label: build for label, _, build in SCENARIOS}
+    while time.perf_counter() < deadline:
+        label = rng.choices(labels, weights)[0]
+        method, path, body = builders[label](data, rng)
+        started = time.perf_counter()
+        try:
+            response = await client.request(method, path, json=body)
+            status = response.status_code
+            if method == "POST" and status == 200:
+                data.created.append(response.json()["id"])
+            elif method == "POST" and status == 202:
+                data.jobs.append(response.json()["id"])
+        except httpx.HTTPError:
+            status = 599
+        if record:
+            samples.setdefault(label, []).append((round((time.perf_counter() - started) * 1000, 3), status))
+
+# Drive the mix with `concurrency` clients, first unrecorded for `warmup` seconds
+async def run_load(base_url: str, data: Dataset, concurrency: int, duration: float, warmup: float, seed: int):
+    samples = {}
+    elapsed = 0.0
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+        for phase, seconds, record in (("warmup", warmup, False), ("measure", duration, True)):
+            if seconds <= 0:
+                continue
+            logger.info("%s: %d clients for %.0fs", phase, concurrency, seconds)
+            deadline = time.perf_counter() + seconds
+            started = time.perf_counter()
+            await asyncio.gather(*[
+                _worker(client, data, random.Random(seed * 1000 + i), deadline, samples, record)
+                for i in range(concurrency)
+            ])
+            if record:
+                elapsed = time.perf_counter() - started
+    return summarize(samples, elapsed)
+
+
+def _env(args):
+    env = dict(os.environ, DATABASE_URL=args.database_url, DB_MODE=args.db_mode)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [ROOT, os.path.join(ROOT, "app"), env.get("PYTHONPATH")]))
+    return env
+
+def seed(args, scale):
+    """Create the schema and load the dataset with populate_db.py."""
+    env = _env(args)
+    subprocess.run([sys.executable, "-c", "import models, database; models.Base.metadata.create_all(database.engine)"],
+                   cwd=ROOT, env=env, check=True)
+    subprocess.run([
+        sys.executable, "populate_db.py",
+        "--sports", str(scale["sports"]), "--athletes", str(scale["athletes"]), "--results", str(scale["results"]),
+        "--seed", str(args.seed),
+    ], cwd=ROOT, env=env, check=True)
+
+def start_server(args):
+    """Start main.app under uvicorn and wait until it answers."""
+    command = [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(args.port),
+               "--workers", str(args.workers), "--log-level", "warning"]
+    server = subprocess.Popen(command, cwd=ROOT, env=_env(args))
+    base_url = f"http://127.0.0.1:{args.port}"
+    deadline = time.monotonic() + args.startup_timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"server exited with code {server.returncode}")
+        try:
+            if httpx.get(base_url + "/", timeout=1).status_code == 200:
+                return server, base_url
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError("server did not start in time")
+
+def dataset_from(base_url: str, scale):
+    """Id ranges from the running server, falling back to the seeded sizes."""
+    sizes = dict(scale)
+    for key, path in (("sports", "/sports/sorted"), ("athletes", "/athletes/sorted"), ("results", "/results/sorted")):
+        try:
+            rows = httpx.get(f"{base_url}{path}?order_by=id&descending=true&limit=1", timeout=10).json()
+            if rows:
+                sizes[key] = rows[0]["id"]
+        except (httpx.HTTPError, ValueError, KeyError, TypeError):
+            pass
+    return Dataset(sizes["sports"], sizes["athletes"], sizes["results"])
+
+
+# Routes present in both runs whose p95 grew or throughput fell by more than
+# max_regression, or that started failing
+def compare(current, baseline, max_regression: float):
+    regressions = []
+    for route, base in baseline["routes"].items():
+        now = current["routes"].get(route)
+        if not now:
+            continue
+        if base["p95_ms"] and now["p95_ms"] and now["p95_ms"] - base["p95_ms"] > NOISE_FLOOR_MS \
+                and now["p95_ms"] > base["p95_ms"] * (1 + max_regression):
+            regressions.append(f"{route}: p95 {base['p95_ms']}ms -> {now['p95_ms']}ms")
+        if base["throughput"] and now["throughput"] is not None and now["throughput"] < base["throughput"] * (1 - max_regression):
+            regressions.append(f"{route}: throughput {base['throughput']}/s -> {now['throughput']}/s")
+        if now["errors"] and not base["errors"]:
+            regressions.append(f"{route}: {now['errors']} server errors")
+    return regressions
+
+# A report value for the table; None (nothing measured) prints as "-"
+def _cell(value):
+    return "-" if value is None else value
+
+def print_report(report):
+    print(f"{'route':<48} {'req':>7} {'err':>5} {'req/s':>9} {'p50':>8} {'p95':>8} {'p99':>8}")
+    for route, stats in report["routes"].items():
+        print(f"{route:<48} {stats['requests']:>7} {stats['errors']:>5} {_cell(stats['throughput']):>9} "
+              f"{_cell(stats['p50_ms']):>8} {_cell(stats['p95_ms']):>8} {_cell(stats['p99_ms']):>8}")
+    print(f"{'total':<48} {report['requests']:>7} {'':>5} {_cell(report['throughput']):>9}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test the Sports API.")
+    parser.add_argument("--scale", choices=sorted(SCALES), default="10k", help="dataset size to seed")
+    parser.add_argument("--database-url", default=os.getenv("DATABASE_URL", "sqlite:///benchmark.db"))
+    parser.add_argument("--db-mode", choices=["sync", "async"], default=os.getenv("DB_MODE", "sync"))
+    parser.add_argument("--skip-seed", action="store_true", help="reuse the data already in the database")
+    parser.add_argument("--url", default=None, help="benchmark an already running server instead of starting one")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--startup-timeout", type=float, default=60)
+    parser.add_argument("--concurrency", type=int, default=32, help="concurrent client connections")
+    parser.add_argument("--duration", type=float, default=30, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=5, help="unrecorded seconds before measuring")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default=None, help="write the report as JSON here")
+    parser.add_argument("--baseline", default=None, help="JSON report to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.10, help="allowed relative p95/throughput regression")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    scale = SCALES[args.scale]
+    server = None
+    if args.url is None and not args.skip_seed:
+        seed(args, scale)
+    try:
+        if args.url is None:
+            server, base_url = start_server(args)
+        else:
+            base_url = args.url.rstrip("/")
+        data = dataset_from(base_url, scale)
+        report = asyncio.run(run_load(base_url, data, args.concurrency, args.duration, args.warmup, args.seed))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    report["config"] = {
+        "scale": args.scale, "database": args.database_url.split("://")[0], "db_mode": args.db_mode,
+        "workers": args.workers, "concurrency": args.concurrency, "duration": args.duration,
+        "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+    }
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        logger.info("Report written to %s", args.output)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.max_regression)
+        for regression in regressions:
+            logger.error("Regression: %s", regression)
+        if regressions:
+            return 1
+        logger.info("No regressions against %s", args.baseline)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,69 @@
+import argparse
+import json
+import logging
+import statistics
+import time
+from pydantic import TypeAdapter
+import crud
+import fastjson
+import schemas
+
+logger = logging.getLogger(__name__)
+
+# In-process comparison of the two ways /results/filter can build its body:
+#
+#   orm:  crud.filter_results -> response_model validation -> JSON text
+#         (what FastAPI does when a route returns ORM instances)
+#   fast: crud.filter_result_rows -> fastjson.dumps
+#
+#   python benchmark_serialization.py --limit 1000 --repeat 50
+#
+# Both paths run the same query against DATABASE_URL, so the difference is the
+# per-row ORM, validation and encoding work. Seed data with populate_db.py first.
+
+RESULTS = TypeAdapter(list[schemas.Result])
+
+
+def orm_body(db, limit: int, **filters):
+    page = crud.filter_results(db=db, limit=limit, **filters)
+    content = RESULTS.dump_python(RESULTS.validate_python(page, from_attributes=True), mode="json")
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode()
+
+def fast_body(db, limit: int, **filters):
+    return fastjson.dumps(crud.filter_result_rows(db=db, limit=limit, **filters))
+
+def measure(session_factory, body, repeat: int, limit: int, **filters):
+    timings = []
+    for _ in range(repeat):
+        # A fresh session per run, as per request, so the identity map starts empty
+        with session_factory() as db:
+            started = time.perf_counter()
+            payload = body(db, limit, **filters)
+            timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return {"bytes": len(payload), "median_ms": round(statistics.median(timings), 3), "p95_ms": round(timings[int(0.95 * (len(timings) - 1))], 3)}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Compare the ORM and fast serialization paths of /results/filter.")
+    parser.add_argument("--limit", type=int, default=1000, help="rows per response")
+    parser.add_argument("--repeat", type=int, default=50, help="timed runs per path")
+    parser.add_argument("--sport-id", type=int, default=None)
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    from database import SessionLocal
+
+    logging.basicConfig(level=logging.INFO)
+    args = parse_args()
+    filters = {"sport_id": args.sport_id}
+    # Warm both paths (statement cache, connection pool) before timing
+    measure(SessionLocal, orm_body, 3, args.limit, **filters)
+    measure(SessionLocal, fast_body, 3, args.limit, **filters)
+
+    orm = measure(SessionLocal, orm_body, args.repeat, args.limit, **filters)
+    fast = measure(SessionLocal, fast_body, args.repeat, args.limit, **filters)
+    print(f"{'path':<6} {'bytes':>10} {'median ms':>10} {'p95 ms':>10}")
+    for name, stats in (("orm", orm), ("fast", fast)):
+        print(f"{name:<6} {stats['bytes']:>10} {stats['median_ms']:>10} {stats['p95_ms']:>10}")
+    logger.info("Fast path speedup: %.1fx (median)", orm["median_ms"] / fast["median_ms"])
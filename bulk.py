@@ -0,0 +1,247 @@
+import collections
+import csv
+import io
+import json
+import time
+from sqlalchemy import insert
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from models import Result, as_date
+import cache
+import leaderboard
+import athlete_stats
+import records
+import schemas
+
+# Columns loaded for every ingested result, in COPY order
+RESULT_COLUMNS = [column.name for column in Result.__table__.columns if column.name != "id"]
+
+# Keep the error list in the report bounded for very dirty inputs
+MAX_REPORTED_ERRORS = 1000
+
+# Limits of one CSV record; a quoted field still open past them is taken as a stray quote
+MAX_RECORD_LINES = 100
+MAX_RECORD_BYTES = 1 << 20
+
+
+class BulkReport:
+    """Counts and per-row errors collected while ingesting a stream."""
+
+    def __init__(self):
+        self.inserted = 0
+        self.failed = 0
+        self.errors = []
+        self.started = time.perf_counter()
+
+    def error(self, line_no: int, message):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line_no, "error": message})
+
+    def as_dict(self):
+        elapsed = time.perf_counter() - self.started
+        return {
+            "inserted": self.inserted,
+            "failed": self.failed,
+            "errors": self.errors,
+            "elapsed_seconds": round(elapsed, 3),
+            "rows_per_second": round(self.inserted / elapsed, 1) if elapsed else None,
+        }
+
+
+# Pick the input format from the request content type
+def detect_format(content_type: str = None):
+    if content_type and "csv" in content_type:
+        return "csv"
+    return "ndjson"
+
+# Split a streamed request body into lines without buffering the whole body
+async def iter_lines(stream):
+    buffer = b""
+    async for data in stream:
+        buffer += data
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line
+    if buffer:
+        yield buffer
+
+# Number the lines of a body, one record per line (NDJSON)
+async def iter_line_records(lines):
+    line_no = 0
+    async for line in lines:
+        line_no += 1
+        yield line_no, [line]
+
+# Group the lines of a CSV body into records: a quoted field may span lines, so a
+# record ends on the line that balances its quotes (an escaped "" counts twice).
+# Yields the number of each record's first line and its lines. A record that grows
+# past MAX_RECORD_LINES or MAX_RECORD_BYTES, or is still open at the end of the body,
+# is yielded with None instead of lines, and scanning resumes at its second line, so
+# one stray quote costs one row rather than the rest of the body.
+async def iter_csv_records(lines):
+    numbered = iter_line_records(lines)
+    replay = collections.deque()
+    record, quotes, size = [], 0, 0
+    while True:
+        if replay:
+            line_no, line = replay.popleft()
+        else:
+            item = await anext(numbered, None)
+            if item is None:
+                if not record:
+                    return
+                yield record[0][0], None
+                replay.extend(record[1:])
+                record, quotes, size = [], 0, 0
+                continue
+            line_no, (line,) = item
+        record.append((line_no, line))
+        quotes += line.count(b'"')
+        size += len(line)
+        if quotes % 2 == 0:
+            yield record[0][0], [line for _, line in record]
+            record, quotes, size = [], 0, 0
+        elif len(record) >= MAX_RECORD_LINES or size > MAX_RECORD_BYTES:
+            yield record[0][0], None
+            replay.extendleft(reversed(record[1:]))
+            record, quotes, size = [], 0, 0
+
+# Validate one decoded row against the ResultCreate schema and map it to result columns
+def validate_row(data: dict):
+    item = schemas.ResultCreate(**data)
+    values = dict(item)
+    row = {column: values.get(column) for column in RESULT_COLUMNS}
+    if row.get("additional_info") is None:
+        row["additional_info"] = {}
+    row["event_date"] = as_date(row["event_date"])
+    return row
+
+def _parse_ndjson(line: str):
+    return json.loads(line)
+
+class CSVParser:
+    """One csv.reader over a whole body, fed a complete record at a time."""
+
+    def __init__(self):
+        self.lines = collections.deque()
+        self.reader = csv.reader(self)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if not self.lines:
+            raise StopIteration
+        return self.lines.popleft()
+
+    # Values of one record, from its decoded lines
+    def parse(self, lines: list):
+        self.lines.extend(line + "\n" for line in lines)
+        try:
+            return next(self.reader, [])
+        finally:
+            self.lines.clear()
+
+def _parse_csv(values: list, header: list):
+    if len(values) != len(header):
+        raise ValueError(f"Expected {len(header)} columns, got {len(values)}")
+    data = {key: value if value != "" else None for key, value in zip(header, values)}
+    if data.get("additional_info"):
+        data["additional_info"] = json.loads(data["additional_info"])
+    return data
+
+def _error_message(e: Exception):
+    if hasattr(e, "errors"):
+        return [error.get("msg") for error in e.errors()]
+    return str(e)
+
+# Escape a value for PostgreSQL COPY text format
+def _copy_value(value):
+    if value is None:
+        return "\\N"
+    if isinstance(value, (dict, list)):
+        value = json.dumps(value)
+    return str(value).replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+# Stream rows into a table with COPY FROM STDIN (PostgreSQL only)
+def copy_rows(db: Session, table_name: str, columns: list, rows: list):
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write("\t".join(_copy_value(row[column]) for column in columns))
+        buffer.write("\n")
+    buffer.seek(0)
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.copy_expert(f"COPY {table_name} ({', '.join(columns)}) FROM STDIN", buffer)
+    finally:
+        cursor.close()
+
+# Load one validated chunk in a single transaction, falling back to row by row on failure
+def load_chunk(db: Session, chunk: list, report: BulkReport):
+    rows = [row for _, row in chunk]
+    try:
+        if db.get_bind().dialect.name == "postgresql":
+            copy_rows(db, Result.__tablename__, RESULT_COLUMNS, rows)
+        else:
+            db.execute(insert(Result), rows)
+        # Core inserts and COPY bypass the ORM hooks, so merge the chunk into the derived tables here
+        leaderboard.apply_results(db.connection(), [(row["sport_id"], row["athlete_id"], row["performance"]) for row in rows])
+        athlete_stats.apply_results(db.connection(), [(row["athlete_id"], row["sport_id"], row["performance"], row["event_date"]) for row in rows])
+        if records.apply_results(db.connection(), [(None, row["sport_id"], row["performance"], row.get("competition_name")) for row in rows]):
+            cache.mark_changed(db, "sports")
+        cache.mark_changed(db, Result.__tablename__)
+        db.commit()
+        report.inserted += len(rows)
+        return
+    except Exception:
+        # COPY errors come straight from the driver rather than as SQLAlchemyError
+        db.rollback()
+
+    # Isolate the offending rows so the rest of the chunk still lands
+    for line_no, row in chunk:
+        try:
+            with db.begin_nested():
+                db.execute(insert(Result), [row])
+                leaderboard.apply_results(db.connection(), [(row["sport_id"], row["athlete_id"], row["performance"])])
+                athlete_stats.apply_results(db.connection(), [(row["athlete_id"], row["sport_id"], row["performance"], row["event_date"])])
+                if records.apply_results(db.connection(), [(None, row["sport_id"], row["performance"], row.get("competition_name"))]):
+                    cache.mark_changed(db, "sports")
+            report.inserted += 1
+        except SQLAlchemyError as e:
+            report.error(line_no, str(getattr(e, "orig", e)))
+    cache.mark_changed(db, Result.__tablename__)
+    db.commit()
+
+# Ingest a streamed NDJSON or CSV body of results in chunks
+async def ingest_results(db: Session, stream, fmt: str = "ndjson", chunk_size: int = 5000):
+    report = BulkReport()
+    parser = CSVParser() if fmt == "csv" else None
+    header = None
+    chunk = []
+    numbered = iter_csv_records(iter_lines(stream)) if parser else iter_line_records(iter_lines(stream))
+    async for line_no, raw in numbered:
+        if raw is None:
+            report.error(line_no, "Unterminated quoted field")
+            continue
+        lines = [line.decode("utf-8", errors="replace") for line in raw]
+        if not any(line.strip() for line in lines):
+            continue
+        try:
+            if parser is None:
+                data = _parse_ndjson(lines[0])
+            elif header is None:
+                header = parser.parse(lines)
+                continue
+            else:
+                data = _parse_csv(parser.parse(lines), header)
+            chunk.append((line_no, validate_row(data)))
+        except (ValueError, TypeError, csv.Error) as e:
+            report.error(line_no, _error_message(e))
+        if len(chunk) >= chunk_size:
+            await run_in_threadpool(load_chunk, db, chunk, report)
+            chunk = []
+    if chunk:
+        await run_in_threadpool(load_chunk, db, chunk, report)
+    return report.as_dict()
@@ -0,0 +1,264 @@
+import asyncio
+import functools
+import json
+import math
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from itertools import chain
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+import metrics
+
+# Cache for the aggregate queries in crud.py.
+#
+# Entries are keyed by the current version of every table they read. Writes bump
+# those versions after commit instead of deleting keys, so stale entries simply
+# stop being looked up and age out through TTL/LRU. With a shared backend the
+# versions live in the shared store too, which keeps all workers consistent.
+#
+# Versions are bumped when the primary commits, but reads may go to a replica that
+# has not replayed the write yet. For CACHE_VERSION_SETTLE_SECONDS after a bump the
+# table counts as unsettled: nothing that read it is cached, and no ETag is sent
+# (etag.py), so a lagging replica's rows never get the new version.
+
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")  # memory | redis | fake
+CACHE_REDIS_URL = os.getenv("CACHE_REDIS_URL", "redis://localhost:6379/0")
+CACHE_TTL_SECONDS = float(os.getenv("CACHE_TTL_SECONDS", "30"))
+CACHE_MAXSIZE = int(os.getenv("CACHE_MAXSIZE", "256"))
+# How long a read replica may lag behind a commit; only needed with replicas
+CACHE_VERSION_SETTLE_SECONDS = float(os.getenv("CACHE_VERSION_SETTLE_SECONDS", "5" if os.getenv("DATABASE_REPLICA_URLS") else "0"))
+
+CACHE_HITS = metrics.Counter("cache_hits_total", "Aggregate cache hits")
+CACHE_MISSES = metrics.Counter("cache_misses_total", "Aggregate cache misses")
+CACHE_INVALIDATIONS = metrics.Counter("cache_invalidations_total", "Table version bumps")
+
+
+class MemoryBackend:
+    """Per-process LRU with per-entry TTL."""
+
+    def __init__(self, maxsize: int = CACHE_MAXSIZE):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.counters = {}
+        self.lock = threading.Lock()
+        self.epoch = uuid.uuid4().hex
+
+    def get(self, key: str):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str, ttl: float):
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def incr(self, key: str):
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + 1
+            return self.counters[key]
+
+    def put(self, key: str, value: int, ttl: float):
+        with self.lock:
+            self.counters[key] = value
+
+    def mget(self, keys: list):
+        with self.lock:
+            return [self.counters.get(key) for key in keys]
+
+    def epoch_mget(self, keys: list):
+        with self.lock:
+            return self.epoch, [self.counters.get(key) for key in keys]
+
+
+class RedisBackend:
+    """Shared store; works with redis.Redis or the in-process FakeRedis below."""
+
+    def __init__(self, client):
+        self.client = client
+
+    def get(self, key: str):
+        value = self.client.get(key)
+        return value.decode() if isinstance(value, bytes) else value
+
+    def set(self, key: str, value: str, ttl: float):
+        self.client.set(key, value, ex=max(1, int(ttl)))
+
+    def incr(self, key: str):
+        return self.client.incr(key)
+
+    def put(self, key: str, value: int, ttl: float):
+        self.client.set(key, value, ex=max(1, math.ceil(ttl)))
+
+    def mget(self, keys: list):
+        return [int(value) if value is not None else None for value in self.client.mget(keys)]
+
+    # The epoch identifies this incarnation of the counters. It is read in the same MGET
+    # as them and recreated when missing, so after a flush or restart the reset counters
+    # come with a new epoch and never repeat versions sent for other data.
+    def epoch_mget(self, keys: list):
+        while True:
+            epoch, *values = self.client.mget(["version:epoch", *keys])
+            if epoch is not None:
+                break
+            self.client.set("version:epoch", uuid.uuid4().hex, nx=True)
+        epoch = epoch.decode() if isinstance(epoch, bytes) else epoch
+        return epoch, [int(value) if value is not None else None for value in values]
+
+
+class FakeRedis:
+    """Local stand-in for the subset of the redis client API used here."""
+
+    def __init__(self):
+        self.data = {}
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            value, expires_at = self.data.get(key, (None, None))
+            if expires_at is not None and expires_at < time.monotonic():
+                del self.data[key]
+                return None
+            return value
+
+    def set(self, key, value, ex=None, nx=False):
+        with self.lock:
+            if nx and key in self.data:
+                return None
+            self.data[key] = (value, time.monotonic() + ex if ex else None)
+            return True
+
+    def incr(self, key):
+        with self.lock:
+            value = int(self.data.get(key, (0, None))[0]) + 1
+            self.data[key] = (str(value), None)
+            return value
+
+    def mget(self, keys):
+        return [self.get(key) for key in keys]
+
+
+def make_backend(name: str = CACHE_BACKEND):
+    if name == "redis":
+        import redis
+
+        return RedisBackend(redis.Redis.from_url(CACHE_REDIS_URL))
+    if name == "fake":
+        return RedisBackend(FakeRedis())
+    return MemoryBackend()
+
+backend = make_backend()
+
+
+# The backend's epoch, the current version of each table (0 if it was never bumped),
+# and whether every table has settled since its last bump, read together
+def tagged_versions(tables):
+    keys = [f"version:{table}" for table in tables]
+    if CACHE_VERSION_SETTLE_SECONDS > 0:
+        keys += [f"settled:{table}" for table in tables]
+    epoch, values = backend.epoch_mget(keys)
+    now_ms = time.time() * 1000
+    settled = all(until is None or until <= now_ms for until in values[len(tables):])
+    return epoch, [value or 0 for value in values[: len(tables)]], settled
+
+# Mark a table as changed; every cached entry that read it is now stale
+def bump_version(table: str):
+    CACHE_INVALIDATIONS.inc(table=table)
+    if CACHE_VERSION_SETTLE_SECONDS > 0:
+        until_ms = int((time.time() + CACHE_VERSION_SETTLE_SECONDS) * 1000)
+        backend.put(f"settled:{table}", until_ms, CACHE_VERSION_SETTLE_SECONDS)
+    return backend.incr(f"version:{table}")
+
+# The entry key for a call, and whether its result may be stored
+def _key(name: str, tables, args, kwargs):
+    epoch, versions, settled = tagged_versions(tables)
+    parts = [name, epoch]
+    parts += [f"{table}={version}" for table, version in zip(tables, versions)]
+    parts += [repr(arg) for arg in args]
+    parts += [f"{k}={v!r}" for k, v in sorted(kwargs.items())]
+    return ":".join(parts), settled
+
+def _lookup(name: str, key: str):
+    raw = backend.get(key)
+    if raw is not None:
+        CACHE_HITS.inc(name=name)
+        return True, json.loads(raw)
+    CACHE_MISSES.inc(name=name)
+    return False, None
+
+def _rows(rows):
+    return [dict(row._mapping) if hasattr(row, "_mapping") else row for row in rows]
+
+# Run a store call off the event loop; the memory backend never blocks, so it runs inline
+async def _off_loop(function, *args):
+    if isinstance(backend, MemoryBackend):
+        return function(*args)
+    return await asyncio.to_thread(function, *args)
+
+# Cache a crud function's rows (as plain dicts) by the versions of the tables it reads.
+# The session argument is not part of the key; any other arguments are.
+#
+# The wrapper also gets call_async(db, ...) for AsyncSession callers (see
+# database.run_in_session): the query goes through run_sync, and the store calls run
+# on a worker thread, so a shared backend never blocks the event loop on network I/O.
+def cached(name: str, tables, ttl: float = CACHE_TTL_SECONDS):
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(db, *args, **kwargs):
+            key, settled = _key(name, tables, args, kwargs)
+            hit, value = _lookup(name, key)
+            if hit:
+                return value
+            value = _rows(func(db, *args, **kwargs))
+            if settled:
+                backend.set(key, json.dumps(value, default=str), ttl)
+            return value
+
+        async def call_async(db, *args, **kwargs):
+            key, settled = await _off_loop(_key, name, tables, args, kwargs)
+            hit, value = await _off_loop(_lookup, name, key)
+            if hit:
+                return value
+            value = _rows(await db.run_sync(func, *args, **kwargs))
+            if settled:
+                await _off_loop(backend.set, key, json.dumps(value, default=str), ttl)
+            return value
+
+        wrapper.call_async = call_async
+        return wrapper
+    return decorator
+
+
+# Record a table touched outside the ORM unit of work (Core inserts, COPY)
+def mark_changed(session, table: str):
+    session.info.setdefault("changed_tables", set()).add(table)
+
+# Track which tables a flush wrote to
+@event.listens_for(Session, "after_flush")
+def _after_flush(session, flush_context):
+    for obj in chain(session.new, session.dirty, session.deleted):
+        table = getattr(obj, "__tablename__", None)
+        if table:
+            mark_changed(session, table)
+
+# Bump versions only once the data is committed and visible to other sessions
+@event.listens_for(Session, "after_commit")
+def _after_commit(session):
+    for table in session.info.pop("changed_tables", ()):
+        bump_version(table)
+
+@event.listens_for(Session, "after_rollback")
+def _after_rollback(session):
+    session.info.pop("changed_tables", None)
@@ -5,9 +5,29 @@ from schemas import ResultCreate
 from sqlalchemy.orm import Session
 from models import Athlete
 from schemas import AthleteCreate
-from sqlalchemy import func, desc
+from sqlalchemy import func
+from datetime import date
+from pagination import keyset_page, keyset_query, build_page, sort_column
+import leaderboard  # noqa: F401 - registers the leaderboard write hooks
+import records  # noqa: F401 - registers the record write hooks
+import athlete_stats
+from cache import cached
+from info_filters import info_conditions
+from fastjson import row_query
+from batch import ids_in
+import schemas
 
 
+# Fetch one keyset page of a Core select() as rows
+def _row_page(db: Session, query, order_column, id_column, descending: bool = False, cursor: str = None, skip: int = 0, limit: int = 100):
+    rows = db.execute(keyset_query(query, order_column, id_column, descending, cursor, skip, limit)).all()
+    return build_page(rows, order_column, limit)
+
+# Rows of the response model's columns for a list of ids, keyed by id
+def _by_ids(db: Session, model, schema, ids):
+    rows = db.execute(row_query(model, schema.model_fields).where(ids_in(model.id, ids))).all()
+    return {row.id: row for row in rows}
+
 # Create a new sport
 def create_sport(db: Session, sport: SportCreate):
     db_sport = Sport(name=sport.name, popularity=sport.popularity, unit=sport.unit)
@@ -17,8 +37,12 @@ def create_sport(db: Session, sport: SportCreate):
     return db_sport
 
 # Get a single sport by ID
-def get_sport(db: Session, sport_id: int):
-    return db.query(Sport).filter(Sport.id == sport_id).first()
+def get_sport(db: Session, sport_id: int, options=()):
+    return db.query(Sport).options(*options).filter(Sport.id == sport_id).first()
+
+# Get many sports by ID in one query, as {id: row}
+def get_sports_by_ids(db: Session, ids):
+    return _by_ids(db, Sport, schemas.Sport, ids)
 
 # Update a sport
 def update_sport(db: Session, sport_id: int, sport: SportCreate):
@@ -41,17 +65,18 @@ def delete_sport(db: Session, sport_id: int):
     return False
 
 # Filter sports with optional criteria
-def filter_sports(db: Session, name: str = None, world_record_gt: float = None, world_record_lt: float = None, skip: int = 0, limit: int = 100):
-    query = db.query(Sport)
+def filter_sports(db: Session, name: str = None, world_record_gt: float = None, world_record_lt: float = None, skip: int = 0, limit: int = 100, cursor: str = None, options=()):
+    query = db.query(Sport).options(*options)
     if name:
         query = query.filter(Sport.name.ilike(f"%{name}%"))
     if world_record_gt:
         query = query.filter(Sport.world_record > world_record_gt)
     if world_record_lt:
         query = query.filter(Sport.world_record < world_record_lt)
-    return query.offset(skip).limit(limit).all()
+    return keyset_page(query, Sport.id, Sport.id, cursor=cursor, skip=skip, limit=limit)
 
 # JOIN example: Get sports with the number of results
+@cached("sports_with_result_counts", tables=("sports", "results"))
 def get_sports_with_result_counts(db: Session):
     return db.query(Sport.name, func.count().label("result_count")).join(Sport.results).group_by(Sport.name).all()
 
@@ -65,15 +90,14 @@ def update_world_record(db: Session, sport_name: str, new_record: float):
     return False
 
 # Group sports by unit
+@cached("sports_by_unit", tables=("sports",))
 def group_sports_by_unit(db: Session):
     return db.query(Sport.unit, func.count().label("count")).group_by(Sport.unit).all()
 
 # Get sorted sports
-def get_sorted_sports(db: Session, order_by: str, descending: bool, skip: int, limit: int):
-    order_column = getattr(Sport, order_by, Sport.name)
-    if descending:
-        order_column = desc(order_column)
-    return db.query(Sport).order_by(order_column).offset(skip).limit(limit).all()
+def get_sorted_sports(db: Session, order_by: str, descending: bool, skip: int, limit: int, cursor: str = None, options=()):
+    order_column = sort_column(Sport, order_by, Sport.name)
+    return keyset_page(db.query(Sport).options(*options), order_column, Sport.id, descending, cursor, skip, limit)
 
 
 # Create a new athlete
@@ -85,12 +109,16 @@ def create_athlete(db: Session, athlete: AthleteCreate):
     return db_athlete
 
 # Get a single athlete by ID
-def get_athlete(db: Session, athlete_id: int):
-    return db.query(Athlete).filter(Athlete.id == athlete_id).first()
+def get_athlete(db: Session, athlete_id: int, options=()):
+    return db.query(Athlete).options(*options).filter(Athlete.id == athlete_id).first()
+
+# Get many athletes by ID in one query, as {id: row}
+def get_athletes_by_ids(db: Session, ids):
+    return _by_ids(db, Athlete, schemas.Athlete, ids)
 
 # Get a list of athletes with pagination
-def get_athletes(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(Athlete).offset(skip).limit(limit).all()
+def get_athletes(db: Session, skip: int = 0, limit: int = 100, cursor: str = None, options=()):
+    return keyset_page(db.query(Athlete).options(*options), Athlete.id, Athlete.id, cursor=cursor, skip=skip, limit=limit)
 
 # Update an athlete
 def update_athlete(db: Session, athlete_id: int, athlete: AthleteCreate):
@@ -114,48 +142,73 @@ def delete_athlete(db: Session, athlete_id: int):
     return False
 
 # Filter athletes with optional criteria
-def filter_athletes(db: Session, name: str = None, sport: str = None, country: str = None, skip: int = 0, limit: int = 100):
-    query = db.query(Athlete)
+def filter_athletes(db: Session, name: str = None, sport: str = None, country: str = None, age_gt: int = None, age_lt: int = None, skip: int = 0, limit: int = 100, cursor: str = None, options=()):
+    query = db.query(Athlete).options(*options)
     if name:
-        query = query.filter(Athlete.name.ilike(f"%{name}%"))
+        query = query.filter(Athlete.full_name.ilike(f"%{name}%"))
     if sport:
         query = query.join(Athlete.sport).filter(Sport.name.ilike(f"%{sport}%"))
     if country:
         query = query.filter(Athlete.country.ilike(f"%{country}%"))
-    return query.offset(skip).limit(limit).all()
+    if age_gt:
+        query = query.filter(Athlete.birth_year < date.today().year - age_gt)
+    if age_lt:
+        query = query.filter(Athlete.birth_year > date.today().year - age_lt)
+    return keyset_page(query, Athlete.id, Athlete.id, cursor=cursor, skip=skip, limit=limit)
 
-# Get athletes with detailed results (JOIN example)
+# Get athletes with their result counts, from the maintained statistics (see athlete_stats.py)
 def get_athletes_with_results(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(Athlete.name, Athlete.country, func.count().label("result_count")).join(Athlete.results).group_by(Athlete.id).offset(skip).limit(limit).all()
+    return [dict(row._mapping) for row in db.execute(athlete_stats.athletes_with_results(skip, limit))]
+
+# Count athletes by country
+@cached("athletes_by_country", tables=("athletes",))
+def group_athletes_by_country(db: Session):
+    return db.query(Athlete.country, func.count().label("count")).group_by(Athlete.country).all()
 
 # Get athletes sorted by a specific field
-def get_sorted_athletes(db: Session, order_by: str, descending: bool, skip: int, limit: int):
-    order_column = getattr(Athlete, order_by, Athlete.name)
-    if descending:
-        order_column = desc(order_column)
-    return db.query(Athlete).order_by(order_column).offset(skip).limit(limit).all()
+def get_sorted_athletes(db: Session, order_by: str, descending: bool, skip: int, limit: int, cursor: str = None, options=()):
+    order_column = sort_column(Athlete, order_by, Athlete.full_name)
+    return keyset_page(db.query(Athlete).options(*options), order_column, Athlete.id, descending, cursor, skip, limit)
+
 # Create a new result
 def create_result(db: Session, result: ResultCreate):
-    db_result = Result(athlete_id=result.athlete_id, sport_id=result.sport_id, score=result.score, date=result.date)
+    db_result = Result(
+        competition_name=result.competition_name,
+        performance=result.performance,
+        event_date=result.event_date,
+        location=result.location,
+        sport_id=result.sport_id,
+        athlete_id=result.athlete_id,
+        additional_info=result.additional_info,
+    )
     db.add(db_result)
     db.commit()
     db.refresh(db_result)
     return db_result
 
 # Get a single result by ID
-def get_result(db: Session, result_id: int):
-    return db.query(Result).filter(Result.id == result_id).first()
+def get_result(db: Session, result_id: int, options=()):
+    return db.query(Result).options(*options).filter(Result.id == result_id).first()
+
+# Get many results by ID in one query, as {id: row}
+def get_results_by_ids(db: Session, ids):
+    return _by_ids(db, Result, schemas.Result, ids)
 
 # Get a list of results with pagination
-def get_results(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(Result).offset(skip).limit(limit).all()
+def get_results(db: Session, skip: int = 0, limit: int = 100, cursor: str = None):
+    return keyset_page(db.query(Result), Result.id, Result.id, cursor=cursor, skip=skip, limit=limit)
 
 # Update a result
 def update_result(db: Session, result_id: int, result: ResultCreate):
     db_result = db.query(Result).filter(Result.id == result_id).first()
     if db_result:
-        db_result.score = result.score
-        db_result.date = result.date
+        db_result.competition_name = result.competition_name
+        db_result.performance = result.performance
+        db_result.event_date = result.event_date
+        db_result.location = result.location
+        db_result.sport_id = result.sport_id
+        db_result.athlete_id = result.athlete_id
+        db_result.additional_info = result.additional_info
         db.commit()
         db.refresh(db_result)
     return db_result
@@ -170,19 +223,50 @@ def delete_result(db: Session, result_id: int):
     return False
 
 # Filter results with optional criteria (e.g., score, athlete, sport)
-def filter_results(db: Session, athlete_id: int = None, sport_id: int = None, score_gt: float = None, score_lt: float = None, skip: int = 0, limit: int = 100):
-    query = db.query(Result)
+def filter_results(db: Session, athlete_id: int = None, sport_id: int = None, score_gt: float = None, score_lt: float = None, date_from: date = None, date_to: date = None, info: dict = None, info_ranges: list = None, skip: int = 0, limit: int = 100, cursor: str = None, options=()):
+    query = db.query(Result).options(*options).filter(*result_filters(athlete_id, sport_id, score_gt, score_lt, date_from, date_to, info, info_ranges))
+    return keyset_page(query, Result.id, Result.id, cursor=cursor, skip=skip, limit=limit)
+
+# Same page as filter_results, as column tuples for fastjson.rows_response
+def filter_result_rows(db: Session, athlete_id: int = None, sport_id: int = None, score_gt: float = None, score_lt: float = None, date_from: date = None, date_to: date = None, info: dict = None, info_ranges: list = None, skip: int = 0, limit: int = 100, cursor: str = None):
+    query = row_query(Result, schemas.Result.model_fields).where(*result_filters(athlete_id, sport_id, score_gt, score_lt, date_from, date_to, info, info_ranges))
+    return _row_page(db, query, Result.id, Result.id, cursor=cursor, skip=skip, limit=limit)
+
+# WHERE conditions for the result filters, shared by filter_results and the export.
+# (sport_id, performance), (athlete_id, event_date) and (sport_id, event_date) are indexed.
+def result_filters(athlete_id: int = None, sport_id: int = None, score_gt: float = None, score_lt: float = None, date_from: date = None, date_to: date = None, info: dict = None, info_ranges: list = None):
+    conditions = []
     if athlete_id:
-        query = query.filter(Result.athlete_id == athlete_id)
+        conditions.append(Result.athlete_id == athlete_id)
     if sport_id:
-        query = query.filter(Result.sport_id == sport_id)
+        conditions.append(Result.sport_id == sport_id)
     if score_gt:
-        query = query.filter(Result.score > score_gt)
+        conditions.append(Result.performance > score_gt)
     if score_lt:
-        query = query.filter(Result.score < score_lt)
-    return query.offset(skip).limit(limit).all()
+        conditions.append(Result.performance < score_lt)
+    if date_from:
+        conditions.append(Result.event_date >= date_from)
+    if date_to:
+        conditions.append(Result.event_date <= date_to)
+    conditions += info_conditions(Result.additional_info, info, info_ranges)
+    return conditions
+
+# Get sorted results
+def get_sorted_results(db: Session, order_by: str, descending: bool, skip: int, limit: int, cursor: str = None, date_from: date = None, date_to: date = None, options=()):
+    order_column = sort_column(Result, order_by, Result.performance)
+    query = db.query(Result).options(*options).filter(*result_filters(date_from=date_from, date_to=date_to))
+    return keyset_page(query, order_column, Result.id, descending, cursor, skip, limit)
+
+# Same page as get_sorted_results, as column tuples for fastjson.rows_response
+def get_sorted_result_rows(db: Session, order_by: str, descending: bool, skip: int, limit: int, cursor: str = None, date_from: date = None, date_to: date = None):
+    order_column = sort_column(Result, order_by, Result.performance)
+    # The response model's columns, plus the sort column the next page cursor is built from
+    fields = dict.fromkeys([*schemas.Result.model_fields, order_column.key])
+    query = row_query(Result, fields).where(*result_filters(date_from=date_from, date_to=date_to))
+    return _row_page(db, query, order_column, Result.id, descending, cursor, skip, limit)
 
 # Get results grouped by sport
+@cached("results_by_sport", tables=("sports", "results"))
 def group_results_by_sport(db: Session):
     return db.query(Sport.name, func.count().label("result_count")).join(Result).group_by(Sport.name).all()
 
@@ -0,0 +1,41 @@
+import hashlib
+from fastapi import HTTPException, Request, Response
+import cache
+
+# Conditional GET support. A response's ETag is derived from the route, its query
+# parameters and the version counters (see cache.py) of the tables it reads, so a
+# matching If-None-Match can be answered with 304 before any query runs.
+# While a table is unsettled after a write (cache.CACHE_VERSION_SETTLE_SECONDS) a
+# replica may still return the old rows, so no ETag is sent and nothing gets a 304
+# until the window has passed. Across workers this relies on a shared cache backend; with
+# the per-process memory backend each worker's ETags simply never match another's.
+
+
+# None while one of the tables is unsettled
+def compute_etag(request: Request, tables):
+    epoch, versions, settled = cache.tagged_versions(tables)
+    if not settled:
+        return None
+    parts = [epoch, request.url.path, repr(sorted(request.query_params.multi_items()))]
+    parts += [f"{table}={version}" for table, version in zip(tables, versions)]
+    return '"' + hashlib.sha1("|".join(parts).encode()).hexdigest() + '"'
+
+def _matches(header: str, tag: str):
+    if not header:
+        return False
+    candidates = [candidate.strip() for candidate in header.split(",")]
+    return "*" in candidates or tag in [c[2:] if c.startswith("W/") else c for c in candidates]
+
+# Route dependency: 304 on a matching If-None-Match, otherwise set the ETag header.
+# `includes` maps ?include= names to the extra table each one reads.
+def conditional(*tables, includes: dict = None):
+    def dependency(request: Request, response: Response):
+        requested = {name.strip() for name in request.query_params.get("include", "").split(",")}
+        route_tables = tables + tuple(table for name, table in (includes or {}).items() if name in requested and table not in tables)
+        tag = compute_etag(request, route_tables)
+        if tag is None:
+            return
+        if _matches(request.headers.get("if-none-match"), tag):
+            raise HTTPException(status_code=304, headers={"ETag": tag})
+        response.headers["ETag"] = tag
+    return dependency
@@ -0,0 +1,72 @@
+import csv
+import io
+import json
+import os
+from sqlalchemy import select
+from models import Result
+from crud import result_filters
+
+# Streaming export of results.
+#
+# Rows are read through a server-side cursor (stream_results/yield_per) in
+# partitions of EXPORT_BATCH_SIZE and serialised one partition at a time, so
+# memory stays flat no matter how many rows match. The export opens its own
+# session: route dependencies are closed before a StreamingResponse is consumed.
+
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "2000"))
+
+FORMATS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+}
+
+COLUMNS = [column.name for column in Result.__table__.columns]
+
+
+def export_query(**filters):
+    return (
+        select(*Result.__table__.columns)
+        .where(*result_filters(**filters))
+        .order_by(Result.id)
+        .execution_options(stream_results=True, yield_per=EXPORT_BATCH_SIZE)
+    )
+
+def _csv_value(value):
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    return value
+
+def _csv_chunk(rows, header: bool = False):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(COLUMNS)
+    writer.writerows([_csv_value(value) for value in row] for row in rows)
+    return buffer.getvalue()
+
+def _ndjson_chunk(rows):
+    return "".join(json.dumps(dict(zip(COLUMNS, row)), default=str) + "\n" for row in rows)
+
+def _chunk(fmt: str, rows):
+    return _csv_chunk(rows) if fmt == "csv" else _ndjson_chunk(rows)
+
+def filename(fmt: str):
+    return f"results.{fmt}"
+
+# Yield the export body in chunks, one per fetched partition
+def iter_export(session_factory, fmt: str, **filters):
+    with session_factory() as db:
+        result = db.execute(export_query(**filters))
+        if fmt == "csv":
+            yield _csv_chunk([], header=True)
+        for rows in result.partitions():
+            yield _chunk(fmt, rows)
+
+# Async counterpart of iter_export, using AsyncSession.stream
+async def aiter_export(session_factory, fmt: str, **filters):
+    async with session_factory() as db:
+        result = await db.stream(export_query(**filters))
+        if fmt == "csv":
+            yield _csv_chunk([], header=True)
+        async for rows in result.partitions():
+            yield _chunk(fmt, rows)
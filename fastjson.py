@@ -0,0 +1,42 @@
+import orjson
+from fastapi import Response
+from sqlalchemy import select
+
+# Serialization fast path for large list responses.
+#
+# Returning ORM instances makes every row go through the identity map, then
+# through response_model validation and JSON encoding. For hot list routes the
+# crud layer instead selects plain column tuples (row_query) and the route hands
+# them to rows_response, which serializes them straight to bytes with orjson.
+# Routes keep their response_model for the OpenAPI schema; FastAPI skips
+# validation when a Response is returned, so the selected columns must match it.
+
+
+# select() of a model's columns (all of them, or the named fields), yielding tuples instead of instances
+def row_query(model, fields=None):
+    columns = model.__table__.columns
+    return select(*(columns if fields is None else [columns[name] for name in fields]))
+
+def row_dicts(rows):
+    if not rows:
+        return []
+    keys = tuple(rows[0]._fields)
+    return [dict(zip(keys, row)) for row in rows]
+
+def dumps(rows):
+    return orjson.dumps(row_dicts(rows))
+
+# A JSON response for an already serialized body, keeping the headers (ETag,
+# X-Next-Cursor) set on the route's injected response, which FastAPI drops when
+# a Response is returned
+def _response(response: Response, body: bytes):
+    fast = Response(body, status_code=response.status_code or 200, media_type="application/json")
+    fast.headers.raw.extend((name, value) for name, value in response.headers.raw if name not in (b"content-length", b"content-type"))
+    return fast
+
+def rows_response(response: Response, rows):
+    return _response(response, dumps(rows))
+
+# Same for JSON-ready content (dicts, lists, dates) built by the route
+def json_response(response: Response, content):
+    return _response(response, orjson.dumps(content))
@@ -0,0 +1,66 @@
+from sqlalchemy.orm import joinedload, selectinload
+from models import Sport, Athlete, Result, MAX_EMBEDDED_RESULTS
+import schemas
+
+# Optional ?include= expansion of related rows on the read endpoints.
+#
+# Each include adds one eager loader to the page query, so a page costs a fixed
+# number of queries whatever its size: the single sport/athlete of a result is
+# joined in (joinedload), and the results of a sport/athlete come from one
+# selectinload query over the page's ids, capped at MAX_EMBEDDED_RESULTS newest
+# results per parent (see models.py).
+
+# Include names accepted per resource, with their loader options
+LOADERS = {
+    "sports": {"results": lambda: selectinload(Sport.recent_results)},
+    "athletes": {"results": lambda: selectinload(Athlete.recent_results)},
+    "results": {
+        "sport": lambda: joinedload(Result.sport),
+        "athlete": lambda: joinedload(Result.athlete),
+    },
+}
+
+# The table each include reads, for etag.conditional
+TABLES = {"results": "results", "sport": "sports", "athlete": "athletes"}
+
+# Response fields per resource and per embedded relationship
+SCHEMAS = {"sports": schemas.Sport, "athletes": schemas.Athlete, "results": schemas.Result}
+EMBEDDED = {
+    "results": ("recent_results", schemas.Result),
+    "sport": ("sport", schemas.Sport),
+    "athlete": ("athlete", schemas.Athlete),
+}
+
+
+# Parse a comma separated ?include= value for one resource
+def parse_include(value: str, kind: str):
+    if not value:
+        return ()
+    names = tuple(dict.fromkeys(name.strip() for name in value.split(",") if name.strip()))
+    unknown = [name for name in names if name not in LOADERS[kind]]
+    if unknown:
+        raise ValueError(f"Unknown include for {kind}: {', '.join(unknown)} (allowed: {', '.join(LOADERS[kind])})")
+    return names
+
+def options(kind: str, include):
+    return [LOADERS[kind][name]() for name in include]
+
+def _fields(instance, schema):
+    return {name: getattr(instance, name) for name in schema.model_fields}
+
+# A loaded instance with its includes as a JSON-ready dict (see fastjson.json_response)
+def dump(instance, kind: str, include):
+    content = _fields(instance, SCHEMAS[kind])
+    for name in include:
+        attribute, schema = EMBEDDED[name]
+        related = getattr(instance, attribute)
+        if related is None:
+            content[name] = None
+        elif isinstance(related, list):
+            content[name] = [_fields(child, schema) for child in related]
+        else:
+            content[name] = _fields(related, schema)
+    return content
+
+def dump_all(instances, kind: str, include):
+    return [dump(instance, kind, include) for instance in instances]
@@ -0,0 +1,131 @@
+import json
+import re
+import operator
+from decimal import Decimal, InvalidOperation
+from sqlalchemy import Numeric, Boolean, and_, bindparam, func, literal_column, true
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+
+# Filters on Result.additional_info.
+#
+# On PostgreSQL the column is JSONB: containment (`info[weather]=Rainy`) renders as
+# `@>` and is served by the jsonb_path_ops GIN index, and numeric ranges
+# (`info[audience_size][gt]=1000`) compare a guarded numeric extraction that has an
+# expression index for the keys in INDEXED_NUMBER_KEYS. SQLite gets the same
+# semantics through json_extract/json_type.
+
+# additional_info keys with a B-tree expression index for range filters
+INDEXED_NUMBER_KEYS = ("audience_size",)
+
+RANGE_OPS = {
+    "gt": operator.gt,
+    "gte": operator.ge,
+    "lt": operator.lt,
+    "lte": operator.le,
+}
+
+_KEY = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+_PARAM = re.compile(r"^info\[([^\]]*)\](?:\[([a-z]+)\])?$")
+
+
+class info_number(FunctionElement):
+    """Numeric value of a top-level key, NULL when missing or not a number."""
+
+    type = Numeric()
+    inherit_cache = True
+
+    def __init__(self, column, key: str):
+        if not _KEY.match(key):
+            raise ValueError(f"Invalid info key: {key}")
+        # The key is rendered inline so the expression matches its index on every driver
+        super().__init__(column, literal_column(key))
+
+
+class info_contains(FunctionElement):
+    """True when the column contains every key/value pair of a flat mapping."""
+
+    type = Boolean()
+    # The SQLite form depends on the mapping's keys, which a cache key would not see
+    inherit_cache = False
+
+    def __init__(self, column, mapping: dict):
+        self.mapping = mapping
+        super().__init__(column, bindparam("info_contains", json.dumps(mapping, sort_keys=True)))
+
+
+def _parts(element):
+    return element.clauses.clauses
+
+@compiles(info_number)
+def _info_number_default(element, compiler, **kw):
+    column, key = _parts(element)
+    column = compiler.process(column, **kw)
+    path = f"'$.{key.name}'"
+    return (
+        f"CASE WHEN json_type({column}, {path}) IN ('integer', 'real') "
+        f"THEN json_extract({column}, {path}) END"
+    )
+
+@compiles(info_number, "postgresql")
+def _info_number_postgresql(element, compiler, **kw):
+    column, key = _parts(element)
+    column = compiler.process(column, **kw)
+    return (
+        f"(CASE WHEN jsonb_typeof({column} -> '{key.name}') = 'number' "
+        f"THEN ({column} ->> '{key.name}')::numeric END)"
+    )
+
+@compiles(info_contains)
+def _info_contains_default(element, compiler, **kw):
+    column, _ = _parts(element)
+    conditions = [func.json_extract(column, f'$."{key}"') == value for key, value in element.mapping.items()]
+    return compiler.process(and_(true(), *conditions), **kw)
+
+@compiles(info_contains, "postgresql")
+def _info_contains_postgresql(element, compiler, **kw):
+    column, mapping = _parts(element)
+    return f"{compiler.process(column, **kw)} @> CAST({compiler.process(mapping, **kw)} AS JSONB)"
+
+
+# Query values are strings; numbers, booleans and null are matched as JSON values
+def _json_value(raw: str):
+    try:
+        value = json.loads(raw)
+    except ValueError:
+        return raw
+    return value if isinstance(value, (int, float, bool)) or value is None else raw
+
+# Split info[key]=value and info[key][op]=number query parameters into containment and ranges
+def parse_info_params(items):
+    contains = {}
+    ranges = []
+    for name, raw in items:
+        if not name.startswith("info["):
+            continue
+        match = _PARAM.match(name)
+        if not match or not _KEY.match(match.group(1)):
+            raise ValueError(f"Invalid info filter: {name}")
+        key, op = match.groups()
+        if op is None:
+            contains[key] = _json_value(raw)
+            continue
+        if op not in RANGE_OPS:
+            raise ValueError(f"Invalid info filter operator: {op}")
+        # Decimal so the bound value stays NUMERIC and the comparison can use the expression index
+        try:
+            value = Decimal(raw)
+        except InvalidOperation:
+            value = None
+        if value is None or not value.is_finite():
+            raise ValueError(f"{name} must be a number")
+        ranges.append((key, op, value))
+    return contains, ranges
+
+# WHERE conditions for parsed info filters
+def info_conditions(column, contains: dict = None, ranges=None):
+    conditions = []
+    if contains:
+        conditions.append(info_contains(column, contains))
+    for key, op, value in ranges or ():
+        conditions.append(RANGE_OPS[op](info_number(column, key), value))
+    return conditions
@@ -0,0 +1,321 @@
+import asyncio
+import os
+import threading
+import time
+import uuid
+import orjson
+from fastapi import APIRouter, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
+from cache import FakeRedis
+from database import BackgroundSession
+import argparse
+import crud
+import logging
+import metrics
+import pagination
+
+logger = logging.getLogger(__name__)
+
+# Background jobs for heavy aggregate queries.
+#
+# POST /jobs/{name} queues a job and answers 202 with its id right away; the
+# client polls GET /jobs/{id} or follows GET /jobs/{id}/stream (NDJSON status
+# lines, then one line per result row). A fixed pool of JOB_WORKERS threads runs
+# the jobs on sessions from the background pool (database.BackgroundSession), apart
+# from the request threadpool and its connections. A worker that hits a broker or
+# database error marks its job failed where it can and carries on. Job records live in a broker with a TTL: finished jobs are kept
+# for JOB_RESULT_TTL_SECONDS, then expire. At most JOB_MAX_QUEUED jobs wait;
+# beyond that submissions get 503 with Retry-After.
+#
+# JOB_BACKEND picks the broker:
+#   memory - LocalBroker, an in-process stand-in for Redis; jobs run in this process
+#   redis  - a shared Redis at JOB_REDIS_URL; any process can run the workers, e.g.
+#
+#       JOB_BACKEND=redis python jobs.py worker --concurrency 4
+#
+#   with JOB_WORKERS=0 on the API processes so they only submit and read.
+
+JOB_BACKEND = os.getenv("JOB_BACKEND", "memory")  # memory | redis
+JOB_REDIS_URL = os.getenv("JOB_REDIS_URL", "redis://localhost:6379/1")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_MAX_QUEUED = int(os.getenv("JOB_MAX_QUEUED", "100"))
+JOB_RESULT_TTL_SECONDS = float(os.getenv("JOB_RESULT_TTL_SECONDS", "600"))
+# Upper bound on how long a queued or running job record is kept
+JOB_PENDING_TTL_SECONDS = float(os.getenv("JOB_PENDING_TTL_SECONDS", "3600"))
+JOB_STREAM_TIMEOUT_SECONDS = float(os.getenv("JOB_STREAM_TIMEOUT_SECONDS", "300"))
+JOB_POLL_SECONDS = 0.2
+# Pause after a worker error, so a broker outage does not turn into a busy loop
+JOB_ERROR_BACKOFF_SECONDS = 1.0
+
+QUEUE_KEY = "jobs:queue"
+
+JOBS_SUBMITTED = metrics.Counter("jobs_submitted_total", "Background jobs accepted")
+JOBS_REJECTED = metrics.Counter("jobs_rejected_total", "Background jobs refused because the queue was full")
+JOBS_FINISHED = metrics.Counter("jobs_finished_total", "Background jobs finished, by status")
+JOB_DURATION = metrics.Histogram("job_duration_seconds", "Background job run time")
+JOBS_RUNNING = metrics.Gauge("jobs_running", "Background jobs currently running in this process")
+
+# Job name -> (function of a session, accepted parameters and their types)
+JOBS = {
+    "athletes_detailed": (crud.get_athletes_with_results, {"skip": int, "limit": int}),
+    "athletes_by_country": (crud.group_athletes_by_country, {}),
+    "sports_by_unit": (crud.group_sports_by_unit, {}),
+    "sports_with_result_counts": (crud.get_sports_with_result_counts, {}),
+    "results_by_sport": (crud.group_results_by_sport, {}),
+}
+
+
+# Bounds of the paging parameters, as on the HTTP routes: (minimum, maximum or None)
+PARAM_BOUNDS = {"skip": (0, None), "limit": (1, pagination.MAX_LIMIT)}
+
+
+class QueueFull(Exception):
+    pass
+
+
+class LocalBroker(FakeRedis):
+    """In-process stand-in for the Redis list commands the job queue uses."""
+
+    def __init__(self):
+        super().__init__()
+        self.lock = threading.Condition()
+        self.lists = {}
+
+    def set(self, key, value, ex=None, nx=False):
+        with self.lock:
+            # Drop expired records as new ones arrive, so finished jobs do not pile up
+            now = time.monotonic()
+            for stale in [k for k, (_, expires_at) in self.data.items() if expires_at is not None and expires_at < now]:
+                del self.data[stale]
+            return super().set(key, value, ex=ex, nx=nx)
+
+    def rpush(self, key, value):
+        with self.lock:
+            self.lists.setdefault(key, []).append(value)
+            self.lock.notify()
+            return len(self.lists[key])
+
+    def blpop(self, keys, timeout=0):
+        deadline = time.monotonic() + timeout if timeout else None
+        with self.lock:
+            while True:
+                for key in keys:
+                    if self.lists.get(key):
+                        return key, self.lists[key].pop(0)
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self.lock.wait(remaining)
+
+    def llen(self, key):
+        with self.lock:
+            return len(self.lists.get(key, ()))
+
+
+def _text(value):
+    return value.decode() if isinstance(value, bytes) else value
+
+# Validate query parameters against a job's accepted parameters
+def parse_params(name: str, values: dict):
+    if name not in JOBS:
+        raise KeyError(name)
+    accepted = JOBS[name][1]
+    unknown = [key for key in values if key not in accepted]
+    if unknown:
+        raise ValueError(f"Unknown parameters for {name}: {', '.join(unknown)}")
+    try:
+        params = {key: accepted[key](value) for key, value in values.items()}
+    except ValueError:
+        raise ValueError(f"Invalid parameters for {name}: {values}")
+    for key, value in params.items():
+        low, high = PARAM_BOUNDS.get(key, (None, None))
+        if low is not None and value < low:
+            raise ValueError(f"{key} must be at least {low}")
+        if high is not None and value > high:
+            raise ValueError(f"{key} must be at most {high}")
+    return params
+
+
+class JobQueue:
+    """Job records and the pending queue in a broker, plus this process's worker pool."""
+
+    def __init__(self, broker, workers: int = JOB_WORKERS):
+        self.broker = broker
+        self.workers = workers
+        self.threads = []
+        self.stopping = threading.Event()
+        self.start_lock = threading.Lock()
+
+    def get(self, job_id: str):
+        raw = self.broker.get(f"job:{job_id}")
+        return None if raw is None else orjson.loads(raw)
+
+    def _save(self, job, ttl: float):
+        self.broker.set(f"job:{job['id']}", orjson.dumps(job), ex=max(1, int(ttl)))
+
+    def submit(self, name: str, params: dict):
+        if self.broker.llen(QUEUE_KEY) >= JOB_MAX_QUEUED:
+            JOBS_REJECTED.inc(job=name)
+            raise QueueFull(name)
+        job = {"id": uuid.uuid4().hex, "name": name, "params": params, "status": "queued", "submitted_at": time.time()}
+        self._save(job, JOB_PENDING_TTL_SECONDS)
+        self.broker.rpush(QUEUE_KEY, job["id"])
+        JOBS_SUBMITTED.inc(job=name)
+        self.start()
+        return job
+
+    def run(self, job_id: str):
+        job = self.get(job_id)
+        if job is None:
+            return
+        function = JOBS[job["name"]][0]
+        job.update(status="running", started_at=time.time())
+        self._save(job, JOB_PENDING_TTL_SECONDS)
+        JOBS_RUNNING.inc()
+        session = BackgroundSession()
+        try:
+            job.update(status="done", result=list(function(session, **job["params"])))
+        except Exception as e:
+            logger.exception("Job %s (%s) failed", job_id, job["name"])
+            job.update(status="failed", error=str(e))
+        finally:
+            session.close()
+            JOBS_RUNNING.dec()
+        job["finished_at"] = time.time()
+        JOBS_FINISHED.inc(job=job["name"], status=job["status"])
+        JOB_DURATION.observe(job["finished_at"] - job["started_at"], job=job["name"])
+        self._save(job, JOB_RESULT_TTL_SECONDS)
+
+    # Record a job as failed after an error outside its query, if the broker lets us
+    def _fail(self, job_id: str, error: str):
+        try:
+            job = self.get(job_id) or {"id": job_id}
+            job.update(status="failed", error=error, finished_at=time.time())
+            self._save(job, JOB_RESULT_TTL_SECONDS)
+            JOBS_FINISHED.inc(job=job.get("name", "unknown"), status="failed")
+        except Exception:
+            logger.exception("Could not mark job %s as failed", job_id)
+
+    def _work(self):
+        while not self.stopping.is_set():
+            job_id = None
+            try:
+                item = self.broker.blpop([QUEUE_KEY], timeout=1)
+                if item is not None:
+                    job_id = _text(item[1])
+                    self.run(job_id)
+            except Exception as e:
+                logger.exception("Job worker error")
+                if job_id is not None:
+                    self._fail(job_id, str(e))
+                self.stopping.wait(JOB_ERROR_BACKOFF_SECONDS)
+
+    # Start this process's workers, replacing any that died
+    def start(self):
+        with self.start_lock:
+            self.threads = [thread for thread in self.threads if thread.is_alive()]
+            if len(self.threads) >= self.workers:
+                return
+            self.stopping.clear()
+            new = [threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True) for i in range(len(self.threads), self.workers)]
+            for thread in new:
+                thread.start()
+            self.threads += new
+
+    def stop(self):
+        self.stopping.set()
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+
+
+def make_queue(name: str = JOB_BACKEND):
+    if name == "redis":
+        import redis
+
+        return JobQueue(redis.Redis.from_url(JOB_REDIS_URL))
+    return JobQueue(LocalBroker())
+
+queue = make_queue()
+
+
+router = APIRouter(prefix="/jobs", tags=["Jobs"])
+
+# Run a broker call off the event loop; the in-process broker never blocks, so it runs inline
+async def _off_loop(function, *args):
+    if isinstance(queue.broker, LocalBroker):
+        return function(*args)
+    return await asyncio.to_thread(function, *args)
+
+def _status(job):
+    return {key: value for key, value in job.items() if key != "result"}
+
+# Queue a job; its parameters are the query parameters
+@router.post("/{name}", status_code=202, response_model=dict)
+async def submit_job(name: str, request: Request, response: Response):
+    try:
+        params = parse_params(name, dict(request.query_params))
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {name} (available: {', '.join(JOBS)})")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        job = await _off_loop(queue.submit, name, params)
+    except QueueFull:
+        raise HTTPException(status_code=503, detail="Job queue is full", headers={"Retry-After": "5"})
+    response.headers["Location"] = f"/jobs/{job['id']}"
+    return job
+
+# A job's status, with its result once done
+@router.get("/{job_id}", response_model=dict)
+async def read_job(job_id: str):
+    job = await _off_loop(queue.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    return job
+
+async def _follow(job_id: str):
+    deadline = time.monotonic() + JOB_STREAM_TIMEOUT_SECONDS
+    status = None
+    while True:
+        job = await _off_loop(queue.get, job_id)
+        if job is None:
+            yield orjson.dumps({"id": job_id, "status": "expired"}) + b"\n"
+            return
+        if job["status"] != status:
+            status = job["status"]
+            yield orjson.dumps(_status(job)) + b"\n"
+        if status == "done":
+            for row in job["result"]:
+                yield orjson.dumps(row) + b"\n"
+            return
+        if status == "failed":
+            return
+        if time.monotonic() > deadline:
+            yield orjson.dumps({"id": job_id, "status": "timeout"}) + b"\n"
+            return
+        await asyncio.sleep(JOB_POLL_SECONDS)
+
+# Stream a job as NDJSON: a line per status change, then one line per result row
+@router.get("/{job_id}/stream")
+async def stream_job(job_id: str):
+    if await _off_loop(queue.get, job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    return StreamingResponse(_follow(job_id), media_type="application/x-ndjson")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Background job worker.")
+    parser.add_argument("command", choices=["worker"])
+    parser.add_argument("--concurrency", type=int, default=JOB_WORKERS, help="worker threads")
+    args = parser.parse_args()
+
+    queue.workers = max(args.concurrency, 1)
+    queue.start()
+    logger.info("Running %d job workers on the %s backend", queue.workers, JOB_BACKEND)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        queue.stop()
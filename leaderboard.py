@@ -0,0 +1,226 @@
+from sqlalchemy import event, inspect, select, delete, exists, func, case, and_, or_, true
+from sqlalchemy.orm import Session, aliased
+from models import Sport, Athlete, Result, LeaderboardEntry
+import argparse
+import logging
+import cache
+
+logger = logging.getLogger(__name__)
+
+# Units where a smaller performance is better (times); everything else is higher-is-better
+LOWER_IS_BETTER_UNITS = ("seconds", "minutes", "hours", "milliseconds")
+
+leaderboard = LeaderboardEntry.__table__
+
+
+def lower_is_better(unit: str):
+    return unit in LOWER_IS_BETTER_UNITS
+
+def dialect_insert(conn):
+    if conn.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert
+
+def best_of(conn, lower: bool):
+    # LEAST/GREATEST on PostgreSQL, the scalar forms of min/max on SQLite
+    if conn.dialect.name == "postgresql":
+        return func.least if lower else func.greatest
+    return func.min if lower else func.max
+
+def _units(conn, sport_ids):
+    rows = conn.execute(select(Sport.id, Sport.unit).where(Sport.id.in_(sport_ids))).all()
+    return {sport_id: unit for sport_id, unit in rows}
+
+# Merge new (sport_id, athlete_id, performance) triples into the leaderboard with upserts
+def apply_results(conn, triples):
+    triples = [t for t in triples if t[0] is not None and t[1] is not None and t[2] is not None]
+    if not triples:
+        return
+    units = _units(conn, {sport_id for sport_id, _, _ in triples})
+    best = {True: {}, False: {}}
+    for sport_id, athlete_id, performance in triples:
+        lower = lower_is_better(units.get(sport_id))
+        pick = min if lower else max
+        key = (sport_id, athlete_id)
+        current = best[lower].get(key)
+        best[lower][key] = performance if current is None else pick(current, performance)
+
+    insert = dialect_insert(conn)
+    for lower, pairs in best.items():
+        if not pairs:
+            continue
+        stmt = insert(leaderboard)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[leaderboard.c.sport_id, leaderboard.c.athlete_id],
+            set_={"best_performance": best_of(conn, lower)(leaderboard.c.best_performance, stmt.excluded.best_performance)},
+        )
+        conn.execute(stmt, [
+            {"sport_id": sport_id, "athlete_id": athlete_id, "best_performance": value}
+            for (sport_id, athlete_id), value in pairs.items()
+        ])
+
+# Recompute one athlete's entry for one sport from its results (after an update or delete).
+# The entry is locked first, so a concurrent apply_results for the pair has committed
+# before the aggregate runs, and the value is written with an upsert, so an entry
+# inserted concurrently is overwritten rather than raising a duplicate key error.
+def refresh_pair(conn, sport_id: int, athlete_id: int):
+    if sport_id is None or athlete_id is None:
+        return
+    where = and_(leaderboard.c.sport_id == sport_id, leaderboard.c.athlete_id == athlete_id)
+    conn.execute(select(leaderboard.c.sport_id).where(where).with_for_update())
+    unit = _units(conn, [sport_id]).get(sport_id)
+    aggregate = func.min if lower_is_better(unit) else func.max
+    value = conn.execute(
+        select(aggregate(Result.performance)).where(Result.sport_id == sport_id, Result.athlete_id == athlete_id)
+    ).scalar()
+    if value is None:
+        conn.execute(delete(leaderboard).where(where))
+        return
+    stmt = dialect_insert(conn)(leaderboard).values(sport_id=sport_id, athlete_id=athlete_id, best_performance=value)
+    conn.execute(stmt.on_conflict_do_update(
+        index_elements=[leaderboard.c.sport_id, leaderboard.c.athlete_id],
+        set_={"best_performance": stmt.excluded.best_performance},
+    ))
+
+# Rebuild the whole leaderboard, or one sport, from results with set-based statements.
+# Like refresh_pair it locks the entries and upserts, so it cannot race a concurrent
+# incremental update into a duplicate key; entries without results are then dropped.
+def rebuild(conn, sport_id: int = None):
+    scope = true() if sport_id is None else leaderboard.c.sport_id == sport_id
+    conn.execute(select(leaderboard.c.sport_id).where(scope).with_for_update())
+
+    best = case(
+        (Sport.unit.in_(LOWER_IS_BETTER_UNITS), func.min(Result.performance)),
+        else_=func.max(Result.performance),
+    )
+    query = (
+        select(Result.sport_id, Result.athlete_id, best)
+        .join(Sport, Sport.id == Result.sport_id)
+        .where(Result.athlete_id.isnot(None))
+        .group_by(Result.sport_id, Result.athlete_id, Sport.unit)
+    )
+    if sport_id is not None:
+        query = query.where(Result.sport_id == sport_id)
+    stmt = dialect_insert(conn)(leaderboard).from_select(["sport_id", "athlete_id", "best_performance"], query)
+    conn.execute(stmt.on_conflict_do_update(
+        index_elements=[leaderboard.c.sport_id, leaderboard.c.athlete_id],
+        set_={"best_performance": stmt.excluded.best_performance},
+    ))
+
+    has_results = exists(
+        select(Result.id)
+        .join(Sport, Sport.id == Result.sport_id)
+        .where(Result.sport_id == leaderboard.c.sport_id, Result.athlete_id == leaderboard.c.athlete_id)
+    )
+    conn.execute(delete(leaderboard).where(scope, ~has_results))
+
+
+def _changed_pairs(obj):
+    state = inspect(obj)
+    sport_history = state.attrs.sport_id.history
+    athlete_history = state.attrs.athlete_id.history
+    sport_ids = set(sport_history.deleted or ()) | {obj.sport_id}
+    athlete_ids = set(athlete_history.deleted or ()) | {obj.athlete_id}
+    return {(s, a) for s in sport_ids for a in athlete_ids}
+
+# Keep the leaderboard in step with ORM writes to results and sports, in the same transaction
+@event.listens_for(Session, "after_flush")
+def _after_flush(session, flush_context):
+    created = []
+    stale_pairs = set()
+    stale_sports = set()
+    for obj in session.new:
+        if isinstance(obj, Result):
+            created.append((obj.sport_id, obj.athlete_id, obj.performance))
+    for obj in session.dirty:
+        if isinstance(obj, Result) and session.is_modified(obj):
+            stale_pairs |= _changed_pairs(obj)
+        elif isinstance(obj, Sport) and inspect(obj).attrs.unit.history.has_changes():
+            stale_sports.add(obj.id)
+    for obj in session.deleted:
+        if isinstance(obj, Result):
+            stale_pairs.add((obj.sport_id, obj.athlete_id))
+    if not (created or stale_pairs or stale_sports):
+        return
+
+    conn = session.connection()
+    apply_results(conn, created)
+    for sport_id, athlete_id in stale_pairs:
+        if sport_id not in stale_sports:
+            refresh_pair(conn, sport_id, athlete_id)
+    for sport_id in stale_sports:
+        rebuild(conn, sport_id)
+
+
+# Top athletes of a sport, best first
+def top(db: Session, sport_id: int, limit: int = 10, offset: int = 0):
+    sport = db.get(Sport, sport_id)
+    if sport is None:
+        return None
+    order = LeaderboardEntry.best_performance.asc() if lower_is_better(sport.unit) else LeaderboardEntry.best_performance.desc()
+    query = (
+        select(
+            func.rank().over(order_by=order).label("rank"),
+            LeaderboardEntry.athlete_id,
+            Athlete.full_name,
+            Athlete.country,
+            LeaderboardEntry.best_performance,
+        )
+        .join(Athlete, Athlete.id == LeaderboardEntry.athlete_id)
+        .where(LeaderboardEntry.sport_id == sport_id)
+        .order_by(order, LeaderboardEntry.athlete_id)
+        .offset(offset)
+        .limit(limit)
+    )
+    return [dict(row._mapping) for row in db.execute(query)]
+
+# An athlete's rank in every sport they have results in
+def athlete_ranks(db: Session, athlete_id: int):
+    other = aliased(LeaderboardEntry)
+    lower = Sport.unit.in_(LOWER_IS_BETTER_UNITS)
+    better = (
+        select(func.count())
+        .where(
+            other.sport_id == LeaderboardEntry.sport_id,
+            or_(
+                and_(lower, other.best_performance < LeaderboardEntry.best_performance),
+                and_(~lower, other.best_performance > LeaderboardEntry.best_performance),
+            ),
+        )
+        .scalar_subquery()
+    )
+    query = (
+        select(
+            LeaderboardEntry.sport_id,
+            Sport.name.label("sport_name"),
+            Sport.unit,
+            LeaderboardEntry.best_performance,
+            (better + 1).label("rank"),
+        )
+        .join(Sport, Sport.id == LeaderboardEntry.sport_id)
+        .where(LeaderboardEntry.athlete_id == athlete_id)
+        .order_by(LeaderboardEntry.sport_id)
+    )
+    return [dict(row._mapping) for row in db.execute(query)]
+
+
+if __name__ == "__main__":
+    from database import SessionLocal
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Leaderboard maintenance.")
+    parser.add_argument("command", choices=["rebuild"])
+    parser.add_argument("--sport-id", type=int, default=None, help="only rebuild this sport")
+    args = parser.parse_args()
+
+    session = SessionLocal()
+    try:
+        rebuild(session.connection(), args.sport_id)
+        # Outside the ORM, so the cached leaderboards and ETags need telling
+        cache.mark_changed(session, leaderboard.name)
+        session.commit()
+        logger.info("Leaderboard rebuilt")
+    finally:
+        session.close()
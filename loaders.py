@@ -0,0 +1,26 @@
+from fastapi import Depends
+from sqlalchemy.orm import Session
+from batch import AsyncLoader
+from database import read_db, run_in_session
+import crud
+
+# Request-scoped id loaders (see batch.py) as route dependencies. FastAPI caches a
+# dependency for the duration of a request, so every dependant of the same
+# request shares one Loaders and its batches and cache:
+#
+#     async def route(loaders: Loaders = Depends(get_loaders)):
+#         athletes = await asyncio.gather(*[loaders.athletes.load(row.athlete_id) for row in rows])
+#         names = [athlete.full_name for athlete in athletes]  # one query
+
+
+class Loaders:
+    """One loader per resource, over the request's read session (sync or async)."""
+
+    def __init__(self, db: Session):
+        self.sports = AsyncLoader(lambda ids: run_in_session(db, crud.get_sports_by_ids, ids))
+        self.athletes = AsyncLoader(lambda ids: run_in_session(db, crud.get_athletes_by_ids, ids))
+        self.results = AsyncLoader(lambda ids: run_in_session(db, crud.get_results_by_ids, ids))
+
+
+def get_loaders(db: Session = Depends(read_db)):
+    return Loaders(db)
@@ -1,12 +1,28 @@
-from fastapi import FastAPI
+import os
+from fastapi import FastAPI, Response
 from sqlalchemy.orm import Session
 from routers import athletes, results, sports  # Import the respective routers
 from database import engine, get_db  # Import engine and get_db
 import models
+import schema_check
+import search
+import analytics
+import jobs
+import metrics
+import sqlprofile
+import admission
 import uvicorn
 
-# Create the database tables
-models.Base.metadata.create_all(bind=engine)
+# Schema setup at import: "create_all" creates missing tables (development), "check"
+# only verifies the Alembic head revision, "none" leaves it to the launcher (serve.py).
+# Except with "none", the SQLite search mirror (search.py) is created here too.
+SCHEMA_MODE = os.getenv("SCHEMA_MODE", "create_all")
+if SCHEMA_MODE == "create_all":
+    models.Base.metadata.create_all(bind=engine)
+elif SCHEMA_MODE == "check":
+    schema_check.check_head(engine)
+if SCHEMA_MODE != "none":
+    search.prepare(engine)
 
 # Initialize the FastAPI app
 app = FastAPI(
@@ -15,16 +31,37 @@ app = FastAPI(
     version="1.0.0",
 )
 
-# Include the routers for sports, athletes, and results
+# Sampled per-request SQL statement counts and timings, see sqlprofile.py
+app.add_middleware(sqlprofile.SQLProfileMiddleware)
+
+# Per-route-class concurrency limits and load shedding, see admission.py; added last so
+# it runs first and shed requests skip the rest of the stack
+app.add_middleware(admission.AdmissionMiddleware)
+
+# Include the routers for sports, athletes, and results; they run on the sync (threadpool)
+# or async (asyncpg) request stack picked by DB_MODE, see database.py
 app.include_router(sports.router, prefix="/sports", tags=["Sports"])
 app.include_router(athletes.router, prefix="/athletes", tags=["Athletes"])
 app.include_router(results.router, prefix="/results", tags=["Results"])
+app.include_router(search.router, tags=["Search"])
+app.include_router(analytics.router)
+app.include_router(jobs.router)
 
 # Root endpoint
 @app.get("/")
 def read_root():
     return {"message": "Welcome to the Sports API!"}
 
+# Prometheus scrape endpoint for this worker
+@app.get("/metrics", include_in_schema=False)
+def read_metrics():
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+# Per-route SQL statistics collected by the profiling middleware
+@app.get("/debug/sql-stats", include_in_schema=False)
+def read_sql_stats():
+    return sqlprofile.snapshot()
+
 if __name__ == "__main__":
     # Run the FastAPI app using uvicorn
     uvicorn.run(app, host="127.0.0.1", port=8000, reload=True)
@@ -0,0 +1,100 @@
+import threading
+
+# Minimal Prometheus text-format metrics, shared by the modules that export counters.
+# Values are per process; scrape each worker separately.
+
+_lock = threading.Lock()
+REGISTRY = []
+
+
+def _label_key(labels: dict):
+    return tuple(sorted(labels.items()))
+
+def _format_labels(key):
+    if not key:
+        return ""
+    body = ",".join(f'{name}="{value}"' for name, value in key)
+    return "{" + body + "}"
+
+
+class Counter:
+    """Monotonic counter, optionally split by labels."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self.values = {}
+        REGISTRY.append(self)
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(labels)
+        with _lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self.values.get(_label_key(labels), 0)
+
+    def samples(self):
+        for key, value in list(self.values.items()):
+            yield self.name, key, value
+
+
+class Gauge(Counter):
+    """Value that can go up and down."""
+
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with _lock:
+            self.values[_label_key(labels)] = value
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram:
+    """Cumulative bucket histogram, optionally split by labels."""
+
+    kind = "histogram"
+    DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+    def __init__(self, name: str, documentation: str, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self.series = {}
+        REGISTRY.append(self)
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        with _lock:
+            counts, total = self.series.get(key, ([0] * len(self.buckets), [0, 0.0]))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            total[0] += 1
+            total[1] += value
+            self.series[key] = (counts, total)
+
+    def samples(self):
+        for key, (counts, total) in list(self.series.items()):
+            for bound, count in zip(self.buckets, counts):
+                yield f"{self.name}_bucket", key + (("le", bound),), count
+            yield f"{self.name}_bucket", key + (("le", "+Inf"),), total[0]
+            yield f"{self.name}_count", key, total[0]
+            yield f"{self.name}_sum", key, total[1]
+
+
+# Render every registered metric in the Prometheus text exposition format
+def render():
+    lines = []
+    for metric in REGISTRY:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for name, key, value in metric.samples():
+            lines.append(f"{name}{_format_labels(key)} {value}")
+    return "\n".join(lines) + "\n"
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
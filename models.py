@@ -1,6 +1,17 @@
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, JSON, Index
-from sqlalchemy.orm import relationship
+import os
+from datetime import date
+from sqlalchemy import Column, Integer, String, Float, Date, DateTime, ForeignKey, JSON, Index, DDL, event, func, literal_column, select
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import aliased, relationship, validates
 from database import Base
+from info_filters import INDEXED_NUMBER_KEYS, info_number
+
+# Accept ISO date strings wherever a result date is set
+def as_date(value):
+    if isinstance(value, str):
+        return date.fromisoformat(value)
+    return value
+
 
 class Sport(Base):
     __tablename__ = "sports"
@@ -28,21 +39,131 @@ class Athlete(Base):
     results = relationship("Result", back_populates="athlete")
 
 
+# On PostgreSQL the table is partitioned by event_date year (migration 0c5d1e7f3a92,
+# partitions.py) with primary key (id, event_date); ids still come from one sequence.
 class Result(Base):
     __tablename__ = "results"
 
     id = Column(Integer, primary_key=True, index=True)
     competition_name = Column(String, nullable=False)
     performance = Column(Float, nullable=False)
-    event_date = Column(String, nullable=False)
+    event_date = Column(Date, nullable=False)
     location = Column(String, nullable=False)
     sport_id = Column(Integer, ForeignKey("sports.id"))
     athlete_id = Column(Integer, ForeignKey("athletes.id"))
 
-    additional_info = Column(JSON, default={})#Statham
+    additional_info = Column(JSON().with_variant(JSONB(), 'postgresql'), default={})#Statham
 
     sport = relationship("Sport", back_populates="results")
     athlete = relationship("Athlete", back_populates="results")
 
-# Index for the `additional_info` column with GIN index
-Index('ix_results_additional_info', Result.additional_info, postgresql_using='gin')
+    @validates("event_date")
+    def validate_event_date(self, key, value):
+        return as_date(value)
+
+# The newest results of each sport and athlete, at most MAX_EMBEDDED_RESULTS per
+# parent, for ?include=results (see includes.py). The row_number() window caps
+# every parent inside the single query selectinload emits for a page. The cap is
+# applied in a subquery so the join stays a plain foreign key: selectinload then
+# filters on `<fk> IN (...)`, which the database pushes below the window
+# (it partitions by that column) instead of ranking the whole table.
+MAX_EMBEDDED_RESULTS = int(os.getenv("MAX_EMBEDDED_RESULTS", "20"))
+
+def _recent_results(parent, foreign_key):
+    ranked = select(
+        Result,
+        func.row_number().over(partition_by=foreign_key, order_by=(Result.event_date.desc(), Result.id.desc())).label("position"),
+    ).subquery()
+    capped = select(ranked).where(ranked.c.position <= MAX_EMBEDDED_RESULTS).subquery()
+    recent = aliased(Result, capped)
+    return relationship(
+        recent,
+        primaryjoin=getattr(recent, foreign_key.key) == parent.id,
+        order_by=(recent.event_date.desc(), recent.id.desc()),
+        viewonly=True,
+    )
+
+# The write hooks (leaderboard.py, records.py, athlete_stats.py) read the previous values of
+# these columns from attribute history. Active history loads them when a column is set on
+# an instance whose attributes were expired, e.g. by a commit; otherwise the old value is
+# unknown and the sport, athlete or record it affected is missed.
+for column in (Result.sport_id, Result.athlete_id, Result.performance, Result.event_date, Result.competition_name):
+    event.listen(column, "set", lambda target, value, oldvalue, initiator: None, active_history=True)
+
+Sport.recent_results = _recent_results(Sport, Result.sport_id)
+Athlete.recent_results = _recent_results(Athlete, Result.athlete_id)
+
+# Index for the `additional_info` column with GIN index (containment queries, see info_filters.py)
+Index('ix_results_additional_info', Result.additional_info, postgresql_using='gin', postgresql_ops={'additional_info': 'jsonb_path_ops'})
+for key in INDEXED_NUMBER_KEYS:
+    Index(f'ix_results_info_{key}', info_number(Result.additional_info, key))
+
+# Composite indexes for the result filters and date ranges
+Index('ix_results_sport_performance', Result.sport_id, Result.performance)
+Index('ix_results_athlete_event_date', Result.athlete_id, Result.event_date)
+Index('ix_results_sport_event_date', Result.sport_id, Result.event_date)
+
+# Olympic results, for the olympic_record maintained by records.py. The pattern is
+# inlined so the partial index below matches on every driver.
+OLYMPIC_COMPETITION = func.lower(Result.competition_name).like(literal_column("'%olympic%'"))
+Index('ix_results_olympic_sport_performance', Result.sport_id, Result.performance,
+      postgresql_where=OLYMPIC_COMPETITION, sqlite_where=OLYMPIC_COMPETITION)
+
+# Trigram indexes for substring and fuzzy name search (see search.py); PostgreSQL only
+Index('ix_sports_name_trgm', Sport.name, postgresql_ops={'name': 'gin_trgm_ops'}, postgresql_using='gin').ddl_if(dialect='postgresql')
+Index('ix_athletes_full_name_trgm', Athlete.full_name, postgresql_ops={'full_name': 'gin_trgm_ops'}, postgresql_using='gin').ddl_if(dialect='postgresql')
+Index('ix_results_competition_name_trgm', Result.competition_name, postgresql_ops={'competition_name': 'gin_trgm_ops'}, postgresql_using='gin').ddl_if(dialect='postgresql')
+event.listen(Base.metadata, 'before_create', DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm').execute_if(dialect='postgresql'))
+
+
+# Best performance per athlete per sport, maintained by leaderboard.py
+class LeaderboardEntry(Base):
+    __tablename__ = "leaderboard"
+
+    sport_id = Column(Integer, ForeignKey("sports.id", ondelete="CASCADE"), primary_key=True)
+    athlete_id = Column(Integer, ForeignKey("athletes.id", ondelete="CASCADE"), primary_key=True)
+    best_performance = Column(Float, nullable=False)
+
+Index('ix_leaderboard_sport_best', LeaderboardEntry.sport_id, LeaderboardEntry.best_performance)
+Index('ix_leaderboard_athlete_id', LeaderboardEntry.athlete_id)
+
+
+# World and Olympic record changes, maintained by records.py. result_id has no
+# foreign key: on PostgreSQL results is partitioned and keyed by (id, event_date).
+class RecordHistory(Base):
+    __tablename__ = "record_history"
+
+    id = Column(Integer, primary_key=True)
+    sport_id = Column(Integer, ForeignKey("sports.id", ondelete="CASCADE"), nullable=False)
+    record = Column(String, nullable=False)  # world_record | olympic_record
+    value = Column(Float, nullable=True)
+    result_id = Column(Integer, nullable=True)
+    source = Column(String, nullable=False)  # result | recompute | manual | baseline
+    changed_at = Column(DateTime, server_default=func.now(), nullable=False)
+
+Index('ix_record_history_sport_record', RecordHistory.sport_id, RecordHistory.record, RecordHistory.id)
+
+
+# Per-athlete and per-athlete-per-sport result statistics, maintained by
+# athlete_stats.py. The mean is performance_sum / result_count; last_performance
+# is the performance of the latest (event_date, id) result.
+class AthleteStats(Base):
+    __tablename__ = "athlete_stats"
+
+    athlete_id = Column(Integer, ForeignKey("athletes.id", ondelete="CASCADE"), primary_key=True)
+    result_count = Column(Integer, nullable=False)
+    first_event_date = Column(Date, nullable=False)
+    last_event_date = Column(Date, nullable=False)
+
+
+class AthleteSportStats(Base):
+    __tablename__ = "athlete_sport_stats"
+
+    athlete_id = Column(Integer, ForeignKey("athletes.id", ondelete="CASCADE"), primary_key=True)
+    sport_id = Column(Integer, ForeignKey("sports.id", ondelete="CASCADE"), primary_key=True)
+    result_count = Column(Integer, nullable=False)
+    performance_sum = Column(Float, nullable=False)
+    best_performance = Column(Float, nullable=False)
+    last_performance = Column(Float, nullable=False)
+    first_event_date = Column(Date, nullable=False)
+    last_event_date = Column(Date, nullable=False)
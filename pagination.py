@@ -0,0 +1,102 @@
+import base64
+import json
+from datetime import date, datetime
+from sqlalchemy import and_, or_, tuple_
+
+# Largest page the list routes accept
+MAX_LIMIT = 1000
+
+
+class Page(list):
+    """A page of rows that also carries the cursor for the next page."""
+
+    def __init__(self, rows, next_cursor=None):
+        super().__init__(rows)
+        self.next_cursor = next_cursor
+
+
+# Encode the sort key of the last row on a page as an opaque cursor
+def encode_cursor(order_key: str, value, row_id: int) -> str:
+    payload = json.dumps([order_key, value, row_id], separators=(",", ":"), default=str)
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+# Decode a cursor produced by encode_cursor, checking it was issued for the same ordering
+def decode_cursor(cursor: str, order_key: str):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        key, value, row_id = json.loads(base64.urlsafe_b64decode(padded))
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+    if key != order_key:
+        raise ValueError("Cursor does not match the requested ordering")
+    return value, row_id
+
+# Resolve a client supplied sort field to a column, falling back to a default
+def sort_column(model, order_by: str, default):
+    if order_by in model.__table__.columns:
+        return getattr(model, order_by)
+    return default
+
+# Cursors carry dates as ISO strings; turn them back into values the column can bind
+def _cursor_value(order_column, value):
+    if isinstance(value, str):
+        try:
+            python_type = order_column.type.python_type
+        except NotImplementedError:
+            return value
+        if python_type in (date, datetime):
+            return python_type.fromisoformat(value)
+    return value
+
+# Build the WHERE clause that seeks past the last row of the previous page.
+# NULL sort values are always ordered last, so they need their own branch.
+# For NOT NULL columns the row comparison also gets a plain bound on the sort
+# column, which index range scans and partition pruning can use.
+def _seek(order_column, id_column, value, last_id, descending: bool):
+    if order_column is id_column:
+        return id_column < last_id if descending else id_column > last_id
+    if value is None:
+        after_id = id_column < last_id if descending else id_column > last_id
+        return and_(order_column.is_(None), after_id)
+    key = tuple_(order_column, id_column)
+    after_key = key < (value, last_id) if descending else key > (value, last_id)
+    if not getattr(order_column, "nullable", True):
+        bound = order_column <= value if descending else order_column >= value
+        return and_(bound, after_key)
+    return or_(after_key, order_column.is_(None))
+
+# Order a query or select() by (column, id) and restrict it to one page,
+# either by seeking from a cursor or by offset
+def keyset_query(query, order_column, id_column, descending: bool = False, cursor: str = None, skip: int = 0, limit: int = 100):
+    if order_column is id_column:
+        ordering = [id_column.desc() if descending else id_column.asc()]
+    elif descending:
+        ordering = [order_column.desc().nulls_last(), id_column.desc()]
+    else:
+        ordering = [order_column.asc().nulls_last(), id_column.asc()]
+    query = query.order_by(*ordering)
+
+    if cursor:
+        value, last_id = decode_cursor(cursor, order_column.key)
+        query = query.filter(_seek(order_column, id_column, _cursor_value(order_column, value), last_id, descending))
+    else:
+        query = query.offset(skip)
+    return query.limit(limit)
+
+# Wrap fetched rows in a Page, with a cursor if the page is full
+def build_page(rows, order_column, limit: int):
+    next_cursor = None
+    if rows and len(rows) == limit:
+        last = rows[-1]
+        next_cursor = encode_cursor(order_column.key, getattr(last, order_column.key), last.id)
+    return Page(rows, next_cursor)
+
+# Fetch one page of a Query
+def keyset_page(query, order_column, id_column, descending: bool = False, cursor: str = None, skip: int = 0, limit: int = 100):
+    rows = keyset_query(query, order_column, id_column, descending, cursor, skip, limit).all()
+    return build_page(rows, order_column, limit)
+
+# Expose the next page cursor on the HTTP response
+def set_next_cursor(response, page):
+    if getattr(page, "next_cursor", None):
+        response.headers["X-Next-Cursor"] = page.next_cursor
@@ -0,0 +1,134 @@
+from datetime import date
+from sqlalchemy import text
+import argparse
+import logging
+import cache
+import leaderboard
+import athlete_stats
+import records
+
+logger = logging.getLogger(__name__)
+
+# Yearly partitions of the results table (PostgreSQL only).
+#
+# Migration 0c5d1e7f3a92 turns `results` into a table partitioned by RANGE
+# (event_date), with one partition per calendar year plus a DEFAULT partition
+# that catches dates no yearly partition covers yet. This module creates
+# partitions ahead of time and detaches old ones, e.g. from cron:
+#
+#     python partitions.py create --ahead 2
+#     python partitions.py detach --before 2010 [--drop]
+
+PARENT = "results"
+DEFAULT_PARTITION = "results_default"
+
+
+def partition_name(year: int):
+    return f"{PARENT}_y{year}"
+
+def _bounds(year: int):
+    return date(year, 1, 1).isoformat(), date(year + 1, 1, 1).isoformat()
+
+def is_partitioned(conn):
+    if conn.dialect.name != "postgresql":
+        return False
+    return conn.execute(text(
+        "SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid WHERE c.relname = :parent"
+    ), {"parent": PARENT}).first() is not None
+
+# Attached partitions as (name, bound expression), oldest first
+def list_partitions(conn):
+    rows = conn.execute(text(
+        "SELECT child.relname, pg_get_expr(child.relpartbound, child.oid) "
+        "FROM pg_inherits i "
+        "JOIN pg_class parent ON parent.oid = i.inhparent "
+        "JOIN pg_class child ON child.oid = i.inhrelid "
+        "WHERE parent.relname = :parent ORDER BY child.relname"
+    ), {"parent": PARENT}).all()
+    return [(name, bound) for name, bound in rows]
+
+def _has_partition(conn, name: str):
+    return any(existing == name for existing, _ in list_partitions(conn))
+
+# Create the partition for one year. Rows for that year that already landed in
+# the DEFAULT partition are moved into it, which PostgreSQL requires before the
+# new bounds can be attached.
+def create_partition(conn, year: int):
+    name = partition_name(year)
+    if _has_partition(conn, name):
+        return False
+    start, end = _bounds(year)
+    in_range = f"event_date >= '{start}' AND event_date < '{end}'"
+    has_default = _has_partition(conn, DEFAULT_PARTITION)
+    stray = has_default and conn.execute(text(f"SELECT 1 FROM {DEFAULT_PARTITION} WHERE {in_range} LIMIT 1")).first()
+    if stray:
+        conn.execute(text(f"ALTER TABLE {PARENT} DETACH PARTITION {DEFAULT_PARTITION}"))
+    conn.execute(text(f"CREATE TABLE {name} PARTITION OF {PARENT} FOR VALUES FROM ('{start}') TO ('{end}')"))
+    if stray:
+        conn.execute(text(f"INSERT INTO {name} SELECT * FROM {DEFAULT_PARTITION} WHERE {in_range}"))
+        conn.execute(text(f"DELETE FROM {DEFAULT_PARTITION} WHERE {in_range}"))
+        conn.execute(text(f"ALTER TABLE {PARENT} ATTACH PARTITION {DEFAULT_PARTITION} DEFAULT"))
+    logger.info("Created partition %s", name)
+    return True
+
+# Make sure partitions exist for the current year and the next `ahead` years
+def create_future_partitions(conn, ahead: int = 2, today: date = None):
+    year = (today or date.today()).year
+    return [y for y in range(year, year + ahead + 1) if create_partition(conn, y)]
+
+# Detach yearly partitions older than `before`. Detached tables keep their rows
+# as standalone archives unless drop is set.
+def detach_partitions(conn, before: int, drop: bool = False):
+    detached = []
+    for name, _ in list_partitions(conn):
+        if not name.startswith(f"{PARENT}_y"):
+            continue
+        year = int(name[len(PARENT) + 2:])
+        if year >= before:
+            continue
+        conn.execute(text(f"ALTER TABLE {PARENT} DETACH PARTITION {name}"))
+        if drop:
+            conn.execute(text(f"DROP TABLE {name}"))
+        logger.info("%s partition %s", "Dropped" if drop else "Detached", name)
+        detached.append(name)
+    if detached:
+        # Bests, statistics and records from the removed years must not linger
+        leaderboard.rebuild(conn)
+        athlete_stats.rebuild(conn)
+        records.recompute(conn)
+    return detached
+
+
+if __name__ == "__main__":
+    from database import SessionLocal
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Manage yearly partitions of the results table.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    create_parser = subparsers.add_parser("create", help="create partitions for the coming years")
+    create_parser.add_argument("--ahead", type=int, default=2, help="years after the current one to create")
+    create_parser.add_argument("--year", type=int, action="append", help="create this specific year (repeatable)")
+    detach_parser = subparsers.add_parser("detach", help="detach partitions of old years")
+    detach_parser.add_argument("--before", type=int, required=True, help="detach years strictly before this one")
+    detach_parser.add_argument("--drop", action="store_true", help="drop the detached tables instead of keeping them")
+    subparsers.add_parser("list", help="list attached partitions")
+    args = parser.parse_args()
+
+    session = SessionLocal()
+    try:
+        conn = session.connection()
+        if not is_partitioned(conn):
+            parser.exit(1, "results is not a partitioned table (PostgreSQL only, see migration 0c5d1e7f3a92)\n")
+        if args.command == "create":
+            years = args.year or []
+            created = [y for y in years if create_partition(conn, y)] + create_future_partitions(conn, args.ahead)
+            logger.info("Created %d partition(s)", len(created))
+        elif args.command == "detach":
+            if detach_partitions(conn, args.before, args.drop):
+                cache.mark_changed(session, PARENT)
+        else:
+            for name, bound in list_partitions(conn):
+                print(f"{name}\t{bound}")
+        session.commit()
+    finally:
+        session.close()
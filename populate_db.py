@@ -1,106 +1,206 @@
+from sqlalchemy import insert
 from sqlalchemy.orm import Session
+from concurrent.futures import ProcessPoolExecutor
 from database import SessionLocal
 from models import Sport, Athlete, Result
+from bulk import copy_rows
+import cache
+import leaderboard
+import athlete_stats
+import records
 from faker import Faker
+import argparse
+import os
 import random
+import time
 import logging
 
-faker = Faker()
-
 # Setup Logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def create_sports(session: Session, n=10):
+SPORTS_LIST = ["100m Dash", "Long Jump", "High Jump", "Shot Put", "Pole Vault",
+               "400m Hurdles", "Javelin Throw", "Discus Throw", "Marathon", "Decathlon"]
+
+# Ids handed to every worker process once, instead of with each chunk
+_worker_sport_ids = None
+_worker_athlete_ids = None
+
+
+def sport_name(i: int):
+    """Return a unique sport name for index i, cycling through SPORTS_LIST with a round suffix."""
+    base = SPORTS_LIST[i % len(SPORTS_LIST)]
+    round_no = i // len(SPORTS_LIST)
+    return base if round_no == 0 else f"{base} {round_no + 1}"
+
+def create_sports(session: Session, n=10, seed=0):
     """Create a batch of sports."""
     logger.info("Creating sports...")
-    sports_list = ["100m Dash", "Long Jump", "High Jump", "Shot Put", "Pole Vault",
-                   "400m Hurdles", "Javelin Throw", "Discus Throw", "Marathon", "Decathlon"]
-    for _ in range(n):
-        sport = Sport(
-            name=faker.unique.word() if n > len(sports_list) else sports_list.pop(),
-            unit=random.choice(["seconds", "meters", "kilograms"]),
-            world_record=round(random.uniform(5, 100), 2),
-            olympic_record=round(random.uniform(5, 100), 2),
-        )
-        session.add(sport)
+    rng = random.Random(seed)
+    existing = {name for (name,) in session.query(Sport.name).all()}
+    rows = []
+    i = 0
+    while len(rows) < n:
+        name = sport_name(i)
+        i += 1
+        if name in existing:
+            continue
+        rows.append({
+            "name": name,
+            "unit": rng.choice(["seconds", "meters", "kilograms"]),
+            "world_record": round(rng.uniform(5, 100), 2),
+            "olympic_record": round(rng.uniform(5, 100), 2),
+        })
+    if rows:
+        session.execute(insert(Sport), rows)
     session.commit()
     logger.info("Sports created successfully!")
+    return len(rows)
 
 def get_sport_ids(session: Session):
     """Fetch sport IDs."""
     logger.info("Fetching sport IDs...")
-    return [sport.id for sport in session.query(Sport).all()]
-
-def create_athletes(session: Session, n=50):
-    """Create a batch of athletes."""
-    logger.info("Creating athletes...")
-    for _ in range(n):
-        athlete = Athlete(
-            full_name=faker.name(),
-            country=faker.country(),
-            birth_year=random.randint(1960, 2005),
-            victories=random.randint(0, 20),
-        )
-        session.add(athlete)
-    session.commit()
-    logger.info("Athletes created successfully!")
+    return [sport_id for (sport_id,) in session.query(Sport.id).all()]
 
 def get_athlete_ids(session: Session):
     """Fetch athlete IDs."""
     logger.info("Fetching athlete IDs...")
-    return [athlete.id for athlete in session.query(Athlete).all()]
-
-def create_results(session: Session, sport_ids, athlete_ids, n=100):
-    """Create a batch of results."""
-    if not sport_ids or not athlete_ids:
-        logger.warning("No sports or athletes found. Skipping result creation.")
-        return
-
-    logger.info("Creating results...")
-    for _ in range(n):
-        result = Result(
-            competition_name=faker.sentence(nb_words=3).replace(".", ""),
-            performance=round(random.uniform(5, 100), 2),
-            event_date=faker.date_this_century().isoformat(),
-            location=faker.city(),
-            sport_id=random.choice(sport_ids),
-            athlete_id=random.choice(athlete_ids),
-            additional_info={
-                "weather": random.choice(["Sunny", "Rainy", "Windy"]),
-                "audience_size": random.randint(1000, 50000),
+    return [athlete_id for (athlete_id,) in session.query(Athlete.id).all()]
+
+def _chunk_faker(seed: int, chunk_index: int):
+    chunk_faker = Faker()
+    chunk_faker.seed_instance(seed * 1_000_003 + chunk_index)
+    return chunk_faker, random.Random(seed * 1_000_003 + chunk_index)
+
+def generate_athletes_chunk(seed: int, chunk_index: int, size: int):
+    """Generate a deterministic chunk of athlete rows."""
+    chunk_faker, rng = _chunk_faker(seed, chunk_index)
+    return [
+        {
+            "full_name": chunk_faker.name(),
+            "country": chunk_faker.country(),
+            "birth_year": rng.randint(1960, 2005),
+            "victories": rng.randint(0, 20),
+        }
+        for _ in range(size)
+    ]
+
+def generate_results_chunk(seed: int, chunk_index: int, size: int):
+    """Generate a deterministic chunk of result rows for the worker's sport and athlete ids."""
+    chunk_faker, rng = _chunk_faker(seed + 1, chunk_index)
+    return [
+        {
+            "competition_name": chunk_faker.sentence(nb_words=3).replace(".", ""),
+            "performance": round(rng.uniform(5, 100), 2),
+            "event_date": chunk_faker.date_this_century(),
+            "location": chunk_faker.city(),
+            "sport_id": rng.choice(_worker_sport_ids),
+            "athlete_id": rng.choice(_worker_athlete_ids),
+            "additional_info": {
+                "weather": rng.choice(["Sunny", "Rainy", "Windy"]),
+                "audience_size": rng.randint(1000, 50000),
             },
-        )
-        session.add(result)
+        }
+        for _ in range(size)
+    ]
+
+def _init_worker(sport_ids, athlete_ids):
+    global _worker_sport_ids, _worker_athlete_ids
+    _worker_sport_ids = sport_ids
+    _worker_athlete_ids = athlete_ids
+
+def _run_athletes_chunk(args):
+    return generate_athletes_chunk(*args)
+
+def _run_results_chunk(args):
+    return generate_results_chunk(*args)
+
+def load_rows(session: Session, model, rows):
+    """Bulk load rows with COPY on PostgreSQL or a Core executemany insert elsewhere."""
+    if session.get_bind().dialect.name == "postgresql":
+        copy_rows(session, model.__tablename__, list(rows[0].keys()), rows)
+    else:
+        session.execute(insert(model), rows)
+    cache.mark_changed(session, model.__tablename__)
     session.commit()
-    logger.info("Results created successfully!")
 
-def populate_database():
+def _chunks(total: int, chunk_size: int, seed: int):
+    return [(seed, index, min(chunk_size, total - start))
+            for index, start in enumerate(range(0, total, chunk_size))]
+
+def generate_table(session: Session, executor, model, worker, total: int, chunk_size: int, seed: int):
+    """Generate chunks in the process pool and load them as they arrive; returns rows/s stats."""
+    logger.info(f"Creating {total} rows in {model.__tablename__}...")
+    started = time.perf_counter()
+    loaded = 0
+    for rows in executor.map(worker, _chunks(total, chunk_size, seed)):
+        load_rows(session, model, rows)
+        loaded += len(rows)
+    elapsed = time.perf_counter() - started
+    return {"table": model.__tablename__, "rows": loaded, "seconds": round(elapsed, 2),
+            "rows_per_second": round(loaded / elapsed) if elapsed else None}
+
+def report(stats):
+    """Log rows/s per table."""
+    for entry in stats:
+        logger.info(f"{entry['table']:<10} {entry['rows']:>12} rows {entry['seconds']:>9}s "
+                    f"{entry['rows_per_second'] or 0:>10} rows/s")
+
+def populate_database(sports=10, athletes=50, results=100, scale=1.0, workers=None, chunk_size=10_000, seed=42):
     """Main function to populate the database."""
     logger.info("Starting database population...")
+    athletes = int(athletes * scale)
+    results = int(results * scale)
     session = SessionLocal()
 
     try:
         # Create sports
-        create_sports(session, 10)
+        started = time.perf_counter()
+        created = create_sports(session, sports, seed)
+        elapsed = time.perf_counter() - started
+        stats = [{"table": "sports", "rows": created, "seconds": round(elapsed, 2),
+                  "rows_per_second": round(created / elapsed) if elapsed else None}]
         sport_ids = get_sport_ids(session)
         if not sport_ids:
             logger.error("No sports created. Aborting!")
             return
 
         # Create athletes
-        create_athletes(session, 50)
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            stats.append(generate_table(session, executor, Athlete, _run_athletes_chunk, athletes, chunk_size, seed))
         athlete_ids = get_athlete_ids(session)
         if not athlete_ids:
             logger.error("No athletes created. Aborting!")
             return
 
         # Create results
-        create_results(session, sport_ids, athlete_ids, 100)
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(sport_ids, athlete_ids)) as executor:
+            stats.append(generate_table(session, executor, Result, _run_results_chunk, results, chunk_size, seed))
 
+        # Generated rows skip the ORM hooks, so derive the leaderboard, statistics and records in one pass at the end
+        leaderboard.rebuild(session.connection())
+        athlete_stats.rebuild(session.connection())
+        records.recompute(session.connection())
+        session.commit()
+
+        report(stats)
         logger.info("Database population complete!")
     finally:
         session.close()
 
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Populate the database with generated data.")
+    parser.add_argument("--sports", type=int, default=10, help="number of sports to create")
+    parser.add_argument("--athletes", type=int, default=50, help="number of athletes at scale 1")
+    parser.add_argument("--results", type=int, default=100, help="number of results at scale 1")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiplier applied to athletes and results")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="generator processes")
+    parser.add_argument("--chunk-size", type=int, default=10_000, help="rows generated and loaded per chunk")
+    parser.add_argument("--seed", type=int, default=42, help="seed for deterministic output")
+    return parser.parse_args(argv)
+
 if __name__ == "__main__":
-    populate_database()
+    args = parse_args()
+    populate_database(args.sports, args.athletes, args.results, args.scale,
+                      args.workers, args.chunk_size, args.seed)
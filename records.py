@@ -0,0 +1,192 @@
+from sqlalchemy import event, inspect, select, update, func, case, and_, or_, literal
+from sqlalchemy.orm import Session
+from models import Sport, Result, RecordHistory, OLYMPIC_COMPETITION
+from leaderboard import LOWER_IS_BETTER_UNITS, lower_is_better
+import argparse
+import logging
+import cache
+
+logger = logging.getLogger(__name__)
+
+# World and Olympic records on sports, kept in step with the stored results.
+#
+# A new result is checked with one conditional UPDATE per record:
+#
+#     UPDATE sports SET world_record = :value
+#     WHERE id = :sport_id AND (world_record IS NULL OR <value beats it in the unit's direction>)
+#
+# The database re-checks the WHERE against the row it locks, so concurrent
+# inserts can only ever move a record forward. Only results whose competition
+# name contains "olympic" count towards olympic_record. recompute() rebuilds
+# records from results with a single set-based UPDATE. Every change is appended
+# to record_history, which is read by sport without touching results:
+#
+#     python records.py recompute [--sport-id N]
+
+RECORDS = ("world_record", "olympic_record")
+
+sports = Sport.__table__
+history = RecordHistory.__table__
+
+
+def is_olympic(competition_name: str):
+    return competition_name is not None and "olympic" in competition_name.lower()
+
+def _beats(column, value):
+    lower = sports.c.unit.in_(LOWER_IS_BETTER_UNITS)
+    return or_(column.is_(None), and_(lower, column > value), and_(~lower, column < value))
+
+# The newest result of a sport with exactly this performance, for history rows of
+# bulk inserts whose ids are not known; served by the (sport_id, performance) indexes
+def _holder(sport_id: int, record: str, value: float):
+    query = select(Result.id).where(Result.sport_id == sport_id, Result.performance == value)
+    if record == "olympic_record":
+        query = query.where(OLYMPIC_COMPETITION)
+    return query.order_by(Result.id.desc()).limit(1).scalar_subquery()
+
+# Append a record change to the history
+def log(conn, sport_id: int, record: str, value, result_id=None, source: str = "manual"):
+    conn.execute(history.insert().values(sport_id=sport_id, record=record, value=value, result_id=result_id, source=source))
+
+# Set a record if value beats it, in one conditional UPDATE
+def improve(conn, sport_id: int, record: str, value: float, result_id: int = None):
+    column = sports.c[record]
+    updated = conn.execute(update(sports).where(sports.c.id == sport_id, _beats(column, value)).values({record: value})).rowcount
+    if not updated:
+        return False
+    if result_id is None:
+        result_id = _holder(sport_id, record, value)
+    log(conn, sport_id, record, value, result_id=result_id, source="result")
+    return True
+
+# Check new results, as (result_id, sport_id, performance, competition_name), against
+# the records. Only the best candidate per sport and record is tried, so a bulk
+# chunk costs at most one UPDATE per sport and record. Returns the records changed.
+def apply_results(conn, rows):
+    rows = [row for row in rows if row[1] is not None and row[2] is not None]
+    if not rows:
+        return 0
+    units = dict(conn.execute(select(sports.c.id, sports.c.unit).where(sports.c.id.in_({row[1] for row in rows}))).all())
+    best = {}
+    for result_id, sport_id, performance, competition_name in rows:
+        if sport_id not in units:
+            continue
+        lower = lower_is_better(units[sport_id])
+        for record in RECORDS if is_olympic(competition_name) else RECORDS[:1]:
+            current = best.get((sport_id, record))
+            if current is None or (performance < current[0] if lower else performance > current[0]):
+                best[(sport_id, record)] = (performance, result_id)
+    return sum(improve(conn, sport_id, record, value, result_id) for (sport_id, record), (value, result_id) in best.items())
+
+def _best(record: str):
+    conditions = [Result.sport_id == sports.c.id]
+    if record == "olympic_record":
+        conditions.append(OLYMPIC_COMPETITION)
+    # Separate MIN and MAX subqueries so each is a seek on a (sport_id, performance) index
+    lowest = select(func.min(Result.performance)).where(*conditions).scalar_subquery()
+    highest = select(func.max(Result.performance)).where(*conditions).scalar_subquery()
+    return case((sports.c.unit.in_(LOWER_IS_BETTER_UNITS), lowest), else_=highest)
+
+# Rebuild the records of every sport, or of some, from results in a single UPDATE.
+# Sports without (Olympic) results end up with no record. Returns the records changed.
+def recompute(conn, sport_ids=None):
+    scope = [] if sport_ids is None else [sports.c.id.in_(list(sport_ids))]
+    changed = 0
+    for record in RECORDS:
+        best = _best(record)
+        query = select(sports.c.id, literal(record), best, literal("recompute")).where(sports.c[record].is_distinct_from(best), *scope)
+        changed += conn.execute(history.insert().from_select(["sport_id", "record", "value", "source"], query)).rowcount
+    conn.execute(update(sports).where(*scope).values({record: _best(record) for record in RECORDS}))
+    return changed
+
+# Sports whose records may have been set by one of these removed (sport_id, performance) results
+def _held(conn, pairs):
+    pairs = {(sport_id, performance) for sport_id, performance in pairs if sport_id is not None and performance is not None}
+    if not pairs:
+        return set()
+    matches = or_(*[
+        and_(sports.c.id == sport_id, or_(sports.c.world_record == performance, sports.c.olympic_record == performance))
+        for sport_id, performance in pairs
+    ])
+    return set(conn.execute(select(sports.c.id).where(matches)).scalars())
+
+
+# Keep records in step with ORM writes to results and sports, in the same transaction
+@event.listens_for(Session, "after_flush")
+def _after_flush(session, flush_context):
+    created = []
+    removed = set()
+    stale_sports = set()
+    manual = []
+    for obj in session.new:
+        if isinstance(obj, Result):
+            created.append((obj.id, obj.sport_id, obj.performance, obj.competition_name))
+    for obj in session.dirty:
+        if isinstance(obj, Result) and session.is_modified(obj):
+            state = inspect(obj)
+            if not any(state.attrs[name].history.has_changes() for name in ("sport_id", "performance", "competition_name")):
+                continue
+            # The old values may have held a record, the new ones may set one
+            old_sports = set(state.attrs.sport_id.history.deleted or ()) | {obj.sport_id}
+            old_performances = set(state.attrs.performance.history.deleted or ()) | {obj.performance}
+            removed |= {(s, p) for s in old_sports for p in old_performances}
+            created.append((obj.id, obj.sport_id, obj.performance, obj.competition_name))
+        elif isinstance(obj, Sport):
+            state = inspect(obj)
+            if state.attrs.unit.history.has_changes():
+                stale_sports.add(obj.id)
+            manual += [(obj.id, record, getattr(obj, record)) for record in RECORDS if state.attrs[record].history.has_changes()]
+    for obj in session.deleted:
+        if isinstance(obj, Result):
+            removed.add((obj.sport_id, obj.performance))
+    if not (created or removed or stale_sports or manual):
+        return
+
+    conn = session.connection()
+    for sport_id, record, value in manual:
+        log(conn, sport_id, record, value, source="manual")
+    stale_sports |= _held(conn, removed)
+    changed = recompute(conn, stale_sports) if stale_sports else 0
+    changed += apply_results(conn, [row for row in created if row[1] not in stale_sports])
+    if changed:
+        cache.mark_changed(session, Sport.__tablename__)
+
+
+# Record changes of a sport, newest first, with the value each one replaced
+def record_history(db: Session, sport_id: int, record: str = None, limit: int = 100):
+    if db.get(Sport, sport_id) is None:
+        return None
+    entries = select(
+        RecordHistory.id,
+        RecordHistory.record,
+        RecordHistory.value,
+        func.lag(RecordHistory.value).over(partition_by=RecordHistory.record, order_by=RecordHistory.id).label("previous_value"),
+        RecordHistory.result_id,
+        RecordHistory.source,
+        RecordHistory.changed_at,
+    ).where(RecordHistory.sport_id == sport_id)
+    if record is not None:
+        entries = entries.where(RecordHistory.record == record)
+    entries = entries.subquery()
+    query = select(entries).order_by(entries.c.id.desc()).limit(limit)
+    return [dict(row._mapping) for row in db.execute(query)]
+
+
+if __name__ == "__main__":
+    from database import SessionLocal
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="World and Olympic record maintenance.")
+    parser.add_argument("command", choices=["recompute"])
+    parser.add_argument("--sport-id", type=int, default=None, help="only recompute this sport")
+    args = parser.parse_args()
+
+    session = SessionLocal()
+    try:
+        changed = recompute(session.connection(), None if args.sport_id is None else [args.sport_id])
+        if changed:
+            cache.mark_changed(session, Sport.__tablename__)
+        session.commit()
+        logger.info("Records recomputed, %d changed", changed)
+    finally:
+        session.close()
@@ -1,77 +1,185 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+import functools
+from datetime import date
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-import crud, schemas
-from database import get_db
+import crud, schemas, pagination, etag, bulk, export, info_filters, fastjson, includes, batch
+from database import DB_MODE, get_write_db, read_db, write_db, run_in_session, read_sessionmaker, async_read_sessionmaker
+from loaders import Loaders, get_loaders
 
 router = APIRouter()
 
 # Create a new result
 @router.post("/", response_model=schemas.Result)
-def create_result(result: schemas.ResultCreate, db: Session = Depends(get_db)):
-    return crud.create_result(db=db, result=result)
+async def create_result(result: schemas.ResultCreate, db: Session = Depends(write_db)):
+    return await run_in_session(db, crud.create_result, result=result)
 
-# Get a single result by ID
-@router.get("/{result_id}", response_model=schemas.Result)
-def read_result(result_id: int, db: Session = Depends(get_db)):
-    db_result = crud.get_result(db=db, result_id=result_id)
-    if not db_result:
-        raise HTTPException(status_code=404, detail="Result not found")
-    return db_result
-
-# Update an existing result
-@router.put("/{result_id}", response_model=schemas.Result)
-def update_result(result_id: int, result: schemas.ResultCreate, db: Session = Depends(get_db)):
-    db_result = crud.update_result(db=db, result_id=result_id, result=result)
-    if not db_result:
-        raise HTTPException(status_code=404, detail="Result not found")
-    return db_result
+# Bulk load results from a streamed NDJSON or CSV body. Always on the sync engine, in both
+# request stacks: its COPY path already runs off the event loop
+@router.post("/bulk", response_model=dict)
+async def bulk_create_results(request: Request, chunk_size: int = Query(5000, ge=1, le=100000), db: Session = Depends(get_write_db)):
+    fmt = bulk.detect_format(request.headers.get("content-type"))
+    return await bulk.ingest_results(db=db, stream=request.stream(), fmt=fmt, chunk_size=chunk_size)
 
-# Delete a result
-@router.delete("/{result_id}", status_code=204)
-def delete_result(result_id: int, db: Session = Depends(get_db)):
-    if not crud.delete_result(db=db, result_id=result_id):
-        raise HTTPException(status_code=404, detail="Result not found")
-    return {"detail": "Result deleted successfully"}
+# Filter results with optional conditions, including info[key]=value and info[key][gt]=n on additional_info
+@router.get("/filter", response_model=list[schemas.Result], dependencies=[Depends(etag.conditional("results", includes=includes.TABLES))])
+async def filter_results(
+    response: Response,
+    request: Request,
+    athlete_id: int = None,
+    sport_id: int = None,
+    score_gt: float = Query(None, alias="score[gt]"),
+    score_lt: float = Query(None, alias="score[lt]"),
+    date_from: date = None,
+    date_to: date = None,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=pagination.MAX_LIMIT),
+    cursor: str = None,
+    include: str = None,
+    db: Session = Depends(read_db),
+):
+    try:
+        info, info_ranges = info_filters.parse_info_params(request.query_params.multi_items())
+        expand = includes.parse_include(include, "results")
+        # Embedding needs ORM instances; plain pages stay on the column-tuple fast path
+        if expand:
+            fetch = functools.partial(crud.filter_results, options=includes.options("results", expand))
+        else:
+            fetch = crud.filter_result_rows
+        page = await run_in_session(
+            db,
+            fetch,
+            athlete_id=athlete_id,
+            sport_id=sport_id,
+            score_gt=score_gt,
+            score_lt=score_lt,
+            date_from=date_from,
+            date_to=date_to,
+            info=info,
+            info_ranges=info_ranges,
+            skip=skip,
+            limit=limit,
+            cursor=cursor,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    pagination.set_next_cursor(response, page)
+    if expand:
+        return fastjson.json_response(response, includes.dump_all(page, "results", expand))
+    return fastjson.rows_response(response, page)
 
-# Filter results with optional conditions
-@router.get("/filter", response_model=list[schemas.Result])
-def filter_results(
+# Stream every matching result as CSV or NDJSON through a server-side cursor
+@router.get("/export", dependencies=[Depends(etag.conditional("results"))])
+async def export_results(
+    request: Request,
+    format: str = Query("csv", pattern="^(csv|ndjson)$"),
     athlete_id: int = None,
     sport_id: int = None,
     score_gt: float = Query(None, alias="score[gt]"),
     score_lt: float = Query(None, alias="score[lt]"),
-    skip: int = 0,
-    limit: int = 100,
-    db: Session = Depends(get_db),
+    date_from: date = None,
+    date_to: date = None,
 ):
-    return crud.filter_results(
-        db=db,
+    try:
+        info, info_ranges = info_filters.parse_info_params(request.query_params.multi_items())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    filters = dict(
         athlete_id=athlete_id,
         sport_id=sport_id,
         score_gt=score_gt,
         score_lt=score_lt,
-        skip=skip,
-        limit=limit,
+        date_from=date_from,
+        date_to=date_to,
+        info=info,
+        info_ranges=info_ranges,
     )
+    if DB_MODE == "async":
+        body = export.aiter_export(async_read_sessionmaker(request), format, **filters)
+    else:
+        body = export.iter_export(read_sessionmaker(request), format, **filters)
+    headers = {"Content-Disposition": f'attachment; filename="{export.filename(format)}"'}
+    return StreamingResponse(body, media_type=export.FORMATS[format], headers=headers)
 
 # GROUP BY example: Count results by sport
-@router.get("/grouped_by_sport", response_model=list[dict])
-def group_results_by_sport(db: Session = Depends(get_db)):
-    return crud.group_results_by_sport(db=db)
+@router.get("/grouped_by_sport", response_model=list[dict], dependencies=[Depends(etag.conditional("sports", "results"))])
+async def group_results_by_sport(db: Session = Depends(read_db)):
+    return await run_in_session(db, crud.group_results_by_sport)
 
 # Sorting results
-@router.get("/sorted", response_model=list[schemas.Result])
-def get_sorted_results(
+@router.get("/sorted", response_model=list[schemas.Result], dependencies=[Depends(etag.conditional("results", includes=includes.TABLES))])
+async def get_sorted_results(
+    response: Response,
     order_by: str = "score",
     descending: bool = False,
-    skip: int = 0,
-    limit: int = 100,
-    db: Session = Depends(get_db),
+    date_from: date = None,
+    date_to: date = None,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=pagination.MAX_LIMIT),
+    cursor: str = None,
+    include: str = None,
+    db: Session = Depends(read_db),
 ):
-    return crud.get_sorted_results(
-        db=db,
-        order_by=order_by,
-        descending=descending,
-        skip=skip,
-        limit=limit,
-    )
+    try:
+        expand = includes.parse_include(include, "results")
+        # Embedding needs ORM instances; plain pages stay on the column-tuple fast path
+        if expand:
+            fetch = functools.partial(crud.get_sorted_results, options=includes.options("results", expand))
+        else:
+            fetch = crud.get_sorted_result_rows
+        page = await run_in_session(
+            db,
+            fetch,
+            order_by=order_by,
+            descending=descending,
+            skip=skip,
+            limit=limit,
+            cursor=cursor,
+            date_from=date_from,
+            date_to=date_to,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    pagination.set_next_cursor(response, page)
+    if expand:
+        return fastjson.json_response(response, includes.dump_all(page, "results", expand))
+    return fastjson.rows_response(response, page)
+
+# Get many results by ID in one query: found results in request order and the missing ids
+@router.get("", response_model=dict, dependencies=[Depends(etag.conditional("results"))])
+async def read_results_by_ids(response: Response, ids: list[str] = Query(..., description="Comma separated ids, up to batch.MAX_IDS"), loaders: Loaders = Depends(get_loaders)):
+    try:
+        ids = batch.parse_ids(ids)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    rows = await loaders.results.load_many(ids)
+    return fastjson.json_response(response, batch.multi_get_body(ids, rows))
+
+# Get a single result by ID
+@router.get("/{result_id}", response_model=schemas.Result, dependencies=[Depends(etag.conditional("results", includes=includes.TABLES))])
+async def read_result(response: Response, result_id: int, include: str = None, db: Session = Depends(read_db)):
+    try:
+        expand = includes.parse_include(include, "results")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    db_result = await run_in_session(db, crud.get_result, result_id=result_id, options=includes.options("results", expand))
+    if not db_result:
+        raise HTTPException(status_code=404, detail="Result not found")
+    if expand:
+        return fastjson.json_response(response, includes.dump(db_result, "results", expand))
+    return db_result
+
+# Update an existing result
+@router.put("/{result_id}", response_model=schemas.Result)
+async def update_result(result_id: int, result: schemas.ResultCreate, db: Session = Depends(write_db)):
+    db_result = await run_in_session(db, crud.update_result, result_id=result_id, result=result)
+    if not db_result:
+        raise HTTPException(status_code=404, detail="Result not found")
+    return db_result
+
+# Delete a result
+@router.delete("/{result_id}", status_code=204)
+async def delete_result(result_id: int, db: Session = Depends(write_db)):
+    if not await run_in_session(db, crud.delete_result, result_id=result_id):
+        raise HTTPException(status_code=404, detail="Result not found")
+    return {"detail": "Result deleted successfully"}
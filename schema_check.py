@@ -0,0 +1,37 @@
+from alembic.config import Config
+from alembic.runtime.migration import MigrationContext
+from alembic.script import ScriptDirectory
+import os
+
+# Startup schema check against the Alembic migrations.
+#
+# Comparing the database's alembic_version with the head revision of the
+# migration scripts costs one small query, instead of the table reflection
+# create_all() does in every process. Migrations themselves are applied out of
+# band with `alembic upgrade head`.
+
+ALEMBIC_CONFIG = os.getenv("ALEMBIC_CONFIG", os.path.join(os.path.dirname(os.path.abspath(__file__)), "alembic.ini"))
+
+
+class SchemaOutOfDate(RuntimeError):
+    pass
+
+
+# Head revision(s) of the migration scripts
+def head_revisions(config_path: str = ALEMBIC_CONFIG):
+    return set(ScriptDirectory.from_config(Config(config_path)).get_heads())
+
+# Revision(s) the database is at; empty when it was never migrated
+def current_revisions(engine):
+    with engine.connect() as conn:
+        return set(MigrationContext.configure(conn).get_current_heads())
+
+# Raise SchemaOutOfDate unless the database is at the migrations head
+def check_head(engine, config_path: str = ALEMBIC_CONFIG):
+    heads = head_revisions(config_path)
+    current = current_revisions(engine)
+    if current != heads:
+        raise SchemaOutOfDate(
+            f"Database is at revision {', '.join(sorted(current)) or 'none'}, "
+            f"migrations head is {', '.join(sorted(heads))}; run `alembic upgrade head`"
+        )
@@ -0,0 +1,167 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import select, func, literal, literal_column, null, or_, table, column, text
+from sqlalchemy.orm import Session
+from models import Sport, Athlete, Result
+from database import read_db, run_in_session
+import argparse
+import logging
+import etag
+
+logger = logging.getLogger(__name__)
+
+# Name search across sports, athletes and competitions.
+#
+# On PostgreSQL the trigram GIN indexes (pg_trgm, see models.py) serve both the
+# substring ILIKE and the fuzzy `%` similarity operator, and hits are ranked by
+# similarity(). On SQLite each name column gets an external-content FTS5 table
+# with the trigram tokenizer, kept in sync by triggers, and hits are ranked by how
+# much of the name the query covers. The mirrors are created on the primary at
+# startup (prepare(), called from main.py and serve.py), never from a read route:
+# on a replica the triggers would never see the writes.
+# Either way `score` is higher for better matches.
+
+KINDS = ("sports", "athletes", "competitions")
+
+# (kind label, id column, name column) for every searchable kind
+SOURCES = {
+    "sports": ("sport", Sport.id, Sport.name),
+    "athletes": ("athlete", Athlete.id, Athlete.full_name),
+    "competitions": ("competition", None, Result.competition_name),
+}
+
+# SQLite FTS5 mirror per kind: (fts table, content table, name column); rowid is the content id
+FTS_TABLES = {
+    "sports": ("sports_fts", "sports", "name"),
+    "athletes": ("athletes_fts", "athletes", "full_name"),
+    "competitions": ("results_fts", "results", "competition_name"),
+}
+
+
+def _like_pattern(q: str):
+    return "%" + q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+def parse_kinds(types: str):
+    kinds = [kind.strip() for kind in types.split(",") if kind.strip()]
+    unknown = [kind for kind in kinds if kind not in KINDS]
+    if unknown:
+        raise ValueError(f"Unknown search types: {', '.join(unknown)}")
+    return kinds or list(KINDS)
+
+def _postgresql_query(kind: str, q: str, limit: int):
+    label, id_column, name_column = SOURCES[kind]
+    score = func.similarity(name_column, q)
+    match = or_(name_column.ilike(_like_pattern(q), escape="\\"), name_column.op("%")(q))
+    if id_column is None:
+        # Competitions are names shared by many results; return each name once
+        query = select(null().label("id"), name_column.label("name"), func.max(score).label("score")).group_by(name_column)
+    else:
+        query = select(id_column.label("id"), name_column.label("name"), score.label("score"))
+    return label, query.where(match).order_by(literal_column("score").desc(), literal_column("name")).limit(limit)
+
+def _sqlite_query(kind: str, q: str, limit: int):
+    label = SOURCES[kind][0]
+    name, _, column_name = FTS_TABLES[kind]
+    fts = table(name, column("rowid"), column(column_name))
+    text_column = fts.c[column_name]
+    if len(q) >= 3:
+        # A quoted FTS5 string is a substring match under the trigram tokenizer
+        match = literal_column(name).op("MATCH")('"' + q.replace('"', '""') + '"')
+    else:
+        # Too short for trigrams; LIKE still only touches the FTS table
+        match = text_column.like(_like_pattern(q), escape="\\")
+    # Every hit contains q, so the share of the name it covers stands in for similarity()
+    # and, unlike bm25, compares across the per-kind tables
+    score = literal(float(len(q))) / func.length(text_column)
+    if kind == "competitions":
+        query = select(null().label("id"), text_column.label("name"), func.max(score).label("score")).group_by(text_column)
+    else:
+        query = select(fts.c.rowid.label("id"), text_column.label("name"), score.label("score"))
+    return label, query.where(match).order_by(literal_column("score").desc(), literal_column("name")).limit(limit)
+
+# Create the SQLite FTS5 mirrors (external content tables kept in sync by triggers) if missing
+def ensure_fts(conn):
+    created = False
+    for name, source, column_name in FTS_TABLES.values():
+        exists = conn.execute(text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": name}).first()
+        if exists:
+            continue
+        conn.execute(text(
+            f"CREATE VIRTUAL TABLE {name} USING fts5({column_name}, content = '{source}', content_rowid = 'id', tokenize = 'trigram')"
+        ))
+        conn.execute(text(
+            f"CREATE TRIGGER {name}_ai AFTER INSERT ON {source} BEGIN "
+            f"INSERT INTO {name} (rowid, {column_name}) VALUES (new.id, new.{column_name}); END"
+        ))
+        conn.execute(text(
+            f"CREATE TRIGGER {name}_ad AFTER DELETE ON {source} BEGIN "
+            f"INSERT INTO {name} ({name}, rowid, {column_name}) VALUES ('delete', old.id, old.{column_name}); END"
+        ))
+        conn.execute(text(
+            f"CREATE TRIGGER {name}_au AFTER UPDATE OF {column_name} ON {source} BEGIN "
+            f"INSERT INTO {name} ({name}, rowid, {column_name}) VALUES ('delete', old.id, old.{column_name}); "
+            f"INSERT INTO {name} (rowid, {column_name}) VALUES (new.id, new.{column_name}); END"
+        ))
+        conn.execute(text(f"INSERT INTO {name} ({name}) VALUES ('rebuild')"))
+        created = True
+    return created
+
+# Startup step: create the SQLite FTS5 mirrors on the primary engine if missing
+def prepare(engine):
+    if engine.dialect.name == "sqlite":
+        with engine.begin() as conn:
+            ensure_fts(conn)
+
+# Rebuild the SQLite FTS5 mirrors from their content tables
+def rebuild_fts(conn):
+    for name, _, _ in FTS_TABLES.values():
+        conn.execute(text(f"INSERT INTO {name} ({name}) VALUES ('rebuild')"))
+
+# Best matches for q across the requested kinds, highest score first
+def search(db: Session, q: str, kinds=KINDS, limit: int = 20):
+    conn = db.connection()
+    build = _postgresql_query if conn.dialect.name == "postgresql" else _sqlite_query
+
+    hits = []
+    for kind in kinds:
+        label, query = build(kind, q, limit)
+        hits += [{"type": label, **row._mapping} for row in conn.execute(query)]
+    hits.sort(key=lambda hit: (-hit["score"], hit["name"]))
+    return hits[:limit]
+
+
+router = APIRouter()
+
+# Fuzzy/substring search over sport, athlete and competition names, ranked by similarity
+@router.get("/search", response_model=list[dict], dependencies=[Depends(etag.conditional("sports", "athletes", "results"))])
+async def search_names(
+    q: str = Query(..., min_length=1, max_length=200),
+    types: str = ",".join(KINDS),
+    limit: int = Query(20, ge=1, le=100),
+    db: Session = Depends(read_db),
+):
+    try:
+        kinds = parse_kinds(types)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return await run_in_session(db, search, q=q, kinds=kinds, limit=limit)
+
+
+if __name__ == "__main__":
+    from database import SessionLocal
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Search index maintenance (SQLite FTS5 mirror).")
+    parser.add_argument("command", choices=["rebuild"])
+    args = parser.parse_args()
+
+    session = SessionLocal()
+    try:
+        conn = session.connection()
+        if conn.dialect.name == "postgresql":
+            logger.info("PostgreSQL uses the pg_trgm indexes directly; nothing to rebuild")
+        elif not ensure_fts(conn):
+            rebuild_fts(conn)
+        session.commit()
+        logger.info("Search index rebuilt")
+    finally:
+        session.close()
@@ -0,0 +1,260 @@
+import time
+
+# Measured from before the heavy imports below
+STARTED = time.perf_counter()
+
+import argparse
+import asyncio
+import importlib
+import json
+import logging
+import os
+import signal
+import socket
+import sys
+import uvicorn
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Production launcher: N uvicorn workers forked from one preloaded master.
+#
+#     python serve.py --workers 8 --pool-budget 80
+#
+# The master imports the application once, checks that the database is at the
+# Alembic head revision (schema_check.py) instead of running create_all(), and binds the
+# listening socket. Forked workers share the imported code copy-on-write, so each
+# one only warms up its connection pool and starts an analytics snapshot refresh
+# (analytics.py) before it starts accepting on the shared socket. --pool-budget
+# caps the connections all workers together open to each database: each worker
+# gets an equal share, which holds its background pool (jobs and analytics
+# refreshes, database.background_engine) and its request pool, split between
+# pool_size and max_overflow in the configured ratio.
+#
+# Without WEB_CONCURRENCY, --workers defaults to one per CPU with JOB_BACKEND=redis
+# and to a single worker otherwise: the memory job broker lives in one process. Workers that die are restarted.
+#
+# Startup phases (import, schema, warm-up, ready) are logged and exported as the
+# startup_seconds gauge; --measure-startup runs them once in-process and prints
+# them as JSON, for tracking import and boot time across changes.
+
+RESTART_DELAY_SECONDS = 1.0
+
+STARTUP_SECONDS = metrics.Gauge("startup_seconds", "Time spent in each startup phase of this worker")
+
+
+# Per-worker pool_size, max_overflow and background pool size for a total connection
+# budget. Every worker needs a request connection and a background one, so the budget
+# must cover two per worker; the background pool keeps at most `background` of the share.
+def split_pool_budget(budget: int, workers: int, pool_size: int, max_overflow: int, background: int):
+    if budget < 2 * workers:
+        raise ValueError(f"Pool budget {budget} is less than two connections per worker ({workers} workers)")
+    per_worker = budget // workers
+    background = max(1, min(background, per_worker - 1))
+    requests = per_worker - background
+    size = max(1, round(requests * pool_size / max(pool_size + max_overflow, 1)))
+    return min(size, requests), max(requests - size, 0), background
+
+def _configure_pool(args):
+    budget = args.pool_budget or int(os.getenv("DB_POOL_BUDGET", "0"))
+    if not budget:
+        return
+    size, overflow, background = split_pool_budget(
+        budget,
+        args.workers,
+        int(os.getenv("DB_POOL_SIZE", "5")),
+        int(os.getenv("DB_MAX_OVERFLOW", "10")),
+        int(os.getenv("DB_BACKGROUND_POOL_SIZE", "2")),
+    )
+    # Read by database.py when it builds the engines, so this must precede the app import
+    os.environ["DB_POOL_SIZE"] = str(size)
+    os.environ["DB_MAX_OVERFLOW"] = str(overflow)
+    os.environ["DB_BACKGROUND_POOL_SIZE"] = str(background)
+    logger.info(
+        "Pool budget %d over %d workers: pool_size=%d max_overflow=%d per engine, background pool %d",
+        budget, args.workers, size, overflow, background,
+    )
+
+def _prepare_schema(mode: str):
+    import database, models, schema_check, search
+
+    if mode == "check":
+        schema_check.check_head(database.engine)
+    elif mode == "create_all":
+        models.Base.metadata.create_all(bind=database.engine)
+    if mode != "none":
+        search.prepare(database.engine)
+
+def _engines():
+    import database
+
+    if database.DB_MODE == "async":
+        return [], [database.async_engine, *database.async_replica_engines]
+    return [database.engine, *database.replica_engines], []
+
+# Open pool_size connections on every engine the request stack uses, then return them to the pool
+async def warm_up():
+    sync_engines, async_engines = _engines()
+    for engine in sync_engines:
+        connections = [engine.connect() for _ in range(engine.pool.size())]
+        for connection in connections:
+            connection.exec_driver_sql("SELECT 1")
+            connection.close()
+    for engine in async_engines:
+        connections = [await engine.connect() for _ in range(engine.pool.size())]
+        for connection in connections:
+            await connection.exec_driver_sql("SELECT 1")
+            await connection.close()
+
+def _record(timings: dict):
+    for phase, seconds in timings.items():
+        STARTUP_SECONDS.set(seconds, phase=phase)
+
+async def _serve(config, sock, timings: dict, launched: float):
+    import analytics
+
+    started = time.perf_counter()
+    await warm_up()
+    timings["warmup"] = time.perf_counter() - started
+    # Build or catch up the analytics snapshot out of band; one worker does the work
+    analytics.refresh_in_background()
+    timings["ready"] = time.perf_counter() - launched
+    _record(timings)
+    logger.info("Worker %d ready in %.3fs (warm-up %.3fs)", os.getpid(), timings["ready"], timings["warmup"])
+    await uvicorn.Server(config).serve(sockets=[sock])
+
+# Run one worker; `launched` is when its startup began (the master's for the first workers)
+def _run_worker(config, sock, timings: dict, launched: float):
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, signal.SIG_DFL)
+    try:
+        with asyncio.Runner(loop_factory=config.get_loop_factory()) as runner:
+            runner.run(_serve(config, sock, dict(timings), launched))
+    except Exception:
+        logger.exception("Worker %d failed", os.getpid())
+        os._exit(1)
+    os._exit(0)
+
+def _bind(host: str, port: int):
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+# Fork the workers and restart any that exit until the master is told to stop
+def supervise(config, sock, workers: int, timings: dict):
+    children = set()
+    stopping = False
+
+    def spawn(launched: float):
+        pid = os.fork()
+        if pid == 0:
+            _run_worker(config, sock, timings, launched)
+        children.add(pid)
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for _ in range(workers):
+        spawn(STARTED)
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        children.discard(pid)
+        if not stopping:
+            logger.warning("Worker %d exited (status %d), restarting", pid, status)
+            time.sleep(RESTART_DELAY_SECONDS)
+            spawn(time.perf_counter())
+    sock.close()
+
+# One worker per CPU, unless jobs live in this process's memory broker (jobs.JOB_BACKEND)
+def default_workers():
+    if "WEB_CONCURRENCY" in os.environ:
+        return int(os.environ["WEB_CONCURRENCY"])
+    if os.getenv("JOB_BACKEND", "memory") == "redis":
+        return os.cpu_count() or 1
+    return 1
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run the API with preloaded worker processes.")
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=default_workers(),
+                        help="worker processes (default: WEB_CONCURRENCY, else one per CPU with JOB_BACKEND=redis, else 1)")
+    parser.add_argument("--pool-budget", type=int, default=None,
+                        help="connections per engine across all workers (default: DB_POOL_BUDGET, else unlimited)")
+    parser.add_argument("--schema", choices=["check", "create_all", "none"], default="check",
+                        help="schema step before forking (default: check the Alembic head revision)")
+    parser.add_argument("--log-level", default="info")
+    parser.add_argument("--measure-startup", action="store_true", help="run the startup phases once, print their timings and exit")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=args.log_level.upper())
+    try:
+        _configure_pool(args)
+    except ValueError as e:
+        logger.error("%s", e)
+        return 2
+
+    timings = {}
+    # The schema step below replaces the create_all() main.py would run on import
+    os.environ["SCHEMA_MODE"] = "none"
+    started = time.perf_counter()
+    application = importlib.import_module("main")
+    from alembic.util import CommandError
+    from schema_check import SchemaOutOfDate
+    timings["import"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    try:
+        _prepare_schema(args.schema)
+    except (CommandError, SchemaOutOfDate) as e:
+        logger.error("Schema %s failed: %s", args.schema, e)
+        return 1
+    timings["schema"] = time.perf_counter() - started
+    logger.info("Imported in %.3fs, schema %s in %.3fs", timings["import"], args.schema, timings["schema"])
+
+    if args.measure_startup:
+        started = time.perf_counter()
+        asyncio.run(warm_up())
+        timings["warmup"] = time.perf_counter() - started
+        timings["ready"] = time.perf_counter() - STARTED
+        print(json.dumps({phase: round(seconds, 4) for phase, seconds in timings.items()}))
+        return 0
+
+    # The memory job broker lives in one process: a job submitted to one worker could
+    # not be polled through another
+    import jobs
+    if args.workers > 1 and jobs.JOB_BACKEND == "memory":
+        logger.error("JOB_BACKEND=memory keeps jobs per process; use JOB_BACKEND=redis with --workers %d", args.workers)
+        return 2
+
+    # Workers must not share the master's connections
+    import database
+    for engine in (database.engine, *database.replica_engines, database.background_engine):
+        engine.dispose()
+
+    config = uvicorn.Config(application.app, host=args.host, port=args.port, log_level=args.log_level, proxy_headers=True)
+    sock = _bind(args.host, args.port)
+    logger.info("Listening on %s:%d with %d workers", args.host, args.port, args.workers)
+    supervise(config, sock, args.workers, timings)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,87 +1,148 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from sqlalchemy.orm import Session
-import crud, schemas
-from database import get_db
+import crud, schemas, pagination, etag, leaderboard, records, includes, fastjson, batch
+from database import read_db, write_db, run_in_session
+from loaders import Loaders, get_loaders
 
 router = APIRouter()
 
 # Create a new sport
 @router.post("/", response_model=schemas.Sport)
-def create_sport(sport: schemas.SportCreate, db: Session = Depends(get_db)):
-    return crud.create_sport(db=db, sport=sport)
-
-# Get a single sport by ID
-@router.get("/{sport_id}", response_model=schemas.Sport)
-def read_sport(sport_id: int, db: Session = Depends(get_db)):
-    db_sport = crud.get_sport(db=db, sport_id=sport_id)
-    if not db_sport:
-        raise HTTPException(status_code=404, detail="Sport not found")
-    return db_sport
-
-# Update an existing sport
-@router.put("/{sport_id}", response_model=schemas.Sport)
-def update_sport(sport_id: int, sport: schemas.SportCreate, db: Session = Depends(get_db)):
-    db_sport = crud.update_sport(db=db, sport_id=sport_id, sport=sport)
-    if not db_sport:
-        raise HTTPException(status_code=404, detail="Sport not found")
-    return db_sport
-
-# Delete a sport
-@router.delete("/{sport_id}", status_code=204)
-def delete_sport(sport_id: int, db: Session = Depends(get_db)):
-    if not crud.delete_sport(db=db, sport_id=sport_id):
-        raise HTTPException(status_code=404, detail="Sport not found")
-    return {"detail": "Sport deleted successfully"}
+async def create_sport(sport: schemas.SportCreate, db: Session = Depends(write_db)):
+    return await run_in_session(db, crud.create_sport, sport=sport)
 
 # Filter sports with optional conditions
-@router.get("/filter", response_model=list[schemas.Sport])
-def filter_sports(
+@router.get("/filter", response_model=list[schemas.Sport], dependencies=[Depends(etag.conditional("sports", includes=includes.TABLES))])
+async def filter_sports(
+    response: Response,
     name: str = None,
     world_record_gt: float = Query(None, alias="world_record[gt]"),
     world_record_lt: float = Query(None, alias="world_record[lt]"),
-    skip: int = 0,
-    limit: int = 100,
-    db: Session = Depends(get_db),
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=pagination.MAX_LIMIT),
+    cursor: str = None,
+    include: str = None,
+    db: Session = Depends(read_db),
 ):
-    return crud.filter_sports(
-        db=db,
-        name=name,
-        world_record_gt=world_record_gt,
-        world_record_lt=world_record_lt,
-        skip=skip,
-        limit=limit,
-    )
+    try:
+        expand = includes.parse_include(include, "sports")
+        page = await run_in_session(
+            db,
+            crud.filter_sports,
+            name=name,
+            world_record_gt=world_record_gt,
+            world_record_lt=world_record_lt,
+            skip=skip,
+            limit=limit,
+            cursor=cursor,
+            options=includes.options("sports", expand),
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    pagination.set_next_cursor(response, page)
+    if expand:
+        return fastjson.json_response(response, includes.dump_all(page, "sports", expand))
+    return page
 
 # JOIN example: Get sports with the number of results
-@router.get("/detailed", response_model=list[dict])
-def get_sports_with_result_counts(db: Session = Depends(get_db)):
-    return crud.get_sports_with_result_counts(db=db)
+@router.get("/detailed", response_model=list[dict], dependencies=[Depends(etag.conditional("sports", "results"))])
+async def get_sports_with_result_counts(db: Session = Depends(read_db)):
+    return await run_in_session(db, crud.get_sports_with_result_counts)
 
 # Update a world record for a sport
 @router.put("/update_world_record")
-def update_world_record(sport_name: str, new_record: float, db: Session = Depends(get_db)):
-    if not crud.update_world_record(db=db, sport_name=sport_name, new_record=new_record):
+async def update_world_record(sport_name: str, new_record: float, db: Session = Depends(write_db)):
+    if not await run_in_session(db, crud.update_world_record, sport_name=sport_name, new_record=new_record):
         raise HTTPException(status_code=404, detail="Sport not found")
     return {"detail": "World record updated successfully"}
 
 # GROUP BY example: Count sports by unit
-@router.get("/grouped_by_unit", response_model=list[dict])
-def group_sports_by_unit(db: Session = Depends(get_db)):
-    return crud.group_sports_by_unit(db=db)
+@router.get("/grouped_by_unit", response_model=list[dict], dependencies=[Depends(etag.conditional("sports"))])
+async def group_sports_by_unit(db: Session = Depends(read_db)):
+    return await run_in_session(db, crud.group_sports_by_unit)
 
 # Get sorted sports
-@router.get("/sorted", response_model=list[schemas.Sport])
-def get_sorted_sports(
+@router.get("/sorted", response_model=list[schemas.Sport], dependencies=[Depends(etag.conditional("sports", includes=includes.TABLES))])
+async def get_sorted_sports(
+    response: Response,
     order_by: str = "name",
     descending: bool = False,
-    skip: int = 0,
-    limit: int = 100,
-    db: Session = Depends(get_db),
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=pagination.MAX_LIMIT),
+    cursor: str = None,
+    include: str = None,
+    db: Session = Depends(read_db),
 ):
-    return crud.get_sorted_sports(
-        db=db,
-        order_by=order_by,
-        descending=descending,
-        skip=skip,
-        limit=limit,
-    )
+    try:
+        expand = includes.parse_include(include, "sports")
+        page = await run_in_session(
+            db,
+            crud.get_sorted_sports,
+            order_by=order_by,
+            descending=descending,
+            skip=skip,
+            limit=limit,
+            cursor=cursor,
+            options=includes.options("sports", expand),
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    pagination.set_next_cursor(response, page)
+    if expand:
+        return fastjson.json_response(response, includes.dump_all(page, "sports", expand))
+    return page
+
+# Top athletes of a sport from the leaderboard
+@router.get("/{sport_id}/leaderboard", response_model=list[dict], dependencies=[Depends(etag.conditional("sports", "athletes", "results", "leaderboard"))])
+async def read_leaderboard(sport_id: int, limit: int = Query(10, ge=1, le=1000), offset: int = Query(0, ge=0), db: Session = Depends(read_db)):
+    entries = await run_in_session(db, leaderboard.top, sport_id=sport_id, limit=limit, offset=offset)
+    if entries is None:
+        raise HTTPException(status_code=404, detail="Sport not found")
+    return entries
+
+# Record changes of a sport, newest first
+@router.get("/{sport_id}/records", response_model=list[dict], dependencies=[Depends(etag.conditional("sports"))])
+async def read_record_history(sport_id: int, record: str = Query(None, pattern="^(world|olympic)_record$"), limit: int = Query(100, ge=1, le=1000), db: Session = Depends(read_db)):
+    entries = await run_in_session(db, records.record_history, sport_id=sport_id, record=record, limit=limit)
+    if entries is None:
+        raise HTTPException(status_code=404, detail="Sport not found")
+    return entries
+
+# Get many sports by ID in one query: found sports in request order and the missing ids
+@router.get("", response_model=dict, dependencies=[Depends(etag.conditional("sports"))])
+async def read_sports_by_ids(response: Response, ids: list[str] = Query(..., description="Comma separated ids, up to batch.MAX_IDS"), loaders: Loaders = Depends(get_loaders)):
+    try:
+        ids = batch.parse_ids(ids)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    rows = await loaders.sports.load_many(ids)
+    return fastjson.json_response(response, batch.multi_get_body(ids, rows))
+
+# Get a single sport by ID
+@router.get("/{sport_id}", response_model=schemas.Sport, dependencies=[Depends(etag.conditional("sports", includes=includes.TABLES))])
+async def read_sport(response: Response, sport_id: int, include: str = None, db: Session = Depends(read_db)):
+    try:
+        expand = includes.parse_include(include, "sports")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    db_sport = await run_in_session(db, crud.get_sport, sport_id=sport_id, options=includes.options("sports", expand))
+    if not db_sport:
+        raise HTTPException(status_code=404, detail="Sport not found")
+    if expand:
+        return fastjson.json_response(response, includes.dump(db_sport, "sports", expand))
+    return db_sport
+
+# Update an existing sport
+@router.put("/{sport_id}", response_model=schemas.Sport)
+async def update_sport(sport_id: int, sport: schemas.SportCreate, db: Session = Depends(write_db)):
+    db_sport = await run_in_session(db, crud.update_sport, sport_id=sport_id, sport=sport)
+    if not db_sport:
+        raise HTTPException(status_code=404, detail="Sport not found")
+    return db_sport
+
+# Delete a sport
+@router.delete("/{sport_id}", status_code=204)
+async def delete_sport(sport_id: int, db: Session = Depends(write_db)):
+    if not await run_in_session(db, crud.delete_sport, sport_id=sport_id):
+        raise HTTPException(status_code=404, detail="Sport not found")
+    return {"detail": "Sport deleted successfully"}
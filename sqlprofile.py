@@ -0,0 +1,200 @@
+import contextvars
+import logging
+import os
+import random
+import threading
+import time
+from collections import Counter as StatementCounter
+from sqlalchemy import event
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Per-request SQL profiling.
+#
+# SQLProfileMiddleware opens a RequestProfile for a sample of requests and keeps
+# it in a context variable; the cursor hooks installed by profile_engine() add
+# every statement executed while it is active (threadpool routes and the async
+# engine's greenlets both inherit the context). Unsampled requests cost one
+# context variable lookup per statement.
+#
+# Sampled responses get a Server-Timing header, repeated identical statements are
+# flagged as likely N+1 patterns, and per-route aggregates are served at
+# /debug/sql-stats and exported on /metrics.
+
+SQL_PROFILE_SAMPLE_RATE = float(os.getenv("SQL_PROFILE_SAMPLE_RATE", "0.1"))
+# A request header that forces profiling, e.g. `X-SQL-Profile: 1`; empty disables forcing
+SQL_PROFILE_FORCE_HEADER = os.getenv("SQL_PROFILE_FORCE_HEADER", "x-sql-profile").lower()
+# The same statement this many times in one request is reported as N+1
+SQL_PROFILE_REPEAT_THRESHOLD = int(os.getenv("SQL_PROFILE_REPEAT_THRESHOLD", "5"))
+SQL_PROFILE_SERVER_TIMING = os.getenv("SQL_PROFILE_SERVER_TIMING", "1") == "1"
+
+SQL_STATEMENTS = metrics.Histogram(
+    "sql_request_statements", "SQL statements per profiled request",
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500, 1000),
+)
+SQL_SECONDS = metrics.Histogram("sql_request_seconds", "Total SQL time per profiled request")
+SQL_N_PLUS_ONE = metrics.Counter("sql_n_plus_one_total", "Profiled requests with repeated identical statements")
+
+_current = contextvars.ContextVar("sql_profile", default=None)
+
+# Keep reported statements readable
+MAX_STATEMENT_LENGTH = 300
+
+
+def _shorten(statement: str):
+    statement = " ".join(statement.split())
+    return statement if len(statement) <= MAX_STATEMENT_LENGTH else statement[:MAX_STATEMENT_LENGTH] + "..."
+
+
+class RequestProfile:
+    """Statements executed while handling one request."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.slowest = (0.0, None)
+        self.statements = StatementCounter()
+
+    def record(self, statement: str, elapsed: float):
+        self.count += 1
+        self.total += elapsed
+        self.statements[statement] += 1
+        if elapsed > self.slowest[0]:
+            self.slowest = (elapsed, statement)
+
+    # The most repeated statement and its count, if it crosses the N+1 threshold
+    def repeated(self):
+        if not self.statements:
+            return None
+        statement, count = self.statements.most_common(1)[0]
+        return (statement, count) if count >= SQL_PROFILE_REPEAT_THRESHOLD else None
+
+    def server_timing(self):
+        parts = [f'db;desc="{self.count} statements";dur={self.total * 1000:.2f}']
+        if self.slowest[1] is not None:
+            parts.append(f"db-slowest;dur={self.slowest[0] * 1000:.2f}")
+        repeated = self.repeated()
+        if repeated:
+            parts.append(f'db-repeated;desc="{repeated[1]}x same statement"')
+        return ", ".join(parts)
+
+
+class RouteStats:
+    """Aggregates for one route, beyond what the histograms carry."""
+
+    def __init__(self):
+        self.requests = 0
+        self.max_statements = 0
+        self.max_seconds = 0.0
+        self.slowest = (0.0, None)
+        self.n_plus_one = 0
+        self.repeated = None
+
+
+_lock = threading.Lock()
+ROUTE_STATS = {}
+
+
+def _hist_summary(histogram, route: str):
+    counts, (count, total) = histogram.series.get((("route", route),), ([0] * len(histogram.buckets), [0, 0.0]))
+    buckets = {str(bound): bucket for bound, bucket in zip(histogram.buckets, counts)}
+    return {"count": count, "sum": round(total, 6), "mean": round(total / count, 6) if count else None, "buckets": buckets}
+
+def _finish(route: str, profile: RequestProfile):
+    SQL_STATEMENTS.observe(profile.count, route=route)
+    SQL_SECONDS.observe(profile.total, route=route)
+    repeated = profile.repeated()
+    with _lock:
+        stats = ROUTE_STATS.setdefault(route, RouteStats())
+        stats.requests += 1
+        stats.max_statements = max(stats.max_statements, profile.count)
+        stats.max_seconds = max(stats.max_seconds, profile.total)
+        if profile.slowest[0] > stats.slowest[0]:
+            stats.slowest = (profile.slowest[0], _shorten(profile.slowest[1]))
+        if repeated:
+            stats.n_plus_one += 1
+            stats.repeated = {"count": repeated[1], "sql": _shorten(repeated[0])}
+    if repeated:
+        SQL_N_PLUS_ONE.inc(route=route)
+        logger.warning("Likely N+1 on %s: %dx %s", route, repeated[1], _shorten(repeated[0]))
+
+# Per-route aggregates for /debug/sql-stats
+def snapshot():
+    result = {}
+    with _lock:
+        for route, stats in sorted(ROUTE_STATS.items()):
+            result[route] = {
+                "requests": stats.requests,
+                "statements": _hist_summary(SQL_STATEMENTS, route),
+                "seconds": _hist_summary(SQL_SECONDS, route),
+                "max_statements": stats.max_statements,
+                "max_seconds": round(stats.max_seconds, 6),
+                "slowest_statement": {"seconds": round(stats.slowest[0], 6), "sql": stats.slowest[1]} if stats.slowest[1] else None,
+                "n_plus_one_requests": stats.n_plus_one,
+                "last_repeated": stats.repeated,
+            }
+    return {"sample_rate": SQL_PROFILE_SAMPLE_RATE, "repeat_threshold": SQL_PROFILE_REPEAT_THRESHOLD, "routes": result}
+
+
+# Install the cursor hooks on an engine (for async engines pass engine.sync_engine).
+# The start time lives on the statement's execution context, so a statement that
+# fails, and never reaches after_cursor_execute, leaves nothing behind.
+def profile_engine(engine):
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if context is not None and _current.get() is not None:
+            context.sql_profile_start = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        profile = _current.get()
+        started = getattr(context, "sql_profile_start", None)
+        if profile is not None and started is not None:
+            profile.record(statement, time.perf_counter() - started)
+
+
+# Route template for grouping, e.g. /sports/{sport_id}. Routes of a router included
+# with a prefix may only carry their own part, so the prefix is taken from the path.
+def _route_name(scope):
+    template = getattr(scope.get("route"), "path", None)
+    if template is None:
+        return "unmatched"
+    segments = scope.get("path", "").split("/")
+    prefix = "/".join(segments[: len(segments) - len(template.split("/")) + 1])
+    return prefix + template
+
+
+class SQLProfileMiddleware:
+    """ASGI middleware that profiles a sample of HTTP requests."""
+
+    def __init__(self, app, sample_rate: float = SQL_PROFILE_SAMPLE_RATE):
+        self.app = app
+        self.sample_rate = sample_rate
+        self.force_header = SQL_PROFILE_FORCE_HEADER.encode()
+
+    def _sampled(self, scope):
+        if self.force_header and any(name == self.force_header for name, _ in scope.get("headers", ())):
+            return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self._sampled(scope):
+            await self.app(scope, receive, send)
+            return
+
+        profile = RequestProfile()
+        token = _current.set(profile)
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start" and SQL_PROFILE_SERVER_TIMING:
+                headers = list(message.get("headers", ()))
+                headers.append((b"server-timing", profile.server_timing().encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
+            _finish(_route_name(scope), profile)
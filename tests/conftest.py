@@ -0,0 +1,47 @@
+import os
+import sys
+import tempfile
+import pytest
+
+# The modules live at the repository root and in app/, imported by bare name
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "app")]
+
+# A throwaway SQLite database, set before database.py builds its engines
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "test.db")
+os.environ.setdefault("SQL_PROFILE_SAMPLE_RATE", "0")
+# Tables are created per test by the db fixture, not on import of main.py
+os.environ["SCHEMA_MODE"] = "none"
+
+
+# A session on freshly created tables, with an empty cache
+@pytest.fixture
+def db():
+    from database import Base, SessionLocal, engine
+    import cache
+
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    cache.backend = cache.make_backend()
+    session = SessionLocal()
+    yield session
+    session.close()
+
+# A client for the application, on the db fixture's tables
+@pytest.fixture
+def client(db):
+    from fastapi.testclient import TestClient
+    import main
+
+    return TestClient(main.app)
+
+# Two sports and five athletes to attach results to, as (sports, athletes)
+@pytest.fixture
+def seeded(db):
+    from models import Sport, Athlete
+
+    sports = [Sport(name="100m", unit="seconds"), Sport(name="Long jump", unit="meters")]
+    athletes = [Athlete(full_name=f"Athlete {i}", country="Nowhere", birth_year=1990 + i) for i in range(5)]
+    db.add_all(sports + athletes)
+    db.commit()
+    return sports, athletes
@@ -0,0 +1,78 @@
+import asyncio
+import httpx
+import pytest
+from admission import AdmissionMiddleware, ClassLimit, route_class
+
+# Admission control (admission.py): requests past a class's concurrency wait in its
+# queue, and are shed with 503 and Retry-After when the queue is full or their wait
+# passes the class deadline.
+
+
+# An app whose first request holds its admission slot until the test releases it
+class BlockingApp:
+    def __init__(self):
+        self.started = asyncio.Event()
+        self.release = asyncio.Event()
+
+    async def __call__(self, scope, receive, send):
+        if not self.started.is_set():
+            self.started.set()
+            await self.release.wait()
+        await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"text/plain")]})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+def _limits(queue: int, timeout: float):
+    return {name: ClassLimit(1, queue, timeout) for name in ("read", "write", "heavy")}
+
+# Responses to `second` sent while `first` holds the only slot
+async def _while_busy(limits, first: str, second: str, capacity: int = 1):
+    app = BlockingApp()
+    transport = httpx.ASGITransport(app=AdmissionMiddleware(app, capacity=capacity, limits=limits))
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        running = asyncio.create_task(client.get(first))
+        await app.started.wait()
+        shed = await client.get(second)
+        app.release.set()
+        return await running, shed
+
+def _assert_shed(response):
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "1"
+    assert response.json() == {"detail": "Server is busy, retry later"}
+
+
+def test_queue_full_is_shed():
+    running, shed = asyncio.run(_while_busy(_limits(queue=0, timeout=5), "/results/1", "/results/2"))
+    assert running.status_code == 200
+    _assert_shed(shed)
+
+
+def test_queue_deadline_is_shed():
+    running, shed = asyncio.run(_while_busy(_limits(queue=1, timeout=0.05), "/results/1", "/results/2"))
+    assert running.status_code == 200
+    _assert_shed(shed)
+
+
+def test_classes_are_limited_separately():
+    # Enough worker capacity for both, and each class has its own slot
+    running, other = asyncio.run(_while_busy(_limits(queue=0, timeout=5), "/search?q=x", "/results/1", capacity=2))
+    assert running.status_code == 200
+    assert other.status_code == 200
+
+
+def test_exempt_routes_skip_admission():
+    _, exempt = asyncio.run(_while_busy(_limits(queue=0, timeout=5), "/results/1", "/metrics"))
+    assert exempt.status_code == 200
+
+
+@pytest.mark.parametrize("method, path, expected", [
+    ("GET", "/results/1", "read"),
+    ("PUT", "/results/1", "write"),
+    ("POST", "/results/bulk", "heavy"),
+    ("GET", "/sports/grouped_by_unit", "heavy"),
+    ("GET", "/analytics/percentiles", "heavy"),
+    ("GET", "/jobs/1", None),
+    ("GET", "/metrics", None),
+])
+def test_route_class(method, path, expected):
+    assert route_class(method, path) == expected
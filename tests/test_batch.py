@@ -0,0 +1,28 @@
+import pytest
+import batch
+
+# Multi-get routes (batch.py): one query per request, items in request order (repeated
+# ids once) and the ids that were not found listed separately.
+
+
+def test_items_in_request_order_with_missing_ids(client, seeded):
+    _, athletes = seeded
+    ids = [athletes[3].id, 999999, athletes[0].id, athletes[3].id, 888888]
+    response = client.get("/athletes", params={"ids": ",".join(map(str, ids))})
+    assert response.status_code == 200
+    body = response.json()
+    assert [item["id"] for item in body["items"]] == [athletes[3].id, athletes[0].id]
+    assert body["items"][0]["full_name"] == "Athlete 3"
+    assert body["missing"] == [999999, 888888]
+
+
+def test_repeated_ids_parameter(client, seeded):
+    sports, _ = seeded
+    response = client.get(f"/sports?ids={sports[1].id}&ids={sports[0].id}")
+    assert [item["name"] for item in response.json()["items"]] == ["Long jump", "100m"]
+
+
+@pytest.mark.parametrize("ids", ["1,x", "1,2,3,4"])
+def test_bad_ids(client, seeded, monkeypatch, ids):
+    monkeypatch.setattr(batch, "MAX_IDS", 3)
+    assert client.get("/results", params={"ids": ids}).status_code == 400
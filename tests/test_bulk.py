@@ -0,0 +1,56 @@
+import json
+from sqlalchemy import func, select
+from models import Result
+
+# Bulk ingestion (bulk.py): bad rows are reported by line number and skipped, the
+# rest of the body still lands.
+
+
+def _row(sport, athlete, performance: float):
+    return {
+        "competition_name": "Diamond League",
+        "performance": performance,
+        "event_date": "2020-01-01",
+        "location": "Somewhere",
+        "sport_id": sport.id,
+        "athlete_id": athlete.id,
+    }
+
+def _count(db):
+    return db.scalar(select(func.count()).select_from(Result))
+
+
+def test_ndjson_reports_failed_lines_and_loads_the_rest(client, db, seeded):
+    sports, athletes = seeded
+    bad_schema = {**_row(sports[0], athletes[0], 1.0), "performance": "fast"}
+    body = "\n".join([
+        json.dumps(_row(sports[0], athletes[0], 10.1)),
+        "{not json",
+        json.dumps(bad_schema),
+        "",
+        json.dumps(_row(sports[1], athletes[1], 7.5)),
+    ])
+    response = client.post("/results/bulk", content=body, headers={"content-type": "application/x-ndjson"})
+    assert response.status_code == 200
+    report = response.json()
+    assert (report["inserted"], report["failed"]) == (2, 2)
+    assert [error["line"] for error in report["errors"]] == [2, 3]
+    assert _count(db) == 2
+
+
+def test_csv_quoted_newline_and_stray_quote(client, db, seeded):
+    sports, athletes = seeded
+    sport, athlete = sports[0].id, athletes[0].id
+    body = "\n".join([
+        "competition_name,performance,event_date,location,sport_id,athlete_id",
+        f'"Meet, with\nnewline",10.1,2020-01-01,Somewhere,{sport},{athlete}',
+        f'"Stray quote,10.2,2020-01-01,Somewhere,{sport},{athlete}',
+        f"Meet,10.3,2020-01-01,Somewhere,{sport},{athlete}",
+        f"Meet,not a number,2020-01-01,Somewhere,{sport},{athlete}",
+    ])
+    response = client.post("/results/bulk", content=body, headers={"content-type": "text/csv"})
+    report = response.json()
+    # The stray quote on line 4 costs only its own row; scanning resumes on the next line
+    assert (report["inserted"], report["failed"]) == (2, 2)
+    assert [error["line"] for error in report["errors"]] == [4, 6]
+    assert sorted(db.scalars(select(Result.competition_name))) == ["Meet", "Meet, with\nnewline"]
@@ -0,0 +1,66 @@
+import json
+from sqlalchemy import insert
+import cache
+from models import Sport
+
+# Aggregate cache (cache.py): entries are keyed by table versions, which ORM commits
+# and mark_changed bump, so a write is visible on the next read without any TTL wait.
+
+
+def _units(client):
+    response = client.get("/sports/grouped_by_unit")
+    assert response.status_code == 200
+    return {row["unit"]: row["count"] for row in response.json()}
+
+
+def test_orm_commit_invalidates(client, db, seeded):
+    assert _units(client) == {"seconds": 1, "meters": 1}
+    # A Core insert that nobody marks as a change is not seen: the entry is served from cache
+    db.execute(insert(Sport), [{"name": "200m", "unit": "seconds"}])
+    db.commit()
+    assert _units(client) == {"seconds": 1, "meters": 1}
+    db.add(Sport(name="High jump", unit="meters"))
+    db.commit()
+    assert _units(client) == {"seconds": 2, "meters": 2}
+
+
+def test_mark_changed_invalidates_core_writes(client, db, seeded):
+    assert _units(client) == {"seconds": 1, "meters": 1}
+    db.execute(insert(Sport), [{"name": "200m", "unit": "seconds"}])
+    cache.mark_changed(db, "sports")
+    db.commit()
+    assert _units(client) == {"seconds": 2, "meters": 1}
+
+
+def test_rollback_does_not_invalidate(client, db, seeded):
+    version = cache.tagged_versions(["sports"])[1]
+    db.add(Sport(name="High jump", unit="meters"))
+    db.flush()
+    db.rollback()
+    assert cache.tagged_versions(["sports"])[1] == version
+
+
+def test_bulk_load_invalidates_results(client, db, seeded):
+    sports, athletes = seeded
+    assert client.get("/results/grouped_by_sport").json() == []
+    row = {
+        "competition_name": "Diamond League",
+        "performance": 10.0,
+        "event_date": "2020-01-01",
+        "location": "Somewhere",
+        "sport_id": sports[0].id,
+        "athlete_id": athletes[0].id,
+    }
+    client.post("/results/bulk", content=json.dumps(row), headers={"content-type": "application/x-ndjson"})
+    assert client.get("/results/grouped_by_sport").json() == [{"name": "100m", "result_count": 1}]
+
+
+def test_unsettled_tables_are_not_cached(client, db, seeded, monkeypatch):
+    monkeypatch.setattr(cache, "CACHE_VERSION_SETTLE_SECONDS", 60)
+    db.add(Sport(name="High jump", unit="meters"))
+    db.commit()
+    assert _units(client) == {"seconds": 1, "meters": 2}
+    # Within the settle window every read queries again, as a replica may still lag
+    db.execute(insert(Sport), [{"name": "200m", "unit": "seconds"}])
+    db.commit()
+    assert _units(client) == {"seconds": 2, "meters": 2}
@@ -0,0 +1,67 @@
+from datetime import date
+import pytest
+import cache
+from models import Result
+
+# Conditional GETs (etag.py): a matching If-None-Match gets a 304 until a write to one
+# of the route's tables bumps its version, and no ETag is sent while that is unsettled.
+
+
+@pytest.fixture
+def result(db, seeded):
+    sports, athletes = seeded
+    row = Result(
+        competition_name="Diamond League",
+        performance=10.0,
+        event_date=date(2020, 1, 1),
+        location="Somewhere",
+        sport_id=sports[0].id,
+        athlete_id=athletes[0].id,
+    )
+    db.add(row)
+    db.commit()
+    return row
+
+def _update(client, result, performance: float):
+    body = {
+        "competition_name": result.competition_name,
+        "performance": performance,
+        "event_date": "2020-01-01",
+        "location": result.location,
+        "sport_id": result.sport_id,
+        "athlete_id": result.athlete_id,
+    }
+    assert client.put(f"/results/{result.id}", json=body).status_code == 200
+
+
+def test_not_modified_until_put(client, result):
+    first = client.get(f"/results/{result.id}")
+    tag = first.headers["etag"]
+    response = client.get(f"/results/{result.id}", headers={"If-None-Match": tag})
+    assert response.status_code == 304
+    assert response.headers["etag"] == tag
+
+    _update(client, result, 9.5)
+    response = client.get(f"/results/{result.id}", headers={"If-None-Match": tag})
+    assert response.status_code == 200
+    assert response.json()["performance"] == 9.5
+    assert response.headers["etag"] != tag
+
+
+def test_etag_depends_on_query(client, result):
+    plain = client.get(f"/results/{result.id}").headers["etag"]
+    included = client.get(f"/results/{result.id}", params={"include": "athlete"})
+    assert included.headers["etag"] != plain
+    # Writes to an included table change the tag only for requests that include it
+    client.delete(f"/athletes/{result.athlete_id + 1}")
+    assert client.get(f"/results/{result.id}").headers["etag"] == plain
+    assert client.get(f"/results/{result.id}", params={"include": "athlete"}).headers["etag"] != included.headers["etag"]
+
+
+def test_no_etag_while_unsettled(client, result, monkeypatch):
+    monkeypatch.setattr(cache, "CACHE_VERSION_SETTLE_SECONDS", 60)
+    tag = client.get(f"/results/{result.id}").headers["etag"]
+    _update(client, result, 9.5)
+    response = client.get(f"/results/{result.id}", headers={"If-None-Match": tag})
+    assert response.status_code == 200
+    assert "etag" not in response.headers
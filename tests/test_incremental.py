@@ -0,0 +1,85 @@
+import random
+from datetime import date, timedelta
+from sqlalchemy import select
+from models import Sport, Athlete, Result, LeaderboardEntry, AthleteStats, AthleteSportStats
+import athlete_stats
+import leaderboard
+import records
+
+# The leaderboard, athlete statistics and records are maintained incrementally by
+# after_flush hooks; after any mix of ORM writes they must equal a full rebuild.
+
+
+def _rows(db, table):
+    return sorted(
+        tuple(round(value, 6) if isinstance(value, float) else value for value in row)
+        for row in db.execute(select(table)).all()
+    )
+
+def _state(db):
+    return {
+        "leaderboard": _rows(db, LeaderboardEntry.__table__),
+        "athlete_stats": _rows(db, AthleteStats.__table__),
+        "athlete_sport_stats": _rows(db, AthleteSportStats.__table__),
+        "records": _rows(db, select(Sport.id, Sport.world_record, Sport.olympic_record).subquery()),
+    }
+
+def _rebuilt(db):
+    conn = db.connection()
+    leaderboard.rebuild(conn)
+    athlete_stats.rebuild(conn)
+    records.recompute(conn)
+    state = _state(db)
+    db.rollback()
+    return state
+
+def _result(rng, sport_ids, athlete_ids):
+    return Result(
+        competition_name=rng.choice(["Olympic Games", "World Championships", "Diamond League"]),
+        performance=round(rng.uniform(9, 60), 2),
+        event_date=date(2000, 1, 1) + timedelta(days=rng.randrange(8000)),
+        location="Somewhere",
+        sport_id=rng.choice(sport_ids),
+        athlete_id=rng.choice(athlete_ids),
+    )
+
+
+def test_incremental_maintenance_matches_rebuild(db):
+    rng = random.Random(7)
+    sports = [Sport(name="100m", unit="seconds"), Sport(name="Long jump", unit="meters"), Sport(name="Shot put", unit="meters")]
+    athletes = [Athlete(full_name=f"Athlete {i}", country="Nowhere", birth_year=1990 + i) for i in range(6)]
+    db.add_all(sports + athletes)
+    db.commit()
+    sport_ids = [sport.id for sport in sports]
+    athlete_ids = [athlete.id for athlete in athletes]
+
+    # Inserts, several per flush and across commits
+    for _ in range(5):
+        db.add_all([_result(rng, sport_ids, athlete_ids) for _ in range(12)])
+        db.commit()
+    assert _state(db) == _rebuilt(db)
+
+    # Updates that move results between athletes and sports and change performances
+    results = db.execute(select(Result)).scalars().all()
+    for result in rng.sample(results, 15):
+        result.performance = round(rng.uniform(9, 60), 2)
+        if rng.random() < 0.5:
+            result.athlete_id = rng.choice(athlete_ids)
+        if rng.random() < 0.3:
+            result.sport_id = rng.choice(sport_ids)
+        db.commit()
+    assert _state(db) == _rebuilt(db)
+
+    # Deletes, including every result of one athlete
+    for result in rng.sample(results, 10):
+        db.delete(result)
+    db.commit()
+    for result in db.execute(select(Result).where(Result.athlete_id == athlete_ids[0])).scalars():
+        db.delete(result)
+    db.commit()
+    assert _state(db) == _rebuilt(db)
+
+    # A unit change flips the direction of "best" for a whole sport
+    sports[1].unit = "seconds"
+    db.commit()
+    assert _state(db) == _rebuilt(db)
@@ -0,0 +1,69 @@
+from datetime import date
+import pytest
+from models import Result
+
+# Keyset pagination (pagination.py): following X-Next-Cursor must visit every row
+# exactly once, in (sort column, id) order, including across ties in the sort column.
+
+
+@pytest.fixture
+def results(db, seeded):
+    sports, athletes = seeded
+    # Few distinct values, so most pages start and end inside a run of ties
+    rows = [
+        Result(
+            competition_name=f"Meet {i}",
+            performance=float(i % 4),
+            event_date=date(2020, 1, 1 + i % 3),
+            location="Somewhere",
+            sport_id=sports[i % 2].id,
+            athlete_id=athletes[i % 5].id,
+        )
+        for i in range(23)
+    ]
+    db.add_all(rows)
+    db.commit()
+    return rows
+
+def _walk(client, params):
+    ids, cursor = [], None
+    for _ in range(100):
+        response = client.get("/results/sorted", params={**params, **({"cursor": cursor} if cursor else {})})
+        assert response.status_code == 200
+        ids += [row["id"] for row in response.json()]
+        cursor = response.headers.get("x-next-cursor")
+        if cursor is None:
+            return ids
+    raise AssertionError("cursor never ran out")
+
+
+@pytest.mark.parametrize("order_by, key", [
+    ("performance", lambda row: row.performance),
+    ("event_date", lambda row: row.event_date),
+])
+@pytest.mark.parametrize("descending", [False, True])
+@pytest.mark.parametrize("limit", [1, 4, 5])
+def test_cursor_walk_visits_every_row_once_in_order(client, results, order_by, key, descending, limit):
+    ids = _walk(client, {"order_by": order_by, "descending": descending, "limit": limit})
+    expected = sorted(results, key=lambda row: (key(row), row.id), reverse=descending)
+    assert ids == [row.id for row in expected]
+
+
+def test_last_full_page_cursor_returns_an_empty_page(client, results):
+    response = client.get("/results/sorted", params={"order_by": "performance", "limit": len(results)})
+    assert len(response.json()) == len(results)
+    cursor = response.headers["x-next-cursor"]
+    response = client.get("/results/sorted", params={"order_by": "performance", "limit": len(results), "cursor": cursor})
+    assert response.json() == []
+    assert "x-next-cursor" not in response.headers
+
+
+def test_cursor_from_another_sort_is_rejected(client, results):
+    cursor = client.get("/results/sorted", params={"order_by": "performance", "limit": 2}).headers["x-next-cursor"]
+    response = client.get("/results/sorted", params={"order_by": "event_date", "limit": 2, "cursor": cursor})
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize("limit", [0, 1001])
+def test_limit_out_of_range(client, results, limit):
+    assert client.get("/results/sorted", params={"limit": limit}).status_code == 422
@@ -0,0 +1,69 @@
+import itertools
+from datetime import date
+import os
+import tempfile
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+import database
+from database import Base
+from models import Result
+
+# Read replica routing (database.py): reads go to a replica unless the client wrote
+# within READ_YOUR_WRITES_SECONDS, which a committed write records in a cookie. The
+# replica here is a second SQLite file that never receives the primary's writes.
+
+
+@pytest.fixture
+def replica(db, monkeypatch):
+    engine = create_engine("sqlite:///" + os.path.join(tempfile.mkdtemp(), "replica.db"))
+    Base.metadata.create_all(bind=engine)
+    sessions = [sessionmaker(autocommit=False, autoflush=False, bind=engine)]
+    monkeypatch.setattr(database, "ReplicaSessions", sessions)
+    monkeypatch.setattr(database, "_replica_sessions", itertools.cycle(sessions))
+    yield engine
+    engine.dispose()
+
+def _body(sport, athlete):
+    return {
+        "competition_name": "Diamond League",
+        "performance": 10.0,
+        "event_date": "2020-01-01",
+        "location": "Somewhere",
+        "sport_id": sport.id,
+        "athlete_id": athlete.id,
+    }
+
+
+def test_reads_go_to_the_replica(client, db, seeded, replica):
+    sports, athletes = seeded
+    result = Result(**{**_body(sports[0], athletes[0]), "event_date": date(2020, 1, 1)})
+    db.add(result)
+    db.commit()
+    # Only on the primary, so a read served by the replica does not find it
+    assert client.get(f"/results/{result.id}").status_code == 404
+
+
+def test_committed_write_pins_the_client_to_the_primary(client, seeded, replica):
+    sports, athletes = seeded
+    response = client.post("/results/", json=_body(sports[0], athletes[0]))
+    assert response.status_code == 200
+    assert database.PRIMARY_PIN_COOKIE in response.cookies
+    result_id = response.json()["id"]
+    assert client.get(f"/results/{result_id}").status_code == 200
+    # Another client has not written, so it still reads the replica
+    client.cookies.clear()
+    assert client.get(f"/results/{result_id}").status_code == 404
+
+
+def test_failed_write_does_not_pin(client, seeded, replica):
+    response = client.delete("/results/999999")
+    assert response.status_code == 404
+    assert database.PRIMARY_PIN_COOKIE not in response.cookies
+
+
+def test_expired_pin_reads_the_replica(client, db, seeded, replica):
+    sports, athletes = seeded
+    result_id = client.post("/results/", json=_body(sports[0], athletes[0])).json()["id"]
+    client.cookies.set(database.PRIMARY_PIN_COOKIE, "1")
+    assert client.get(f"/results/{result_id}").status_code == 404